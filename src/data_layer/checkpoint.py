@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+class IngestionCheckpoint:
+    """
+    Watermark di ingestione persistiti, per fonte.
+
+    Per ogni fonte (files, voice, sensor, app, profile) conserva un dizionario
+    chiave -> watermark: l'hash dei file già elaborati, l'ultimo timestamp delle
+    espressioni vocali e delle letture per serie, l'hash delle voci delle app e
+    del profilo. I loader registrano i nuovi watermark con stage(); vengono resi
+    effettivi e scritti su disco solo con commit(), dopo che i dati sono stati
+    salvati nel grafo, così che un'interruzione porti a rielaborare (in modo
+    idempotente) e mai a perdere dati.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: File JSON del checkpoint; se None il checkpoint resta in memoria
+        """
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self._staged: Dict[str, Dict[str, Any]] = {}
+        # Più thread di ingestione possono registrare watermark sullo stesso checkpoint
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self.state = json.load(f)
+
+    def get(self, source: str, key: str, default: Any = None) -> Any:
+        """
+        Restituisce il watermark registrato (già reso effettivo) per una chiave
+
+        Args:
+            source: Fonte (es. "sensor")
+            key: Chiave all'interno della fonte (es. "smartwatch/heart_rate")
+            default: Valore restituito se la chiave non ha watermark
+
+        Returns:
+            Watermark o default
+        """
+        with self._lock:
+            return self.state.get(source, {}).get(key, default)
+
+    def stage(self, source: str, key: str, value: Any):
+        """
+        Registra un nuovo watermark, reso effettivo al prossimo commit
+
+        Args:
+            source: Fonte
+            key: Chiave all'interno della fonte
+            value: Nuovo watermark (serializzabile in JSON)
+        """
+        with self._lock:
+            self._staged.setdefault(source, {})[key] = value
+
+    def file_changed(self, file_path: str) -> bool:
+        """
+        Verifica se un file è cambiato dall'ultima ingestione e, in tal caso,
+        registra il nuovo hash
+
+        Args:
+            file_path: Percorso del file
+
+        Returns:
+            True se il file è nuovo o modificato
+        """
+        key = os.path.abspath(file_path)
+        digest = file_digest(file_path)
+        if self.get("files", key) == digest:
+            return False
+        self.stage("files", key, digest)
+        return True
+
+    @property
+    def has_staged(self) -> bool:
+        """True se ci sono watermark in attesa di commit."""
+        with self._lock:
+            return any(self._staged.values())
+
+    def commit(self):
+        """Rende effettivi i watermark registrati e salva il checkpoint in modo atomico."""
+        with self._lock:
+            for source, values in self._staged.items():
+                self.state.setdefault(source, {}).update(values)
+            self._staged = {}
+
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temporary = f"{self.path}.tmp"
+                with open(temporary, "w") as f:
+                    json.dump(self.state, f, indent=2, sort_keys=True)
+                os.replace(temporary, self.path)
+
+    def discard(self):
+        """Scarta i watermark registrati e non ancora resi effettivi."""
+        with self._lock:
+            self._staged = {}
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Hash SHA-256 del contenuto di un file, letto a blocchi
+
+    Args:
+        file_path: Percorso del file
+
+    Returns:
+        Hash esadecimale
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_digest(value: Any) -> str:
+    """
+    Hash SHA-256 di un valore serializzabile in JSON, indipendente dall'ordine delle chiavi
+
+    Args:
+        value: Valore da confrontare tra un'ingestione e la successiva
+
+    Returns:
+        Hash esadecimale
+    """
+    payload = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -3,7 +3,8 @@ from data_layer.unstructured.voice_processor import VoiceProcessor
 from data_layer.unstructured.profile_processor import ProfileProcessor
 from data_layer.structured.digital_twin import DigitalTwin
 from data_layer.structured.app_data import AppDataProcessor
-from typing import Dict, Any
+from data_layer.checkpoint import IngestionCheckpoint
+from typing import Dict, Any, Optional
 
 
 class DataManager:
@@ -18,12 +19,15 @@ class DataManager:
         self.digital_twin = DigitalTwin()
         self.app_data_processor = AppDataProcessor()
 
-    def load_voice_data(self, file_path: str = None) -> str:
+    def load_voice_data(
+        self, file_path: str = None, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> str:
         """
         Carica e pre-elabora dati di trascrizione vocale
 
         Args:
             file_path: Percorso opzionale al file dati vocali
+            checkpoint: Checkpoint di ingestione: se indicato, solo le espressioni nuove
 
         Returns:
             Testo vocale elaborato
@@ -31,44 +35,53 @@ class DataManager:
         if file_path is None:
             file_path = self.config.get_value("data_sources.voice.path")
 
-        return self.voice_processor.load_and_process(file_path)
+        return self.voice_processor.load_and_process(file_path, checkpoint)
 
-    def load_profile_data(self, file_path: str = None) -> Dict[str, Any]:
+    def load_profile_data(
+        self, file_path: str = None, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Carica dati profilo utente
 
         Args:
             file_path: Percorso opzionale al file dati profilo
+            checkpoint: Checkpoint di ingestione: se indicato, None se il profilo non è cambiato
 
         Returns:
-            Dati profilo utente
+            Dati profilo utente, o None se invariato
         """
         if file_path is None:
             file_path = self.config.get_value("data_sources.profile.path")
 
-        return self.profile_processor.load_profile(file_path)
+        return self.profile_processor.load_profile(file_path, checkpoint)
 
-    def load_sensor_data(self, file_path: str = None) -> Dict[str, Any]:
+    def load_sensor_data(
+        self, file_path: str = None, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Dict[str, Any]:
         """
         Carica dati sensori dai Digital Twins
 
         Args:
             file_path: Percorso opzionale al file dati sensori
+            checkpoint: Checkpoint di ingestione: se indicato, solo le letture nuove
 
         Returns:
-            Dati sensori
+            Dati sensori: {dispositivo: {tipo_lettura: TimeSeries}}
         """
         if file_path is None:
             file_path = self.config.get_value("data_sources.sensors.path")
 
-        return self.digital_twin.load_sensor_data(file_path)
+        return self.digital_twin.load_sensor_data(file_path, checkpoint)
 
-    def load_app_data(self, file_path: str = None) -> Dict[str, Any]:
+    def load_app_data(
+        self, file_path: str = None, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Dict[str, Any]:
         """
         Carica dati applicazioni
 
         Args:
             file_path: Percorso opzionale al file dati app
+            checkpoint: Checkpoint di ingestione: se indicato, solo le entry nuove o modificate
 
         Returns:
             Dati applicazioni
@@ -76,4 +89,4 @@ class DataManager:
         if file_path is None:
             file_path = self.config.get_value("data_sources.apps.path")
 
-        return self.app_data_processor.load_app_data(file_path)
+        return self.app_data_processor.load_app_data(file_path, checkpoint)
@@ -0,0 +1,250 @@
+import json
+import re
+from typing import IO, Any, Iterator, Tuple, Union
+
+# Percorso di un valore nel documento: chiavi degli oggetti e indici delle liste
+JsonPath = Tuple[Union[str, int], ...]
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Caratteri con cui può proseguire un numero (es. "-1" seguito da ".5e3" nel blocco successivo)
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+_DECODER = json.JSONDecoder()
+# Chiave di un membro (senza escape) fino all'inizio del valore, e separatori dopo un valore
+_MEMBER_KEY = re.compile(r'[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*')
+_SEPARATORS = {"}": re.compile(r"[ \t\n\r]*([,}])"), "]": re.compile(r"[ \t\n\r]*([,\]])")}
+
+# Estensioni dei file JSON delimitati da newline (un valore per riga)
+NDJSON_EXTENSIONS = (".jsonl", ".ndjson")
+
+
+def is_ndjson(file_path: str) -> bool:
+    """True se il file è JSON delimitato da newline (.jsonl o .ndjson)."""
+    return file_path.endswith(NDJSON_EXTENSIONS)
+
+
+class _JsonReader:
+    """
+    Lettore a blocchi di un documento JSON: mantiene in memoria solo la parte non
+    ancora consumata del testo, e i singoli valori sono decodificati da
+    json.JSONDecoder.raw_decode (implementazione C della libreria standard).
+    """
+
+    def __init__(self, stream: IO[str], chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        # Caratteri scartati dal buffer, per la posizione degli errori
+        self.offset = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        """Primo carattere dopo gli spazi, senza consumarlo ("" a fine file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, expected: str) -> str:
+        """Consuma un carattere di struttura tra quelli attesi."""
+        char = self.peek()
+        if not char or char not in expected:
+            raise self._error(f"atteso uno tra {' '.join(expected)}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decodifica il valore successivo, leggendo altri blocchi se è incompleto."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self._fill():
+                    continue
+                raise self._error(e.msg) from None
+            # Un valore che arriva alla fine del buffer, anche con una parte di numero
+            # non ancora decodificabile, può continuare nel blocco successivo
+            if _NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _fill(self) -> bool:
+        """Scarta il testo consumato e legge un altro blocco; False a fine file."""
+        if self.eof:
+            return False
+        # Blocchi almeno grandi quanto il valore in corso: la decodifica di valori
+        # più lunghi di chunk_size resta lineare
+        chunk = self.stream.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"JSON non valido al carattere {self.offset + self.pos}: {message}")
+
+
+def iter_json(file_path: str, depth: int = 1, chunk_size: int = 1 << 16) -> Iterator[Tuple[JsonPath, Any]]:
+    """
+    Decodifica un file JSON in modo incrementale, restituendo i valori alla
+    profondità indicata man mano che vengono letti, senza caricare il documento.
+
+    Con depth=1 gli elementi sono i campi dell'oggetto (o gli elementi della lista)
+    di primo livello, con depth=2 quelli dei valori annidati, e così via. I valori
+    scalari e i contenitori vuoti sopra la profondità sono restituiti interi al
+    proprio percorso (il documento intero ha percorso vuoto).
+
+    Args:
+        file_path: Percorso al file JSON
+        depth: Profondità dei valori restituiti
+        chunk_size: Caratteri letti per blocco
+
+    Returns:
+        Iteratore di coppie (percorso, valore), ad es. (("heart_rate", "2025-04-01T10:10:00Z"), 72)
+
+    Raises:
+        ValueError: Se il documento non è JSON valido
+    """
+    with open(file_path, "r") as f:
+        reader = _JsonReader(f, chunk_size)
+        if not reader.peek():
+            raise reader._error("documento vuoto")
+        yield from _walk(reader, (), depth)
+        if reader.peek():
+            raise reader._error("dati dopo la fine del documento")
+
+
+def _walk(reader: _JsonReader, path: JsonPath, depth: int) -> Iterator[Tuple[JsonPath, Any]]:
+    opening = reader.peek()
+    if len(path) >= depth or opening not in ("{", "["):
+        yield path, reader.value()
+        return
+
+    closing = "}" if opening == "{" else "]"
+    reader.pos += 1
+    if reader.peek() == closing:
+        reader.pos += 1
+        yield path, {} if opening == "{" else []
+        return
+
+    if len(path) + 1 == depth:
+        yield from _walk_leaves(reader, path, opening == "{", closing)
+        return
+
+    index = 0
+    while True:
+        if opening == "{":
+            key = _read_key(reader)
+            yield from _walk(reader, path + (key,), depth)
+        else:
+            yield from _walk(reader, path + (index,), depth)
+            index += 1
+        if reader.take("," + closing) == closing:
+            return
+
+
+def _walk_leaves(
+    reader: _JsonReader, path: JsonPath, is_object: bool, closing: str
+) -> Iterator[Tuple[JsonPath, Any]]:
+    """
+    Elementi di un contenitore alla profondità richiesta (es. le letture di una serie).
+    Quando chiave, valore e separatore sono interamente nel buffer vengono letti con
+    una sola espressione regolare e una decodifica; altrimenti (fine del blocco,
+    escape nella chiave, errori) l'elemento è riletto con il percorso generale.
+    """
+    separator_pattern = _SEPARATORS[closing]
+    index = 0
+    while True:
+        buffer = reader.buffer
+        separator = None
+        key: Union[str, int] = index
+        position = reader.pos
+        if is_object:
+            match = _MEMBER_KEY.match(buffer, position)
+            position = match.end() if match is not None else -1
+            if match is not None:
+                key = match.group(1)
+        else:
+            position = _WHITESPACE.match(buffer, position).end()
+        if position >= 0:
+            try:
+                value, end = _DECODER.raw_decode(buffer, position)
+                separator = separator_pattern.match(buffer, end)
+            except json.JSONDecodeError:
+                pass
+
+        if separator is not None:
+            reader.pos = separator.end()
+            char = separator.group(1)
+        else:
+            if is_object:
+                key = _read_key(reader)
+            value = reader.value()
+            char = reader.take("," + closing)
+
+        yield path + (key,), value
+        index += 1
+        if char == closing:
+            return
+
+
+def _read_key(reader: _JsonReader) -> str:
+    if reader.peek() != '"':
+        raise reader._error("attesa una chiave")
+    key = reader.value()
+    reader.take(":")
+    return key
+
+
+def load_json(file_path: str, chunk_size: int = 1 << 16) -> Any:
+    """
+    Carica un file JSON decodificando un campo di primo livello per volta: a
+    differenza di json.load il testo completo del file non è mai in memoria.
+
+    Args:
+        file_path: Percorso al file JSON
+        chunk_size: Caratteri letti per blocco
+
+    Returns:
+        Documento decodificato
+    """
+    document: Any = None
+    for path, value in iter_json(file_path, 1, chunk_size):
+        if not path:
+            return value
+        if document is None:
+            document = {} if isinstance(path[0], str) else []
+        if isinstance(document, dict):
+            document[path[0]] = value
+        else:
+            document.append(value)
+    return document
+
+
+def iter_ndjson(file_path: str) -> Iterator[Any]:
+    """
+    Decodifica un file JSON delimitato da newline una riga per volta
+
+    Args:
+        file_path: Percorso al file .jsonl o .ndjson
+
+    Returns:
+        Iteratore dei valori delle righe non vuote
+
+    Raises:
+        ValueError: Se una riga non è JSON valido
+    """
+    with open(file_path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Riga {number} di {file_path} non valida: {e}") from None
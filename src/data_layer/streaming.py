@@ -0,0 +1,219 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from data_layer.structured.time_series import TimeSeries, TimeSeriesBuilder
+
+# Record letto da un feed: (file, offset dopo la riga, record, istante di lettura)
+StreamItem = Tuple[str, int, Dict[str, Any], float]
+
+# Campi di un record sensore che non sono letture
+_SENSOR_META_FIELDS = ("device", "device_id", "timestamp", "reading", "reading_type", "value")
+
+
+class JsonlTailer:
+    """
+    Segue un feed JSONL in sola aggiunta, un file o una directory di file .jsonl,
+    e inserisce i nuovi record in una coda limitata.
+
+    Il feed è letto per polling, a blocchi, fino all'ultima riga completa: una riga
+    in corso di scrittura viene letta al giro successivo. Se la coda è piena la
+    lettura si ferma finché il consumatore non libera spazio (backpressure): i dati
+    non letti restano sul file e l'offset non avanza. Un file più corto dell'offset
+    registrato (troncato o ruotato) viene riletto dall'inizio.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        output: "queue.Queue[StreamItem]",
+        offsets: Optional[Dict[str, int]] = None,
+        poll_interval: float = 0.5,
+        read_size: int = 1 << 20,
+    ):
+        """
+        Args:
+            path: File JSONL o directory di file .jsonl
+            output: Coda limitata in cui inserire i record
+            offsets: Offset di partenza per file (percorso assoluto), es. da un checkpoint
+            poll_interval: Secondi tra due controlli del feed senza dati nuovi
+            read_size: Byte letti al massimo per file a ogni giro
+        """
+        self.path = path
+        self.output = output
+        self.offsets: Dict[str, int] = dict(offsets or {})
+        self.poll_interval = poll_interval
+        self.read_size = read_size
+
+        self.records = 0
+        self.invalid_lines = 0
+
+    def files(self) -> List[str]:
+        """Restituisce i file del feed, in ordine di nome."""
+        if os.path.isdir(self.path):
+            return [
+                os.path.abspath(os.path.join(self.path, filename))
+                for filename in sorted(os.listdir(self.path))
+                if filename.endswith(".jsonl")
+            ]
+        if os.path.isfile(self.path):
+            return [os.path.abspath(self.path)]
+        return []
+
+    def poll(self, stop: Optional[threading.Event] = None) -> int:
+        """
+        Legge i record nuovi di tutti i file del feed
+
+        Args:
+            stop: Evento che interrompe l'attesa su una coda piena
+
+        Returns:
+            Numero di record inseriti nella coda
+        """
+        queued = 0
+        try:
+            for file_path in self.files():
+                while True:
+                    lines, ends = self._read_lines(file_path)
+                    if not lines:
+                        break
+                    for line, end in zip(lines, ends):
+                        record = self._parse(line)
+                        if record is not None:
+                            if not self._put((file_path, end, record, time.time()), stop):
+                                return queued
+                            queued += 1
+                        self.offsets[file_path] = end
+        finally:
+            self.records += queued
+        return queued
+
+    def run(self, stop: threading.Event):
+        """
+        Segue il feed finché stop non viene impostato
+
+        Args:
+            stop: Evento di arresto
+        """
+        while not stop.is_set():
+            if self.poll(stop) == 0:
+                stop.wait(self.poll_interval)
+
+    def _read_lines(self, file_path: str) -> Tuple[List[bytes], List[int]]:
+        """Legge un blocco di righe complete dall'offset corrente, con l'offset di fine di ognuna."""
+        offset = self.offsets.get(file_path, 0)
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return [], []
+        if size < offset:
+            offset = self.offsets[file_path] = 0
+        if size == offset:
+            return [], []
+
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(self.read_size)
+
+        complete = data.rfind(b"\n")
+        if complete < 0:
+            if len(data) < self.read_size:
+                # Riga non ancora terminata dallo scrittore
+                return [], []
+            # Riga più lunga del blocco: viene letta per intero
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                data = f.readline()
+            if not data.endswith(b"\n"):
+                return [], []
+            complete = len(data) - 1
+
+        lines = []
+        ends = []
+        position = 0
+        for line in data[: complete + 1].split(b"\n")[:-1]:
+            position += len(line) + 1
+            lines.append(line)
+            ends.append(offset + position)
+        return lines, ends
+
+    def _parse(self, line: bytes) -> Optional[Dict[str, Any]]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            self.invalid_lines += 1
+            return None
+        if not isinstance(record, dict):
+            self.invalid_lines += 1
+            return None
+        return record
+
+    def _put(self, item: StreamItem, stop: Optional[threading.Event]) -> bool:
+        """Inserisce un record attendendo spazio nella coda; False se arrivato lo stop."""
+        while True:
+            try:
+                self.output.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if stop is not None and stop.is_set():
+                    return False
+
+
+def sensor_records_to_series(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, TimeSeries]]:
+    """
+    Raggruppa letture sensore in record singoli in serie per dispositivo e tipo lettura.
+
+    Formati accettati:
+        {"device": "smartwatch", "reading_type": "heart_rate", "timestamp": "...", "value": 72}
+        {"device": "smartwatch", "timestamp": "...", "heart_rate": 72, "steps": 10}
+    (device_id e reading sono sinonimi di device e reading_type). I record senza
+    timestamp e le letture senza valore valido sono scartati.
+
+    Args:
+        records: Record decodificati
+
+    Returns:
+        Dati sensori ({dispositivo: {tipo_lettura: TimeSeries}}), senza serie vuote
+    """
+    builders: Dict[str, Dict[str, TimeSeriesBuilder]] = {}
+    for record in records:
+        timestamp = record.get("timestamp")
+        if not isinstance(timestamp, str):
+            continue
+        device_id = str(record.get("device") or record.get("device_id") or "stream")
+        device = builders.setdefault(device_id, {})
+        for reading_type, value in sensor_record_readings(record):
+            builder = device.get(reading_type)
+            if builder is None:
+                builder = device[reading_type] = TimeSeriesBuilder()
+            builder.append(timestamp, value)
+
+    sensor_data = {}
+    for device_id, readings in builders.items():
+        series = {key: builder.build() for key, builder in readings.items() if len(builder)}
+        if series:
+            sensor_data[device_id] = series
+    return sensor_data
+
+
+def sensor_record_readings(record: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """
+    Letture di un record sensore: (reading_type, value) per i record con un'unica
+    lettura, altrimenti una coppia per ogni campo che non è un metadato
+
+    Args:
+        record: Record decodificato
+
+    Returns:
+        Coppie (tipo_lettura, valore)
+    """
+    reading_type = record.get("reading_type") or record.get("reading")
+    if reading_type is not None:
+        return [(str(reading_type), record.get("value"))]
+    return [(str(key), value) for key, value in record.items() if key not in _SENSOR_META_FIELDS]
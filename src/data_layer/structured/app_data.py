@@ -1,17 +1,78 @@
 import os
-import json
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from data_layer.checkpoint import IngestionCheckpoint, content_digest
+from data_layer.json_stream import load_json
 
 class AppDataProcessor:
     """
     Gestisce il caricamento e l'elaborazione dei dati delle applicazioni
     """
     
-    def load_app_data(self, file_path: str) -> Dict[str, Any]:
+    def load_app_data(
+        self, file_path: str, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Dict[str, Any]:
         """
         Carica dati applicazioni
         
+        Args:
+            file_path: Percorso al file dati app o directory
+            checkpoint: Se indicato, vengono restituiti solo i campi delle entry
+                        nuovi o modificati dall'ultima ingestione
+            
+        Returns:
+            Dati applicazioni
+        """
+        app_data = self._load_app_path(file_path)
+        if checkpoint is None:
+            return app_data
+        return self._changed_entries(app_data, checkpoint)
+    
+    def _changed_entries(
+        self, app_data: Dict[str, Any], checkpoint: IngestionCheckpoint
+    ) -> Dict[str, Any]:
+        """
+        Filtra i dati app lasciando solo quanto è cambiato dall'ultima ingestione.
+        Il confronto avviene alla granularità dei triplet generati dall'ontologia:
+        un campo di un'entry (es. un evento in calendar/events), o l'entry intera
+        se non è un dizionario.
+        
+        Args:
+            app_data: Dati applicazioni completi
+            checkpoint: Checkpoint di ingestione
+            
+        Returns:
+            Dati applicazioni con la stessa struttura, limitati alle parti nuove
+        """
+        changed = {}
+        for app_id, entries in app_data.items():
+            if not isinstance(entries, dict):
+                continue
+            for entry_id, entry_data in entries.items():
+                if isinstance(entry_data, dict):
+                    fields = entry_data.items()
+                else:
+                    fields = [(None, entry_data)]
+                
+                for field, value in fields:
+                    key = f"{app_id}/{entry_id}" if field is None else f"{app_id}/{entry_id}/{field}"
+                    digest = content_digest(value)
+                    if checkpoint.get("app", key) == digest:
+                        continue
+                    checkpoint.stage("app", key, digest)
+                    
+                    app_entries = changed.setdefault(app_id, {})
+                    if field is None:
+                        app_entries[entry_id] = value
+                    else:
+                        app_entries.setdefault(entry_id, {})[field] = value
+        return changed
+    
+    def _load_app_path(self, file_path: str) -> Dict[str, Any]:
+        """
+        Carica i dati app da un file o da una directory
+        
         Args:
             file_path: Percorso al file dati app o directory
             
@@ -61,9 +122,8 @@ class AppDataProcessor:
             Dati app dal file
         """
         if file_path.endswith('.json'):
-            # Carica formato JSON
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            # Carica formato JSON un campo di primo livello per volta
+            return load_json(file_path)
         elif file_path.endswith('.yaml') or file_path.endswith('.yml'):
             # Carica formato YAML
             with open(file_path, 'r') as f:
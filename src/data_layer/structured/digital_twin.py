@@ -1,7 +1,10 @@
 import os
-import json
 import csv
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, Optional
+from data_layer.checkpoint import IngestionCheckpoint
+from data_layer.json_stream import is_ndjson, iter_json, iter_ndjson
+from data_layer.streaming import sensor_record_readings
+from data_layer.structured.time_series import TimeSeries, TimeSeriesBuilder
 
 
 class DigitalTwin:
@@ -9,99 +12,164 @@ class DigitalTwin:
     Rappresenta Digital Twins per dispositivi IoT e gestisce dati sensori
     """
 
-    def load_sensor_data(self, file_path: str) -> Dict[str, Any]:
+    def load_sensor_data(
+        self, file_path: str, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Dict[str, Any]:
         """
         Carica dati sensori da file
 
         Args:
             file_path: Percorso ai file dati sensori
+            checkpoint: Se indicato, vengono restituite solo le letture successive
+                        al watermark di ogni serie (i file invariati non sono letti)
 
         Returns:
-            Dati sensori elaborati
+            Dati sensori elaborati: {dispositivo: {tipo_lettura: TimeSeries}}
         """
         sensor_data = {}
 
         # Controlla se il percorso è una directory o un file
         if os.path.isdir(file_path):
             # Elabora tutti i file dati sensori nella directory
+            files = []
             for filename in os.listdir(file_path):
                 file_full_path = os.path.join(file_path, filename)
                 if os.path.isfile(file_full_path):
                     # Estrai ID dispositivo dal nome file
-                    device_id = os.path.splitext(filename)[0]
-                    sensor_data[device_id] = self._load_sensor_file(file_full_path)
+                    files.append((os.path.splitext(filename)[0], file_full_path))
         else:
             # File singolo - usa il nome file come ID dispositivo
-            device_id = os.path.splitext(os.path.basename(file_path))[0]
-            sensor_data[device_id] = self._load_sensor_file(file_path)
+            files = [(os.path.splitext(os.path.basename(file_path))[0], file_path)]
+
+        for device_id, device_path in files:
+            if checkpoint is None:
+                sensor_data[device_id] = self._load_sensor_file(device_path)
+            elif checkpoint.file_changed(device_path):
+                # Le letture già ingerite sono scartate durante la lettura del file
+                watermark = lambda reading_type, device_id=device_id: checkpoint.get(
+                    "sensor", f"{device_id}/{reading_type}"
+                )
+                readings = self._new_readings(
+                    device_id, self._load_sensor_file(device_path, watermark), checkpoint
+                )
+                if readings:
+                    sensor_data[device_id] = readings
 
         return sensor_data
 
-    def _load_sensor_file(self, file_path: str) -> Dict[str, Dict[str, float]]:
+    def _new_readings(
+        self,
+        device_id: str,
+        readings: Dict[str, TimeSeries],
+        checkpoint: IngestionCheckpoint,
+    ) -> Dict[str, TimeSeries]:
         """
-        Carica un singolo file dati sensori
+        Limita le serie di un dispositivo alle letture successive al watermark
+        e registra i nuovi watermark (ultimo timestamp in ms per serie)
 
         Args:
-            file_path: Percorso al file dati sensori
+            device_id: ID del dispositivo
+            readings: Serie complete del dispositivo
+            checkpoint: Checkpoint di ingestione
 
         Returns:
-            Letture sensori dal file
+            Serie con le sole letture nuove (quelle vuote sono omesse)
+        """
+        new_readings = {}
+        for reading_type, series in readings.items():
+            if len(series) == 0:
+                continue
+            key = f"{device_id}/{reading_type}"
+            watermark = checkpoint.get("sensor", key)
+            if watermark is not None:
+                series = series.slice(int(watermark) + 1)
+            if len(series) == 0:
+                continue
+            checkpoint.stage("sensor", key, int(series.timestamps[-1]))
+            new_readings[reading_type] = series
+        return new_readings
+
+    def _load_sensor_file(
+        self,
+        file_path: str,
+        watermark: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> Dict[str, TimeSeries]:
         """
-        readings = {}
+        Carica un singolo file dati sensori.
+        I file sono letti in modo incrementale (JSON con iter_json, JSONL e CSV riga
+        per riga) e le letture accumulate direttamente in colonne: il documento
+        completo non viene mai caricato in memoria.
 
-        if file_path.endswith(".json"):
-            # Carica formato JSON
-            with open(file_path, "r") as f:
-                data = json.load(f)
-
-            # Elabora dati JSON in base al formato previsto
-            if isinstance(data, dict):
-                for reading_type, values in data.items():
-                    if isinstance(values, dict):
-                        readings[reading_type] = values
-                    elif isinstance(values, list) and all(
-                        isinstance(item, dict) for item in values
-                    ):
-                        # Lista di letture con timestamp e valore
-                        readings[reading_type] = {
-                            item.get("timestamp", f"reading_{i}"): item.get("value")
-                            for i, item in enumerate(values)
-                            if "value" in item
-                        }
+        Args:
+            file_path: Percorso al file dati sensori
+            watermark: Se indicata, funzione tipo_lettura -> ultimo timestamp (ms) già
+                       ingerito; le letture non successive sono scartate durante la lettura
+
+        Returns:
+            Serie temporali colonnari per tipo di lettura
+        """
+        builders: Dict[str, TimeSeriesBuilder] = {}
+
+        def builder(reading_type: str) -> TimeSeriesBuilder:
+            series = builders.get(reading_type)
+            if series is None:
+                after = watermark(reading_type) if watermark is not None else None
+                series = builders[reading_type] = TimeSeriesBuilder(
+                    None if after is None else int(after)
+                )
+            return series
+
+        if is_ndjson(file_path):
+            # Un record per riga, nel formato dei feed in streaming
+            for record in iter_ndjson(file_path):
+                if isinstance(record, dict):
+                    for reading_type, value in sensor_record_readings(record):
+                        builder(reading_type).append(record.get("timestamp"), value)
+
+        elif file_path.endswith(".json"):
+            # Formati previsti: {tipo_lettura: {timestamp: valore}} oppure
+            # {tipo_lettura: [{"timestamp": ..., "value": ...}]}
+            for path, value in iter_json(file_path, depth=2):
+                if not path or not isinstance(path[0], str):
+                    continue
+                if len(path) == 1:
+                    # Serie vuota; gli altri campi scalari non sono letture
+                    if isinstance(value, (dict, list)):
+                        builder(path[0])
+                elif isinstance(path[1], str):
+                    builder(path[0]).append(path[1], value)
+                elif isinstance(value, dict) and "value" in value:
+                    # Le letture senza timestamp vengono scartate
+                    builder(path[0]).append(value.get("timestamp"), value.get("value"))
 
         elif file_path.endswith(".csv"):
             # Carica formato CSV
             with open(file_path, "r") as f:
                 csv_reader = csv.DictReader(f)
-
-                # Prima, raccogli tutte le righe
-                rows = list(csv_reader)
+                fieldnames = csv_reader.fieldnames or []
 
                 # Controlla se CSV è organizzato per tipo lettura o per timestamp
-                if (
-                    "timestamp" in csv_reader.fieldnames
-                    and len(csv_reader.fieldnames) > 2
-                ):
+                if "timestamp" in fieldnames and len(fieldnames) > 2:
                     # CSV organizzato con timestamp nella prima colonna e tipi lettura nelle altre colonne
-                    for reading_type in [
-                        f for f in csv_reader.fieldnames if f != "timestamp"
-                    ]:
-                        readings[reading_type] = {}
-                        for row in rows:
-                            if row["timestamp"] and row[reading_type]:
-                                readings[reading_type][row["timestamp"]] = float(
-                                    row[reading_type]
+                    reading_types = [f for f in fieldnames if f != "timestamp"]
+                    for reading_type in reading_types:
+                        builder(reading_type)
+                    for row in csv_reader:
+                        if not row["timestamp"]:
+                            continue
+                        for reading_type in reading_types:
+                            if row[reading_type]:
+                                builder(reading_type).append(
+                                    row["timestamp"], float(row[reading_type])
                                 )
                 else:
                     # Assume CSV con colonne reading_type, timestamp, value
-                    for row in rows:
+                    for row in csv_reader:
                         reading_type = row.get("reading_type", "")
                         timestamp = row.get("timestamp", "")
                         value = row.get("value", "")
 
                         if reading_type and timestamp and value:
-                            if reading_type not in readings:
-                                readings[reading_type] = {}
-                            readings[reading_type][timestamp] = float(value)
+                            builder(reading_type).append(timestamp, float(value))
 
-        return readings
+        return {reading_type: series.build() for reading_type, series in builders.items()}
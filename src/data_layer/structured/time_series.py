@@ -0,0 +1,406 @@
+import json
+import os
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+TimeBound = Union[int, str, datetime, None]
+
+
+def parse_timestamp(value: Union[str, datetime]) -> int:
+    """
+    Converte un timestamp ISO 8601 (o un datetime) in millisecondi epoch UTC.
+    I timestamp senza fuso orario sono interpretati come UTC.
+
+    Args:
+        value: Timestamp ISO o datetime
+
+    Returns:
+        Millisecondi dall'epoch
+
+    Raises:
+        ValueError: Se il timestamp non è interpretabile
+    """
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        text = value.strip()
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        moment = datetime.fromisoformat(text)
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(round(moment.timestamp() * 1000))
+
+
+def format_timestamps(timestamps: np.ndarray) -> List[str]:
+    """
+    Converte millisecondi epoch in timestamp ISO 8601 UTC (es. 2025-04-01T10:10:00Z).
+    La precisione è scelta per singolo valore (secondi se interi, altrimenti
+    millisecondi): lo stesso istante ha sempre la stessa rappresentazione,
+    indipendentemente dagli altri timestamp dell'array.
+
+    Args:
+        timestamps: Array int64 di millisecondi
+
+    Returns:
+        Lista di timestamp ISO
+    """
+    if len(timestamps) == 0:
+        return []
+    texts = np.datetime_as_string(
+        timestamps.astype("datetime64[ms]"), unit="ms", timezone="UTC"
+    ).tolist()
+    whole = (timestamps % 1000 == 0).tolist()
+    # "....SS.000Z" -> "....SSZ" per i secondi interi
+    return [text[:-5] + "Z" if exact else text for text, exact in zip(texts, whole)]
+
+
+class TimeSeries:
+    """
+    Serie temporale colonnare per un tipo di lettura di un dispositivo.
+
+    I timestamp sono millisecondi epoch UTC in un array int64 ordinato e i valori
+    un array float64 parallelo. Le letture categoriali (es. activity_level)
+    sono codificate come indici nella lista `categories`.
+    """
+
+    def __init__(
+        self,
+        timestamps: Iterable[int],
+        values: Iterable[float],
+        categories: Optional[List[str]] = None,
+    ):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if timestamps.shape != values.shape or timestamps.ndim != 1:
+            raise ValueError("Timestamp e valori devono essere array 1D della stessa lunghezza")
+
+        if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+            values = values[order]
+
+        self.timestamps = timestamps
+        self.values = values
+        self.categories = categories
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[Union[str, datetime], Any]]) -> "TimeSeries":
+        """
+        Costruisce una serie da coppie (timestamp, valore).
+        Le letture con timestamp non interpretabile o valore mancante vengono scartate;
+        se almeno un valore non è numerico la serie diventa categoriale.
+
+        Args:
+            pairs: Coppie (timestamp ISO o datetime, valore)
+
+        Returns:
+            Nuova TimeSeries
+        """
+        timestamps = []
+        raw_values = []
+        for timestamp, value in pairs:
+            if value is None:
+                continue
+            try:
+                timestamps.append(parse_timestamp(timestamp))
+            except (TypeError, ValueError):
+                continue
+            raw_values.append(value)
+
+        numeric = all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in raw_values
+        )
+        if numeric:
+            return cls(timestamps, raw_values)
+
+        categories: List[str] = []
+        codes: Dict[str, int] = {}
+        encoded = []
+        for value in raw_values:
+            label = str(value)
+            code = codes.get(label)
+            if code is None:
+                code = codes[label] = len(categories)
+                categories.append(label)
+            encoded.append(code)
+        return cls(timestamps, encoded, categories)
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, Any]) -> "TimeSeries":
+        """
+        Costruisce una serie dal formato {timestamp_iso: valore}
+
+        Args:
+            mapping: Dizionario timestamp -> valore
+
+        Returns:
+            Nuova TimeSeries
+        """
+        return cls.from_pairs(mapping.items())
+
+    @property
+    def is_categorical(self) -> bool:
+        """True se la serie contiene valori categoriali."""
+        return self.categories is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria occupata dagli array della serie."""
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def slice(self, start: TimeBound = None, end: TimeBound = None) -> "TimeSeries":
+        """
+        Restituisce la porzione di serie nell'intervallo [start, end) tramite ricerca binaria.
+        Gli array risultanti sono viste sugli array originali, senza copie.
+
+        Args:
+            start: Inizio dell'intervallo (ms epoch, ISO o datetime), None per l'inizio della serie
+            end: Fine esclusa dell'intervallo, None per la fine della serie
+
+        Returns:
+            TimeSeries con le sole letture nell'intervallo
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, _to_ms(start), side="left"))
+        hi = len(self.timestamps) if end is None else int(np.searchsorted(self.timestamps, _to_ms(end), side="left"))
+        hi = max(lo, hi)
+
+        sliced = TimeSeries.__new__(TimeSeries)
+        sliced.timestamps = self.timestamps[lo:hi]
+        sliced.values = self.values[lo:hi]
+        sliced.categories = self.categories
+        return sliced
+
+    def merge(self, other: "TimeSeries") -> "TimeSeries":
+        """
+        Unisce le letture di un'altra serie dello stesso tipo, ad esempio quelle arrivate
+        dopo l'ultima ingestione. A parità di timestamp prevale il valore di other.
+
+        Args:
+            other: Serie da unire
+
+        Returns:
+            Nuova TimeSeries ordinata, senza timestamp duplicati
+        """
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other
+
+        if self.categories is None and other.categories is None:
+            categories = None
+            values = np.concatenate((self.values, other.values))
+        else:
+            # Codici ricalcolati sull'unione delle categorie (valori numerici come etichette)
+            categories = list(self.categories or [])
+            codes = {label: code for code, label in enumerate(categories)}
+            encoded = []
+            for series in (self, other):
+                for label in series.decoded_values():
+                    label = str(label)
+                    code = codes.get(label)
+                    if code is None:
+                        code = codes[label] = len(categories)
+                        categories.append(label)
+                    encoded.append(code)
+            values = np.asarray(encoded, dtype=np.float64)
+
+        timestamps = np.concatenate((self.timestamps, other.timestamps))
+        if other.timestamps[0] <= self.timestamps[-1]:
+            # Intervalli sovrapposti: ordinamento stabile, poi per ogni timestamp
+            # si tiene l'ultima occorrenza (quella di other)
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+            values = values[order]
+            last = np.append(timestamps[1:] != timestamps[:-1], True)
+            timestamps = timestamps[last]
+            values = values[last]
+
+        merged = TimeSeries.__new__(TimeSeries)
+        merged.timestamps = timestamps
+        merged.values = values
+        merged.categories = categories
+        return merged
+
+    def decoded_values(self) -> List[Any]:
+        """
+        Restituisce i valori nella forma originale: etichette per le serie categoriali,
+        interi per i valori senza parte decimale, float altrimenti.
+        """
+        if self.categories is not None:
+            categories = self.categories
+            return [categories[int(code)] for code in self.values.tolist()]
+        return [int(v) if v.is_integer() else v for v in self.values.tolist()]
+
+    def iso_timestamps(self) -> List[str]:
+        """Restituisce i timestamp in formato ISO 8601 UTC."""
+        return format_timestamps(self.timestamps)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Itera le letture come coppie (timestamp ISO, valore), compatibili
+        con il precedente formato {timestamp: valore}
+        """
+        return zip(self.iso_timestamps(), self.decoded_values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Restituisce la serie nel formato {timestamp_iso: valore}."""
+        return dict(self.items())
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __str__(self) -> str:
+        if len(self) == 0:
+            return "nessuna lettura"
+
+        first, last = format_timestamps(self.timestamps[[0, -1]])
+        if self.categories is not None:
+            counts = np.bincount(self.values.astype(np.int64), minlength=len(self.categories))
+            distribution = ", ".join(
+                f"{label}: {count}" for label, count in zip(self.categories, counts.tolist()) if count
+            )
+            return f"{len(self)} letture ({first} -> {last}); {distribution}"
+
+        return (
+            f"{len(self)} letture ({first} -> {last}); "
+            f"min {self.values.min():g}, max {self.values.max():g}, "
+            f"media {self.values.mean():.2f}, ultima {self.values[-1]:g}"
+        )
+
+    def __repr__(self) -> str:
+        return f"TimeSeries({self})"
+
+
+class TimeSeriesBuilder:
+    """
+    Costruzione incrementale di una TimeSeries da letture decodificate una per volta.
+
+    Timestamp e valori sono accumulati in array compatti (8 byte ciascuno) invece che
+    in liste di coppie, così che un file con milioni di letture non passi per oggetti
+    Python intermedi. Le regole sono quelle di from_pairs; se la serie diventa
+    categoriale, i valori numerici già letti sono etichettati nella forma più breve
+    (72.0 diventa "72").
+    """
+
+    def __init__(self, after: Optional[int] = None):
+        """
+        Args:
+            after: Se indicato, le letture con timestamp (ms) non successivo sono scartate
+        """
+        self.after = after
+        self._timestamps = array("q")
+        self._values = array("d")
+        self._categories: Optional[List[str]] = None
+        self._codes: Dict[str, int] = {}
+
+    def append(self, timestamp: Union[str, datetime], value: Any) -> bool:
+        """
+        Aggiunge una lettura
+
+        Args:
+            timestamp: Timestamp ISO o datetime
+            value: Valore della lettura
+
+        Returns:
+            False se la lettura è stata scartata
+        """
+        if value is None:
+            return False
+        try:
+            stamp = parse_timestamp(timestamp)
+        except (TypeError, ValueError, AttributeError):
+            return False
+        if self.after is not None and stamp <= self.after:
+            return False
+
+        if self._categories is None:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self._timestamps.append(stamp)
+                self._values.append(value)
+                return True
+            self._categories = []
+            self._values = array("d", (self._code(_label(v)) for v in self._values))
+        self._timestamps.append(stamp)
+        self._values.append(self._code(str(value)))
+        return True
+
+    def build(self) -> TimeSeries:
+        """Serie con le letture aggiunte finora."""
+        return TimeSeries(
+            np.frombuffer(self._timestamps, dtype=np.int64).copy(),
+            np.frombuffer(self._values, dtype=np.float64).copy(),
+            self._categories,
+        )
+
+    def _code(self, label: str) -> int:
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self._categories)
+            self._categories.append(label)
+        return code
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+
+def save_series(path: str, sensor_data: Dict[str, Dict[str, TimeSeries]]):
+    """
+    Salva serie sensore in un file .npz, scritto in modo atomico
+
+    Args:
+        path: Percorso del file
+        sensor_data: Serie per dispositivo e tipo di lettura
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    index = []
+    for device_id, readings in sensor_data.items():
+        for reading_type, series in readings.items():
+            position = len(index)
+            index.append([device_id, reading_type, series.categories])
+            arrays[f"t{position}"] = series.timestamps
+            arrays[f"v{position}"] = series.values
+    arrays["index"] = np.frombuffer(json.dumps(index).encode("utf-8"), dtype=np.uint8)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def load_series(path: str) -> Dict[str, Dict[str, TimeSeries]]:
+    """
+    Carica le serie sensore salvate con save_series
+
+    Args:
+        path: Percorso del file
+
+    Returns:
+        Serie per dispositivo e tipo di lettura
+    """
+    sensor_data: Dict[str, Dict[str, TimeSeries]] = {}
+    with np.load(path) as data:
+        index = json.loads(data["index"].tobytes().decode("utf-8"))
+        for position, (device_id, reading_type, categories) in enumerate(index):
+            series = TimeSeries.__new__(TimeSeries)
+            series.timestamps = data[f"t{position}"]
+            series.values = data[f"v{position}"]
+            series.categories = categories
+            sensor_data.setdefault(device_id, {})[reading_type] = series
+    return sensor_data
+
+
+def _label(value: float) -> str:
+    """Etichetta categoriale di un valore numerico già convertito in float."""
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def _to_ms(bound: Union[int, str, datetime]) -> int:
+    """Normalizza un estremo di intervallo in millisecondi epoch."""
+    if isinstance(bound, (int, np.integer)):
+        return int(bound)
+    return parse_timestamp(bound)
@@ -1,17 +1,43 @@
 import os
-import json
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from data_layer.checkpoint import IngestionCheckpoint, content_digest
+from data_layer.json_stream import load_json
 
 class ProfileProcessor:
     """
     Gestisce il caricamento e l'elaborazione dei dati del profilo utente
     """
     
-    def load_profile(self, file_path: str) -> Dict[str, Any]:
+    def load_profile(
+        self, file_path: str, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Carica dati profilo utente
         
+        Args:
+            file_path: Percorso al file dati profilo o directory
+            checkpoint: Se indicato, il profilo è restituito solo se è cambiato
+                        dall'ultima ingestione
+            
+        Returns:
+            Dati profilo utente, o None se il profilo non è cambiato
+        """
+        profile_data = self._load_profile_path(file_path)
+        if checkpoint is None:
+            return profile_data
+        
+        digest = content_digest(profile_data)
+        if checkpoint.get("profile", "digest") == digest:
+            return None
+        checkpoint.stage("profile", "digest", digest)
+        return profile_data
+    
+    def _load_profile_path(self, file_path: str) -> Dict[str, Any]:
+        """
+        Carica il profilo da un file o da una directory
+        
         Args:
             file_path: Percorso al file dati profilo o directory
             
@@ -52,9 +78,8 @@ class ProfileProcessor:
             Dati profilo dal file
         """
         if file_path.endswith('.json'):
-            # Carica formato JSON
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            # Carica formato JSON un campo di primo livello per volta
+            return load_json(file_path)
         elif file_path.endswith('.yaml') or file_path.endswith('.yml'):
             # Carica formato YAML
             with open(file_path, 'r') as f:
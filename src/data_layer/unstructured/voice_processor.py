@@ -1,18 +1,25 @@
 import os
-import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from data_layer.checkpoint import IngestionCheckpoint
+from data_layer.json_stream import NDJSON_EXTENSIONS, is_ndjson, iter_json, iter_ndjson
+from data_layer.structured.time_series import parse_timestamp
 
 class VoiceProcessor:
     """
     Gestisce il caricamento e il preprocessing dei dati di trascrizione vocale
     """
     
-    def load_and_process(self, file_path: str) -> str:
+    def load_and_process(
+        self, file_path: str, checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> str:
         """
         Carica e pre-elabora dati di trascrizione vocale
         
         Args:
             file_path: Percorso al file dati vocali o directory
+            checkpoint: Se indicato, vengono restituite solo le espressioni successive
+                        al watermark di ogni file (i file invariati non sono letti)
             
         Returns:
             Testo vocale elaborato
@@ -22,46 +29,137 @@ class VoiceProcessor:
             # Carica tutti i file di trascrizione nella directory
             transcripts = []
             for filename in sorted(os.listdir(file_path)):
-                if filename.endswith('.json') or filename.endswith('.txt'):
+                if filename.endswith(('.json', '.txt') + NDJSON_EXTENSIONS):
                     file_full_path = os.path.join(file_path, filename)
-                    transcripts.append(self._load_transcript_file(file_full_path))
+                    if checkpoint is None:
+                        transcripts.append(self._load_transcript_file(file_full_path))
+                    else:
+                        text = self._load_new_utterances(file_full_path, checkpoint)
+                        if text:
+                            transcripts.append(text)
             
             # Combina tutte le trascrizioni
             return "\n\n".join(transcripts)
+        elif checkpoint is not None:
+            return self._load_new_utterances(file_path, checkpoint)
         else:
             # Carica un singolo file di trascrizione
             return self._load_transcript_file(file_path)
     
-    def _load_transcript_file(self, file_path: str) -> str:
+    def _load_new_utterances(self, file_path: str, checkpoint: IngestionCheckpoint) -> str:
         """
-        Carica un singolo file di trascrizione
+        Carica le espressioni di un file successive al suo watermark e registra quello nuovo.
+        Con espressioni datate il watermark è l'ultimo timestamp; altrimenti il file è
+        considerato in sola aggiunta e il watermark è il numero di espressioni lette.
         
         Args:
             file_path: Percorso al file
+            checkpoint: Checkpoint di ingestione
             
         Returns:
-            Contenuto testuale del file
+            Testo delle sole espressioni nuove
         """
-        if file_path.endswith('.json'):
-            # Carica formato JSON
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+        if not checkpoint.file_changed(file_path):
+            return ""
+        
+        key = os.path.abspath(file_path)
+        watermark = checkpoint.get("voice", key, {})
+        last = watermark.get("timestamp")
+        count = watermark.get("count", 0)
+        
+        # Passata unica sul file: si tengono le espressioni nuove per entrambi i
+        # criteri finché non si sa se tutte le espressioni sono datate
+        new_by_time: List[str] = []
+        new_by_count: List[str] = []
+        latest = last
+        dated = True
+        total = 0
+        for index, (timestamp, text) in enumerate(self._iter_utterances(file_path)):
+            total += 1
+            if index >= count:
+                new_by_count.append(text)
+            if not dated:
+                continue
+            try:
+                stamp = parse_timestamp(timestamp)
+            except (TypeError, ValueError, AttributeError):
+                dated = False
+                new_by_time = []
+                continue
+            if last is None or stamp > last:
+                new_by_time.append(text)
+            latest = stamp if latest is None else max(latest, stamp)
+        
+        if total and dated:
+            new = new_by_time
+            checkpoint.stage("voice", key, {"timestamp": latest, "count": total})
+        else:
+            new = new_by_count
+            checkpoint.stage("voice", key, {"count": total})
+        
+        return "\n".join(new)
+    
+    def _iter_utterances(self, file_path: str) -> Iterator[Tuple[Optional[str], str]]:
+        """
+        Genera le espressioni di un file come coppie (timestamp o None, testo), man mano
+        che vengono decodificate: i file JSON sono letti con iter_json, quelli JSONL e
+        di testo riga per riga, senza caricare il documento completo
+        
+        Args:
+            file_path: Percorso al file
             
-            # Controlla formato previsto
-            if isinstance(data, list):
-                # Lista di espressioni
-                if all(isinstance(item, str) for item in data):
-                    return "\n".join(data)
-                # Lista di oggetti con campo text
-                elif all(isinstance(item, dict) and 'text' in item for item in data):
-                    return "\n".join(item['text'] for item in data)
-            elif isinstance(data, dict) and 'transcript' in data:
-                # Oggetto con campo transcript
-                return data['transcript']
+        Returns:
+            Iteratore delle espressioni nell'ordine del file
+        """
+        if is_ndjson(file_path):
+            # Una espressione per riga: stringa o oggetto con campo text
+            for record in iter_ndjson(file_path):
+                if isinstance(record, dict):
+                    if 'text' in record:
+                        yield record.get('timestamp'), record['text']
+                elif isinstance(record, str):
+                    yield None, record
+        elif file_path.endswith('.json'):
+            # Campi di un oggetto senza transcript, per il fallback
+            fields: Dict[str, Any] = {}
+            transcript = False
+            for path, value in iter_json(file_path, depth=1):
+                if not path:
+                    # Documento scalare o contenitore vuoto
+                    if value != []:
+                        yield None, str(value)
+                elif isinstance(path[0], int):
+                    # Lista di espressioni: stringhe o oggetti con campo text
+                    if isinstance(value, str):
+                        yield None, value
+                    elif isinstance(value, dict) and 'text' in value:
+                        yield value.get('timestamp'), value['text']
+                    else:
+                        yield None, str(value)
+                elif path[0] == 'transcript':
+                    # Oggetto con campo transcript
+                    transcript = True
+                    for line in value.splitlines():
+                        yield None, line
+                elif not transcript:
+                    fields[path[0]] = value
             
-            # Fallback: converti in stringa
-            return str(data)
+            # Fallback: oggetto senza transcript convertito in stringa
+            if fields and not transcript:
+                yield None, str(fields)
         else:
-            # Carica formato testo
             with open(file_path, 'r') as f:
-                return f.read()
\ No newline at end of file
+                for line in f:
+                    yield None, line.rstrip('\r\n')
+    
+    def _load_transcript_file(self, file_path: str) -> str:
+        """
+        Carica un singolo file di trascrizione
+        
+        Args:
+            file_path: Percorso al file
+            
+        Returns:
+            Contenuto testuale del file
+        """
+        return "\n".join(text for _, text in self._iter_utterances(file_path))
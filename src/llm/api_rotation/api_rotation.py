@@ -1,11 +1,20 @@
+import asyncio
 import importlib
 import os
-from typing import Dict, Any, Type, Optional
+import threading
+import time
+from typing import Dict, Any, Callable, List, Type, Optional
 from dotenv import load_dotenv
 
+from config.config_loader import ConfigLoader
+
 # Cache delle istanze
 _llm_instances_cache = {}
 _rotation_manager = None
+_rotation_lock = threading.Lock()
+# Client HTTP condivisi tra i client delle diverse key di un provider
+_http_clients: Dict[str, Any] = {}
+_http_clients_lock = threading.Lock()
 
 
 def get_llm_client(provider: str, client_class_path: str, **kwargs) -> Any:
@@ -37,19 +46,20 @@ def get_llm_client(provider: str, client_class_path: str, **kwargs) -> Any:
     module = importlib.import_module(module_path)
     client_class = getattr(module, class_name)
 
-    # Controlla se ci sono API key disponibili per la rotazione
+    # Con API key configurate, un client per key: le richieste vengono distribuite
+    # tra le key dal rotation manager, a ogni chiamata
     rotation_manager = get_rotation_manager()
-    if rotation_manager and provider in rotation_manager.get_available_providers():
-        # Usa l'API key dal rotation manager
-        api_key = rotation_manager.get_api_key(provider)
-        if api_key:
-            if provider == "openai":
-                kwargs["api_key"] = api_key
-            elif provider == "groq":
-                kwargs["api_key"] = api_key
-
-    # Crea l'istanza del client
-    client = client_class(**kwargs)
+    keys = rotation_manager.active_keys(provider) if rotation_manager else []
+    if keys:
+        from llm.api_rotation.client_pool import PooledLLMClient
+
+        if ConfigLoader().get_value("llm.pool.share_connections", True):
+            kwargs = _with_shared_http_clients(provider, kwargs)
+        clients = {key: client_class(**{**kwargs, "api_key": key}) for key in keys}
+        client = PooledLLMClient(provider, clients, rotation_manager)
+    else:
+        # Crea l'istanza del client (API key dalle variabili d'ambiente del client)
+        client = client_class(**kwargs)
 
     # Aggiungi l'istanza alla cache
     _llm_instances_cache[cache_key] = client
@@ -57,6 +67,29 @@ def get_llm_client(provider: str, client_class_path: str, **kwargs) -> Any:
     return client
 
 
+def _with_shared_http_clients(provider: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Aggiunge ai parametri del client un client HTTP (sync e async) condiviso per provider,
+    così che i client delle diverse key riusino lo stesso pool di connessioni.
+    L'autenticazione è per richiesta, quindi la condivisione non mescola le key.
+    """
+    try:
+        import httpx
+    except ImportError:
+        return kwargs
+
+    with _http_clients_lock:
+        shared = _http_clients.get(provider)
+        if shared is None:
+            shared = (httpx.Client(), httpx.AsyncClient())
+            _http_clients[provider] = shared
+
+    kwargs = dict(kwargs)
+    kwargs.setdefault("http_client", shared[0])
+    kwargs.setdefault("http_async_client", shared[1])
+    return kwargs
+
+
 def invalidate_cache():
     """
     Invalida la cache delle istanze LLM
@@ -65,17 +98,154 @@ def invalidate_cache():
     _llm_instances_cache = {}
 
 
+class TokenBucket:
+    """
+    Token bucket con ricarica continua: capacity unità disponibili al massimo,
+    ricaricate al ritmo di refill_per_second. Con capacity None il bucket è illimitato.
+    """
+
+    def __init__(self, capacity: Optional[float], refill_per_second: float, now: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if self.capacity is None:
+            return
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def headroom(self, now: float) -> float:
+        """Frazione della capacità disponibile (1.0 se il bucket è illimitato)."""
+        if self.capacity is None:
+            return 1.0
+        self._refill(now)
+        return max(0.0, self.tokens) / self.capacity
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Secondi da attendere prima che amount unità siano disponibili."""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        # Una richiesta più grande della capacità viene servita a bucket pieno
+        amount = min(amount, self.capacity)
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_per_second
+
+    def consume(self, amount: float, now: float):
+        """
+        Preleva amount unità; il saldo può diventare negativo (debito da ripagare).
+        Un amount negativo restituisce una stima in eccesso, fino alla capacità.
+        """
+        if self.capacity is None:
+            return
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self, now: float):
+        """Svuota il bucket, ad esempio dopo una risposta 429."""
+        if self.capacity is None:
+            return
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeyState:
+    """Stato di una API key: budget RPM/TPM, cooldown e ultimo utilizzo."""
+
+    def __init__(self, key: str, rpm: Optional[float], tpm: Optional[float], now: float):
+        self.key = key
+        self.requests = TokenBucket(rpm, (rpm or 0) / 60.0, now)
+        self.tokens = TokenBucket(tpm, (tpm or 0) / 60.0, now)
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.disabled = False
+        self.last_used = float("-inf")
+        self.in_flight = 0
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        """Secondi prima che la key possa servire una richiesta di tokens token."""
+        if self.disabled:
+            return float("inf")
+        return max(
+            self.cooldown_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+            0.0,
+        )
+
+    def headroom(self, now: float) -> float:
+        """Margine residuo: il minimo tra le frazioni disponibili di RPM e TPM."""
+        return min(self.requests.headroom(now), self.tokens.headroom(now))
+
+
 class ApiRotationManager:
     """
-    Gestisce la rotazione delle API keys tra diversi provider
+    Gestisce la rotazione delle API keys tra diversi provider.
+
+    Per ogni key tiene due token bucket (richieste al minuto e token al minuto) e
+    un eventuale cooldown dopo un errore 429. A ogni richiesta sceglie, tra le key
+    utilizzabili subito, quella con più margine (a parità, la meno usata di recente).
+    Le key rifiutate dal provider (401/403) vengono escluse. Tutte le operazioni sono
+    protette da un lock e non bloccano mai tenendolo, quindi il manager può essere
+    usato da più thread e da coroutine asyncio.
     """
 
-    def __init__(self):
-        self.providers = {
-            "openai": self._load_api_keys("OPENAI_API_KEY"),
-            "groq": self._load_api_keys("GROQ_API_KEY"),
+    def __init__(
+        self,
+        keys: Optional[Dict[str, List[str]]] = None,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        clock: Optional[Callable[[], float]] = None,
+        sleep: Optional[Callable[[float], None]] = None,
+    ):
+        """
+        Args:
+            keys: API keys per provider; se None vengono lette dalle variabili d'ambiente
+            limits: Limiti per key e provider ({"groq": {"rpm": 30, "tpm": 6000}});
+                    se None vengono letti da llm.<provider>.rate_limits
+            clock: Orologio monotono in secondi (iniettabile nei test)
+            sleep: Funzione di attesa bloccante (iniettabile nei test)
+        """
+        self._clock = clock or time.monotonic
+        self._sleep = sleep or time.sleep
+        self._lock = threading.Lock()
+
+        if keys is None:
+            keys = {
+                "openai": self._load_api_keys("OPENAI_API_KEY"),
+                "groq": self._load_api_keys("GROQ_API_KEY"),
+            }
+        self.providers = {provider: list(provider_keys) for provider, provider_keys in keys.items()}
+
+        if limits is None:
+            config = ConfigLoader()
+            limits = {
+                provider: config.get_value(f"llm.{provider}.rate_limits", {}) or {}
+                for provider in self.providers
+            }
+        self.limits = limits
+
+        # Attesa iniziale e massima dopo un 429 senza retry-after (backoff esponenziale)
+        self.base_cooldown = 1.0
+        self.max_cooldown = 60.0
+
+        now = self._clock()
+        self._states: Dict[str, Dict[str, KeyState]] = {
+            provider: {
+                key: KeyState(
+                    key,
+                    self.limits.get(provider, {}).get("rpm"),
+                    self.limits.get(provider, {}).get("tpm"),
+                    now,
+                )
+                for key in provider_keys
+            }
+            for provider, provider_keys in self.providers.items()
         }
-        self.current_index = {provider: 0 for provider in self.providers}
 
     def _load_api_keys(self, env_var_prefix: str) -> list:
         """
@@ -111,28 +281,273 @@ class ApiRotationManager:
         Returns:
             Lista di provider disponibili
         """
-        return [provider for provider, keys in self.providers.items() if keys]
+        with self._lock:
+            return [
+                provider
+                for provider, states in self._states.items()
+                if any(not state.disabled for state in states.values())
+            ]
+
+    def active_keys(self, provider: str) -> List[str]:
+        """
+        Restituisce le API keys non escluse di un provider
+
+        Args:
+            provider: Nome del provider
+
+        Returns:
+            Lista di API keys
+        """
+        with self._lock:
+            return [
+                state.key
+                for state in self._states.get(provider, {}).values()
+                if not state.disabled
+            ]
+
+    def get_api_key(self, provider: str, tokens: int = 0) -> Optional[str]:
+        """
+        Ottiene la key con più margine utilizzabile subito, senza attendere,
+        e ne consuma il budget
+
+        Args:
+            provider: Nome del provider
+            tokens: Token stimati della richiesta (prompt + risposta)
+
+        Returns:
+            API key o None se nessuna key è utilizzabile subito
+        """
+        key, _ = self._try_acquire(provider, tokens)
+        return key
 
-    def get_api_key(self, provider: str) -> Optional[str]:
+    def acquire_key(
+        self, provider: str, tokens: int = 0, timeout: Optional[float] = None
+    ) -> Optional[str]:
         """
-        Ottiene la prossima API key per il provider specificato
+        Come get_api_key, ma attende che una key abbia budget disponibile
 
         Args:
             provider: Nome del provider
+            tokens: Token stimati della richiesta
+            timeout: Attesa massima in secondi (None: senza limite)
 
         Returns:
-            API key o None se non disponibile
+            API key, oppure None se il provider non ha key valide o il timeout scade
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            key, wait = self._try_acquire(provider, tokens)
+            if key is not None or wait is None:
+                return key
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            self._sleep(wait)
+
+    async def aacquire_key(
+        self, provider: str, tokens: int = 0, timeout: Optional[float] = None
+    ) -> Optional[str]:
         """
-        if provider not in self.providers or not self.providers[provider]:
-            return None
+        Versione asincrona di acquire_key: l'attesa non blocca l'event loop
 
-        keys = self.providers[provider]
-        key = keys[self.current_index[provider]]
+        Args:
+            provider: Nome del provider
+            tokens: Token stimati della richiesta
+            timeout: Attesa massima in secondi (None: senza limite)
 
-        # Aggiorna l'indice per la rotazione
-        self.current_index[provider] = (self.current_index[provider] + 1) % len(keys)
+        Returns:
+            API key, oppure None se il provider non ha key valide o il timeout scade
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            key, wait = self._try_acquire(provider, tokens)
+            if key is not None or wait is None:
+                return key
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+    def release_key(self, provider: str, key: str, tokens_used: Optional[int] = None, tokens_estimated: int = 0):
+        """
+        Registra l'esito positivo di una richiesta
 
-        return key
+        Args:
+            provider: Nome del provider
+            key: API key usata
+            tokens_used: Token effettivamente consumati, se noti
+            tokens_estimated: Token stimati al momento dell'acquisizione
+        """
+        with self._lock:
+            state = self._state(provider, key)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            state.consecutive_throttles = 0
+            if tokens_used is not None:
+                # Corregge il budget TPM con il consumo reale
+                state.tokens.consume(tokens_used - tokens_estimated, self._clock())
+
+    def report_throttled(self, provider: str, key: str, retry_after: Optional[float] = None):
+        """
+        Registra una risposta 429: la key va in cooldown per retry_after secondi
+        o, se assente, per un backoff esponenziale
+
+        Args:
+            provider: Nome del provider
+            key: API key limitata
+            retry_after: Secondi indicati dal provider (header retry-after), se presenti
+        """
+        with self._lock:
+            state = self._state(provider, key)
+            if state is None:
+                return
+            now = self._clock()
+            state.in_flight = max(0, state.in_flight - 1)
+            state.consecutive_throttles += 1
+            if retry_after is None:
+                retry_after = min(
+                    self.max_cooldown,
+                    self.base_cooldown * 2 ** (state.consecutive_throttles - 1),
+                )
+            state.cooldown_until = max(state.cooldown_until, now + retry_after)
+            # Il provider ha già esaurito il budget: i bucket ripartono da zero
+            state.requests.drain(now)
+            state.tokens.drain(now)
+
+    def report_invalid(self, provider: str, key: str):
+        """
+        Esclude una key rifiutata dal provider (es. 401/403)
+
+        Args:
+            provider: Nome del provider
+            key: API key non valida
+        """
+        with self._lock:
+            state = self._state(provider, key)
+            if state is not None:
+                state.disabled = True
+                state.in_flight = max(0, state.in_flight - 1)
+
+    def report_error(self, provider: str, key: str, error: BaseException):
+        """
+        Classifica un'eccezione del client e aggiorna lo stato della key
+
+        Args:
+            provider: Nome del provider
+            key: API key usata
+            error: Eccezione sollevata dalla richiesta
+        """
+        status = error_status_code(error)
+        if status == 429 or "ratelimit" in type(error).__name__.lower():
+            self.report_throttled(provider, key, retry_after_from_error(error))
+        elif status in (401, 403):
+            self.report_invalid(provider, key)
+        else:
+            with self._lock:
+                state = self._state(provider, key)
+                if state is not None:
+                    state.in_flight = max(0, state.in_flight - 1)
+
+    def status(self, provider: str) -> List[Dict[str, Any]]:
+        """
+        Stato corrente delle key di un provider (le key sono abbreviate)
+
+        Args:
+            provider: Nome del provider
+
+        Returns:
+            Lista con margine, cooldown residuo e stato di ogni key
+        """
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "key": f"...{state.key[-4:]}",
+                    "headroom": round(state.headroom(now), 3),
+                    "cooldown": round(max(0.0, state.cooldown_until - now), 3),
+                    "in_flight": state.in_flight,
+                    "disabled": state.disabled,
+                }
+                for state in self._states.get(provider, {}).values()
+            ]
+
+    def _try_acquire(self, provider: str, tokens: int):
+        """
+        Prova ad acquisire una key
+
+        Returns:
+            (key, None) se acquisita, (None, attesa minima) se occorre attendere,
+            (None, None) se il provider non ha key valide
+        """
+        with self._lock:
+            states = [
+                state
+                for state in self._states.get(provider, {}).values()
+                if not state.disabled
+            ]
+            if not states:
+                return None, None
+
+            now = self._clock()
+            ready = [state for state in states if state.wait_time(tokens, now) <= 0]
+            if not ready:
+                return None, min(state.wait_time(tokens, now) for state in states)
+
+            best = max(ready, key=lambda state: (state.headroom(now), -state.in_flight, -state.last_used))
+            best.requests.consume(1, now)
+            best.tokens.consume(tokens, now)
+            best.last_used = now
+            best.in_flight += 1
+            return best.key, None
+
+    def _state(self, provider: str, key: str) -> Optional[KeyState]:
+        return self._states.get(provider, {}).get(key)
+
+
+def error_status_code(error: BaseException) -> Optional[int]:
+    """
+    Estrae il codice HTTP da un'eccezione dei client openai/groq/httpx, se presente
+
+    Args:
+        error: Eccezione sollevata dal client
+
+    Returns:
+        Codice di stato o None
+    """
+    for candidate in (error, getattr(error, "response", None)):
+        status = getattr(candidate, "status_code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after_from_error(error: BaseException) -> Optional[float]:
+    """
+    Legge l'header retry-after (in secondi) dalla risposta associata a un'eccezione
+
+    Args:
+        error: Eccezione sollevata dal client
+
+    Returns:
+        Secondi da attendere o None se non indicati
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            continue
+        return seconds / 1000.0 if header.endswith("-ms") else seconds
+    return None
 
 
 def get_rotation_manager() -> ApiRotationManager:
@@ -145,6 +560,8 @@ def get_rotation_manager() -> ApiRotationManager:
     global _rotation_manager
 
     if _rotation_manager is None:
-        _rotation_manager = ApiRotationManager()
+        with _rotation_lock:
+            if _rotation_manager is None:
+                _rotation_manager = ApiRotationManager()
 
     return _rotation_manager
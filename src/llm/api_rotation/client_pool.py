@@ -0,0 +1,219 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from llm.api_rotation.api_rotation import ApiRotationManager, error_status_code
+from llm.tokens import estimate_tokens
+
+# Errori per cui la richiesta viene ripetuta con un'altra key
+_RETRY_STATUS_CODES = {401, 403, 429}
+
+# Token di output riservati per richiesta quando i client non hanno max_tokens
+DEFAULT_OUTPUT_TOKENS = 512
+
+
+class PooledLLMClient(Runnable):
+    """
+    Client LLM che distribuisce ogni richiesta tra un client per API key.
+
+    I client sottostanti (uno per key dello stesso provider) vengono creati una sola
+    volta e riutilizzati, insieme ai loro pool di connessioni HTTP. A ogni chiamata
+    la key viene scelta dall'ApiRotationManager in base al budget residuo; se il
+    provider risponde 429 o rifiuta la key, la richiesta viene ripetuta su un'altra.
+    All'acquisizione vengono riservati i token del prompt più quelli di output
+    (max_tokens); al rilascio il budget è corretto con l'usage riportato dal provider.
+    Espone with_structured_output, invoke e ainvoke come un chat model LangChain,
+    per cui può essere usato al posto del client singolo (anche in una catena con |).
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        clients: Dict[str, Any],
+        rotation_manager: ApiRotationManager,
+        transform: Optional[Callable[[Any], Any]] = None,
+        acquire_timeout: Optional[float] = None,
+        unwrap_raw: bool = False,
+    ):
+        """
+        Args:
+            provider: Nome del provider (es. "openai", "groq")
+            clients: Client LangChain per API key
+            rotation_manager: Gestore che sceglie la key di ogni richiesta
+            transform: Funzione applicata a ogni client prima dell'uso
+                       (es. client.with_structured_output(schema))
+            acquire_timeout: Attesa massima per una key con budget disponibile
+            unwrap_raw: Se True i runnable restituiscono {"raw", "parsed", "parsing_error"}
+                        (include_raw) e al chiamante viene restituito solo "parsed"
+        """
+        if not clients:
+            raise ValueError(f"Nessun client configurato per il provider {provider}")
+
+        self.provider = provider
+        self.clients = clients
+        self.rotation_manager = rotation_manager
+        self.transform = transform
+        self.acquire_timeout = acquire_timeout
+        self.unwrap_raw = unwrap_raw
+
+        # Runnable derivati per key, creati alla prima richiesta che usa la key
+        self._runnables: Dict[str, Any] = {}
+        # Client strutturati derivati, per (schema, parametri): restano validi tra le
+        # richieste insieme ai loro runnable per key
+        self._derived: Dict[Tuple[Any, str], "PooledLLMClient"] = {}
+        self._lock = threading.Lock()
+
+        # Attributi del modello, letti ad esempio per la chiave della cache delle risposte
+        first = next(iter(clients.values()))
+        self.model_name = getattr(first, "model_name", None) or getattr(first, "model", None)
+        self.temperature = getattr(first, "temperature", None)
+        self.output_tokens = getattr(first, "max_tokens", None) or DEFAULT_OUTPUT_TOKENS
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> "PooledLLMClient":
+        """
+        Restituisce un client pooled che produce output strutturati
+
+        Args:
+            schema: Classe Pydantic dell'output
+            **kwargs: Parametri aggiuntivi per with_structured_output dei client
+
+        Returns:
+            PooledLLMClient che condivide client e gestore delle key, creato alla
+            prima chiamata con lo stesso schema e parametri e poi riutilizzato
+        """
+        # Gli schemi JSON (dizionari) non sono hashable: vengono indicizzati per repr
+        schema_key = schema if isinstance(schema, type) else repr(schema)
+        memo_key = (schema_key, repr(sorted(kwargs.items())))
+        with self._lock:
+            derived = self._derived.get(memo_key)
+            if derived is None:
+                derived = self._derive(schema, kwargs)
+                self._derived[memo_key] = derived
+            return derived
+
+    def _derive(self, schema: Any, kwargs: Dict[str, Any]) -> "PooledLLMClient":
+        """Crea il client pooled strutturato per uno schema."""
+        previous = self.transform
+        # Il messaggio grezzo porta l'usage_metadata con cui correggere il budget TPM
+        unwrap_raw = not kwargs.get("include_raw", False)
+
+        def transform(client):
+            if previous is not None:
+                client = previous(client)
+            if unwrap_raw:
+                return client.with_structured_output(schema, **{**kwargs, "include_raw": True})
+            return client.with_structured_output(schema, **kwargs)
+
+        return PooledLLMClient(
+            self.provider,
+            self.clients,
+            self.rotation_manager,
+            transform,
+            self.acquire_timeout,
+            unwrap_raw,
+        )
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        tokens = estimate_tokens(_input_text(input)) + self.output_tokens
+        attempts = self._max_attempts()
+
+        for attempt in range(attempts):
+            key = self.rotation_manager.acquire_key(
+                self.provider, tokens, timeout=self.acquire_timeout
+            )
+            if key is None:
+                raise ValueError(
+                    f"Nessuna API key disponibile per il provider {self.provider}"
+                )
+            try:
+                result = self._runnable(key).invoke(input, config, **kwargs)
+            except Exception as e:
+                self.rotation_manager.report_error(self.provider, key, e)
+                if attempt + 1 < attempts and error_status_code(e) in _RETRY_STATUS_CODES:
+                    continue
+                raise
+            return self._release(key, result, tokens)
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        tokens = estimate_tokens(_input_text(input)) + self.output_tokens
+        attempts = self._max_attempts()
+
+        for attempt in range(attempts):
+            key = await self.rotation_manager.aacquire_key(
+                self.provider, tokens, timeout=self.acquire_timeout
+            )
+            if key is None:
+                raise ValueError(
+                    f"Nessuna API key disponibile per il provider {self.provider}"
+                )
+            try:
+                result = await self._runnable(key).ainvoke(input, config, **kwargs)
+            except Exception as e:
+                self.rotation_manager.report_error(self.provider, key, e)
+                if attempt + 1 < attempts and error_status_code(e) in _RETRY_STATUS_CODES:
+                    continue
+                raise
+            return self._release(key, result, tokens)
+
+    def _release(self, key: str, result: Any, tokens_estimated: int) -> Any:
+        """Rilascia la key con i token effettivamente usati e restituisce il risultato."""
+        self.rotation_manager.release_key(
+            self.provider,
+            key,
+            tokens_used=_usage_tokens(result),
+            tokens_estimated=tokens_estimated,
+        )
+        if self.unwrap_raw and isinstance(result, dict) and "parsed" in result:
+            if result.get("parsing_error") is not None:
+                raise result["parsing_error"]
+            return result["parsed"]
+        return result
+
+    def _runnable(self, key: str) -> Any:
+        """Restituisce il client (trasformato) associato a una key."""
+        with self._lock:
+            runnable = self._runnables.get(key)
+            if runnable is None:
+                runnable = self.clients[key]
+                if self.transform is not None:
+                    runnable = self.transform(runnable)
+                self._runnables[key] = runnable
+            return runnable
+
+    def _max_attempts(self) -> int:
+        # Un tentativo per key, più uno per una key tornata disponibile dopo il cooldown
+        return len(self.clients) + 1
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    """Token totali riportati dal provider (usage_metadata), se disponibili."""
+    if isinstance(result, dict) and "raw" in result:
+        result = result["raw"]
+    usage = getattr(result, "usage_metadata", None)
+    if not usage:
+        return None
+    total = usage.get("total_tokens")
+    if total is None:
+        total = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return int(total)
+
+
+def _input_text(input: Any) -> str:
+    """Testo di un input LangChain (stringa, messaggi o prompt value), per stimarne i token."""
+    if isinstance(input, str):
+        return input
+    if hasattr(input, "to_string"):
+        return input.to_string()
+    if isinstance(input, (list, tuple)):
+        return "\n".join(_input_text(item) for item in input)
+    if isinstance(input, dict):
+        return "\n".join(_input_text(value) for value in input.values())
+    content = getattr(input, "content", None)
+    if isinstance(content, str):
+        return content
+    return str(input)
@@ -0,0 +1,242 @@
+import heapq
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config.config_loader import ConfigLoader
+from llm.tokens import estimate_tokens
+
+
+def _default_omitted_text(count: int) -> str:
+    return f"... ({count} elementi omessi per limiti di lunghezza)"
+
+
+class _Counter:
+    """Iteratore che conta gli elementi prodotti."""
+
+    def __init__(self, items: Iterable[Any]):
+        self._items = iter(items)
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Any]:
+        for item in self._items:
+            self.count += 1
+            yield item
+
+
+class _Section:
+    """Sezione del prompt in attesa di essere assemblata."""
+
+    def __init__(
+        self,
+        name: str,
+        items: Iterable[Any],
+        header: str,
+        footer: str,
+        separator: str,
+        priority: int,
+        formatter: Optional[Callable[[Any], str]],
+        rank: Optional[Callable[[Any], Any]],
+        omitted_text: Callable[[int], str],
+        required: bool,
+    ):
+        self.name = name
+        self.items = items
+        self.header = header
+        self.footer = footer
+        self.separator = separator
+        self.priority = priority
+        self.formatter = formatter
+        self.rank = rank
+        self.omitted_text = omitted_text
+        self.required = required
+
+
+class PromptBuilder:
+    """
+    Assembla un prompt a sezioni rispettando un budget di token.
+
+    Le sezioni obbligatorie (istruzioni, intestazioni) sono sempre incluse; le altre
+    ricevono il budget residuo in ordine di priorità. All'interno di una sezione gli
+    elementi vengono scelti nell'ordine dato o, se indicata, in base alla funzione
+    rank (ad esempio la recenza); quelli esclusi sono riassunti da una riga finale.
+    Gli elementi vengono formattati solo finché c'è budget, le parti sono raccolte
+    in una lista e unite una sola volta: il costo è lineare nella dimensione del prompt.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        """
+        Args:
+            max_tokens: Budget di token del prompt (default: llm.prompt.max_tokens)
+        """
+        self.max_tokens = max_tokens or ConfigLoader().get_value("llm.prompt.max_tokens", 8000)
+        self._sections: List[_Section] = []
+
+        # Per ogni sezione: (elementi inclusi, elementi totali), compilato da build()
+        self.report: Dict[str, Tuple[int, int]] = {}
+        self.token_count = 0
+
+    def add_text(self, text: str, name: Optional[str] = None, priority: Optional[int] = None):
+        """
+        Aggiunge un blocco di testo. Senza priorità il blocco è obbligatorio e viene
+        sempre incluso; con una priorità viene incluso solo se c'è budget.
+
+        Args:
+            text: Testo del blocco
+            name: Nome del blocco nel report
+            priority: Priorità del blocco, o None per un blocco obbligatorio
+        """
+        self._sections.append(
+            _Section(
+                name or f"text_{len(self._sections)}",
+                [text],
+                "",
+                "",
+                "",
+                priority if priority is not None else 0,
+                None,
+                None,
+                lambda count: "",
+                priority is None,
+            )
+        )
+
+    def add_section(
+        self,
+        name: str,
+        items: Iterable[Any],
+        header: str = "",
+        footer: str = "\n",
+        separator: str = "\n",
+        priority: int = 0,
+        formatter: Optional[Callable[[Any], str]] = None,
+        rank: Optional[Callable[[Any], Any]] = None,
+        omitted_text: Optional[Callable[[int], str]] = None,
+    ):
+        """
+        Aggiunge una sezione composta da elementi, troncabile
+
+        Args:
+            name: Nome della sezione nel report
+            items: Elementi della sezione (stringhe o valori da formattare); può essere
+                   un generatore, consumato solo per quanto serve
+            header: Testo prima degli elementi (omesso se nessun elemento è incluso)
+            footer: Testo dopo gli elementi
+            separator: Separatore tra gli elementi e prima della riga di omissione
+            priority: Priorità nell'assegnazione del budget (più alta = prima)
+            formatter: Funzione che converte un elemento in testo
+            rank: Chiave di rilevanza: gli elementi con chiave maggiore sono scelti per primi
+                  (l'ordine di uscita resta quello originale)
+            omitted_text: Testo che riassume il numero di elementi esclusi
+        """
+        self._sections.append(
+            _Section(
+                name,
+                items,
+                header,
+                footer,
+                separator,
+                priority,
+                formatter,
+                rank,
+                omitted_text or _default_omitted_text,
+                False,
+            )
+        )
+
+    def build(self) -> str:
+        """
+        Assembla il prompt entro il budget
+
+        Returns:
+            Testo del prompt
+        """
+        rendered: List[Optional[str]] = [None] * len(self._sections)
+        used = 0
+
+        # Prima i blocchi obbligatori, poi le sezioni per priorità decrescente
+        order = sorted(
+            range(len(self._sections)),
+            key=lambda index: (
+                not self._sections[index].required,
+                -self._sections[index].priority,
+                index,
+            ),
+        )
+
+        for index in order:
+            section = self._sections[index]
+            if section.required:
+                text = "".join(section.items)
+                rendered[index] = text
+                used += estimate_tokens(text)
+                self.report[section.name] = (1, 1)
+                continue
+
+            text, tokens = self._render_section(section, self.max_tokens - used)
+            rendered[index] = text
+            used += tokens
+
+        self.token_count = used
+        return "".join(text for text in rendered if text)
+
+    def _render_section(self, section: _Section, budget: int) -> Tuple[str, int]:
+        """Rende una sezione entro il budget, restituendo testo e token usati."""
+        format_item = section.formatter or str
+        fixed = estimate_tokens(section.header) + estimate_tokens(section.footer)
+        separator_tokens = estimate_tokens(section.separator)
+
+        # Riserva lo spazio per la riga di omissione, restituito se tutto entra
+        reserve = estimate_tokens(section.omitted_text(10 ** 6)) + separator_tokens
+        available = budget - fixed - reserve
+
+        if section.rank is not None:
+            # Ogni elemento oltre il primo costa almeno un token più il separatore, per
+            # cui più di limit elementi non entrano nel budget: la selezione scorre gli
+            # elementi una volta, tenendo in memoria solo i limit più rilevanti
+            limit = max(0, available) // (1 + separator_tokens) + 1
+            counter = _Counter(section.items)
+            candidates = heapq.nlargest(
+                limit, enumerate(counter), key=lambda entry: section.rank(entry[1])
+            )
+            iterator = iter(candidates)
+            total: Optional[int] = counter.count
+        else:
+            iterator = enumerate(section.items)
+            total = None
+
+        chosen: List[Tuple[int, str]] = []
+        spent = 0
+        taken = 0
+        exhausted = True
+        for position, item in iterator:
+            text = format_item(item)
+            cost = estimate_tokens(text) + (separator_tokens if chosen else 0)
+            if spent + cost > available:
+                exhausted = False
+                # Conta gli elementi restanti senza formattarli
+                remaining = 1 + sum(1 for _ in iterator)
+                break
+            chosen.append((position, text))
+            spent += cost
+            taken += 1
+
+        if total is None:
+            total = taken + (0 if exhausted else remaining)
+        # Con rank, gli elementi esclusi dai candidati sono contati da total
+        remaining = total - taken
+
+        self.report[section.name] = (taken, total)
+        if not chosen:
+            # Nessun elemento entra: la sezione è omessa
+            return "", 0
+
+        if section.rank is not None:
+            chosen.sort()
+
+        parts = [section.header, section.separator.join(text for _, text in chosen)]
+        tokens = fixed + spent
+        if remaining:
+            note = section.omitted_text(remaining)
+            parts.append(section.separator + note)
+            tokens += separator_tokens + estimate_tokens(note)
+        parts.append(section.footer)
+        return "".join(parts), tokens
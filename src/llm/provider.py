@@ -3,14 +3,26 @@ from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers.pydantic import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from typing import Any, Type, TypeVar, Dict, List
+import asyncio
+import threading
+import weakref
 from llm.api_rotation.api_rotation import (
     get_llm_client,
     invalidate_cache,
     get_rotation_manager,
 )
+from llm.response_cache import get_response_cache
+from llm.standin import StandInChatModel
 
 # Cache per istanza modello
 _model_instance = None
+_model_lock = threading.Lock()
+
+# Limiti di richieste LLM concorrenti per provider (llm.<provider>.max_concurrency):
+# semafori per i thread e, per ogni event loop, semafori asyncio
+_provider_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_async_provider_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_semaphore_lock = threading.Lock()
 
 T = TypeVar("T")
 
@@ -18,14 +30,21 @@ T = TypeVar("T")
 def get_model() -> BaseChatModel:
     """
     Ottiene l'istanza del modello LLM in base alla configurazione.
-    Usa una cache per evitare di creare istanze multiple.
+    Usa una cache per evitare di creare istanze multiple. Con più API key
+    configurate restituisce un PooledLLMClient, che espone la stessa interfaccia.
 
     Returns:
         Istanza del modello LLM
     """
     global _model_instance
 
-    if _model_instance is None:
+    if _model_instance is not None:
+        return _model_instance
+
+    with _model_lock:
+        if _model_instance is not None:
+            return _model_instance
+
         config = ConfigLoader()
         provider = config.get_llm_provider()
 
@@ -39,6 +58,9 @@ def get_model() -> BaseChatModel:
                 max_tokens=config.get_value("llm.openai.max_tokens", 2048),
                 request_timeout=config.get_value("llm.openai.timeout", 120),
             )
+        elif provider == "standin":
+            # Modello sostitutivo senza rete, per l'esecuzione locale e i test
+            _model_instance = StandInChatModel()
         elif provider == "groq":
             _model_instance = get_llm_client(
                 provider="groq",
@@ -64,10 +86,24 @@ def get_model() -> BaseChatModel:
     return _model_instance
 
 
+def set_model(model: Any):
+    """
+    Imposta l'istanza del modello restituita da get_model, ad esempio uno
+    StandInChatModel con risposte predefinite
+
+    Args:
+        model: Modello con l'interfaccia with_structured_output
+    """
+    global _model_instance
+    with _model_lock:
+        _model_instance = model
+
+
 def reset_model_cache():
     """Resetta la cache del modello."""
     global _model_instance
-    _model_instance = None
+    with _model_lock:
+        _model_instance = None
     # Invalida anche la cache della libreria di rotazione
     invalidate_cache()
 
@@ -126,3 +162,133 @@ def get_llm_with_structured_output(output_class: Type[T]):
     """
     model = get_model()
     return model.with_structured_output(output_class)
+
+
+def invoke_structured(output_class: Type[T], prompt: Any, use_cache: bool = True) -> T:
+    """
+    Invoca il LLM con output strutturato, passando dalla cache persistente delle risposte.
+
+    Args:
+        output_class: Classe Pydantic per il parsing
+        prompt: Prompt (stringa o lista di messaggi)
+        use_cache: Se False la cache viene ignorata per questa chiamata
+
+    Returns:
+        Risposta strutturata
+    """
+    model = get_model()
+    llm = model.with_structured_output(output_class)
+
+    cache, key = _cache_lookup_key(model, output_class, prompt, use_cache)
+    if cache is not None:
+        cached = cache.get(key, output_class)
+        if cached is not None:
+            return cached
+
+    # Solo le chiamate effettive al provider occupano uno slot di concorrenza
+    with _provider_semaphore(get_current_provider()):
+        result = llm.invoke(prompt)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+async def ainvoke_structured(
+    output_class: Type[T], prompt: Any, use_cache: bool = True
+) -> T:
+    """
+    Versione asincrona di invoke_structured, basata su ainvoke: molte richieste
+    possono essere in corso sullo stesso event loop senza un thread per richiesta.
+
+    Args:
+        output_class: Classe Pydantic per il parsing
+        prompt: Prompt (stringa o lista di messaggi)
+        use_cache: Se False la cache viene ignorata per questa chiamata
+
+    Returns:
+        Risposta strutturata
+    """
+    model = get_model()
+    llm = model.with_structured_output(output_class)
+
+    # La prima chiamata apre la cache e ne indicizza la directory
+    cache, key = await asyncio.to_thread(
+        _cache_lookup_key, model, output_class, prompt, use_cache
+    )
+    if cache is not None:
+        # Letture e scritture su disco (e il lock della cache) restano fuori dall'event loop
+        cached = await asyncio.to_thread(cache.get, key, output_class)
+        if cached is not None:
+            return cached
+
+    async with _async_provider_semaphore(get_current_provider()):
+        result = await llm.ainvoke(prompt)
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, result)
+    return result
+
+
+def _cache_lookup_key(model: BaseChatModel, output_class: Type[T], prompt: Any, use_cache: bool):
+    """Restituisce la cache delle risposte e la chiave della richiesta, o (None, None)."""
+    cache = get_response_cache() if use_cache else None
+    if cache is None:
+        return None, None
+
+    key = cache.make_key(
+        _model_name(model), getattr(model, "temperature", None), output_class, prompt
+    )
+    return cache, key
+
+
+def get_current_provider() -> str:
+    """
+    Restituisce il provider effettivamente usato da get_model
+
+    Returns:
+        Nome del provider ("openai" o "groq")
+    """
+    provider = ConfigLoader().get_llm_provider()
+    return provider if provider in ("openai", "groq") else "groq"
+
+
+def _provider_limit(provider: str) -> int:
+    """
+    Numero massimo di richieste concorrenti verso il provider. Il default è di
+    4 richieste per API key, così che il throughput cresca con le key configurate.
+    """
+    keys = len(get_rotation_manager().active_keys(provider))
+    default = 4 * max(1, keys)
+    return max(1, int(ConfigLoader().get_value(f"llm.{provider}.max_concurrency", default)))
+
+
+def _provider_semaphore(provider: str) -> threading.BoundedSemaphore:
+    """Semaforo condiviso tra i thread che limita le richieste concorrenti al provider."""
+    with _semaphore_lock:
+        semaphore = _provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(_provider_limit(provider))
+            _provider_semaphores[provider] = semaphore
+        return semaphore
+
+
+def _async_provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """Semaforo dell'event loop corrente che limita le richieste concorrenti al provider."""
+    loop = asyncio.get_running_loop()
+    with _semaphore_lock:
+        semaphores = _async_provider_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(_provider_limit(provider))
+            semaphores[provider] = semaphore
+        return semaphore
+
+
+def _model_name(model: BaseChatModel) -> str:
+    """Restituisce il nome del modello usato come parte della chiave di cache."""
+    for attribute in ("model_name", "model"):
+        name = getattr(model, attribute, None)
+        if isinstance(name, str):
+            return name
+    return type(model).__name__
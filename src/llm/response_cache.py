@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from config.config_loader import ConfigLoader
+
+T = TypeVar("T")
+
+# Radice del repository: i percorsi relativi della cache sono risolti a partire da qui,
+# indipendentemente dalla directory corrente (main.py e service.py girano da src/)
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CACHE_DIR = os.path.join(_REPO_ROOT, "data", "processed", "llm_cache")
+
+# Cache globale delle risposte
+_response_cache = None
+
+
+class LLMResponseCache:
+    """
+    Cache persistente su disco delle risposte LLM strutturate, indirizzata per contenuto.
+
+    La chiave è l'hash SHA-256 di (nome modello, temperatura, schema di output, prompt);
+    ogni risposta è salvata in un file JSON. Le voci meno usate di recente vengono
+    rimosse quando si superano il numero massimo di voci o la dimensione massima.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        config = ConfigLoader()
+        cache_dir = cache_dir or config.get_value("llm.cache.dir", DEFAULT_CACHE_DIR)
+        self.cache_dir = os.path.join(_REPO_ROOT, os.path.expanduser(cache_dir))
+        self.max_entries = max_entries or config.get_value("llm.cache.max_entries", 10000)
+        self.max_bytes = max_bytes or config.get_value(
+            "llm.cache.max_bytes", 256 * 1024 * 1024
+        )
+
+        self._lock = threading.RLock()
+        # Indice LRU: chiave -> dimensione del file, dalla meno alla più recente
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(
+        model_name: str, temperature: Any, output_class: Type[T], prompt: Any
+    ) -> str:
+        """
+        Calcola la chiave di cache di una richiesta
+
+        Args:
+            model_name: Nome del modello
+            temperature: Temperatura di campionamento
+            output_class: Classe Pydantic dell'output strutturato
+            prompt: Prompt (stringa o lista di messaggi)
+
+        Returns:
+            Hash esadecimale della richiesta
+        """
+        if hasattr(output_class, "model_json_schema"):
+            schema = output_class.model_json_schema()
+        else:
+            schema = output_class.schema()
+
+        payload = json.dumps(
+            {
+                "model": model_name,
+                "temperature": temperature,
+                "schema": schema,
+                "prompt": prompt,
+            },
+            sort_keys=True,
+            default=str,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, output_class: Type[T]) -> Optional[T]:
+        """
+        Restituisce la risposta in cache, se presente
+
+        Args:
+            key: Chiave della richiesta
+            output_class: Classe Pydantic con cui ricostruire la risposta
+
+        Returns:
+            Risposta ricostruita o None in caso di miss
+        """
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if hasattr(output_class, "model_validate"):
+                    value = output_class.model_validate(data["response"])
+                else:
+                    value = output_class.parse_obj(data["response"])
+            except (OSError, ValueError, KeyError):
+                # Voce illeggibile o non più compatibile con lo schema: viene scartata
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any):
+        """
+        Salva una risposta in cache, rimuovendo le voci meno recenti se necessario
+
+        Args:
+            key: Chiave della richiesta
+            value: Risposta (modello Pydantic)
+        """
+        response = value.model_dump() if hasattr(value, "model_dump") else value.dict()
+        content = json.dumps({"response": response}, ensure_ascii=False, default=str)
+
+        with self._lock:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Scrittura atomica: un lettore concorrente non vede mai un file parziale
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+            size = os.path.getsize(path)
+            self._total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Statistiche di utilizzo della cache
+
+        Returns:
+            Dizionario con hit, miss, evizioni, voci e dimensione totale
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+            }
+
+    def clear(self):
+        """Rimuove tutte le voci della cache."""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def _evict(self):
+        """Rimuove le voci meno recenti finché la cache rientra nei limiti."""
+        while self._index and (
+            len(self._index) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key = next(iter(self._index))
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _load_index(self):
+        """Ricostruisce l'indice LRU dai file presenti, ordinati per ultimo accesso."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(root, filename))
+                entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key: str) -> str:
+        # Sottodirectory per prefisso, per non avere troppi file in una sola directory
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """
+    Ottiene l'istanza della cache delle risposte LLM
+
+    Returns:
+        Istanza LLMResponseCache o None se la cache è disabilitata (llm.cache.enabled)
+    """
+    global _response_cache
+
+    if _response_cache is None:
+        if not ConfigLoader().get_value("llm.cache.enabled", True):
+            return None
+        _response_cache = LLMResponseCache()
+
+    return _response_cache
+
+
+def set_response_cache(cache: Optional[LLMResponseCache]):
+    """
+    Imposta l'istanza restituita da get_response_cache, ad esempio una cache in una
+    directory temporanea per i test
+
+    Args:
+        cache: Cache da usare, o None per ricrearla dalla configurazione al prossimo uso
+    """
+    global _response_cache
+    _response_cache = cache
@@ -0,0 +1,72 @@
+from typing import Any, Callable, Optional, Type, TypeVar, get_origin
+
+T = TypeVar("T")
+
+# Valore vuoto per il tipo di un campo dello schema di output
+_EMPTY_VALUES = {list: [], dict: {}, str: "", float: 0.0, int: 0, bool: False}
+
+
+class StandInChatModel:
+    """
+    Modello sostitutivo, senza rete, con la stessa interfaccia usata da invoke_structured
+    (with_structured_output, invoke, ainvoke).
+
+    Serve a eseguire il sistema in locale e nei test senza un provider LLM: per
+    default ogni richiesta restituisce un'istanza vuota dello schema di output
+    (nessun triplet, nessun trigger); una funzione responder può fornire risposte
+    specifiche per schema e prompt.
+    """
+
+    model_name = "standin"
+    temperature = 0.0
+
+    def __init__(self, responder: Optional[Callable[[Type[Any], Any], Any]] = None):
+        """
+        Args:
+            responder: Funzione (schema di output, prompt) -> risposta; se restituisce
+                       None viene usata l'istanza vuota dello schema
+        """
+        self.responder = responder
+        self.calls = 0
+
+    def with_structured_output(self, output_class: Type[T]) -> "_StandInStructured":
+        return _StandInStructured(self, output_class)
+
+    def respond(self, output_class: Type[T], prompt: Any) -> T:
+        """Risposta a una richiesta strutturata."""
+        self.calls += 1
+        if self.responder is not None:
+            response = self.responder(output_class, prompt)
+            if response is not None:
+                return response
+        return empty_response(output_class)
+
+
+class _StandInStructured:
+    def __init__(self, model: StandInChatModel, output_class: Type[Any]):
+        self.model = model
+        self.output_class = output_class
+
+    def invoke(self, prompt: Any) -> Any:
+        return self.model.respond(self.output_class, prompt)
+
+    async def ainvoke(self, prompt: Any) -> Any:
+        return self.model.respond(self.output_class, prompt)
+
+
+def empty_response(output_class: Type[T]) -> T:
+    """
+    Istanza dello schema con campi vuoti (liste e dizionari vuoti, stringhe vuote, zero)
+
+    Args:
+        output_class: Classe Pydantic dello schema di output
+
+    Returns:
+        Istanza vuota
+    """
+    fields = getattr(output_class, "model_fields", None) or output_class.__fields__
+    values = {}
+    for name, field in fields.items():
+        annotation = getattr(field, "annotation", None) or getattr(field, "outer_type_", None)
+        values[name] = _EMPTY_VALUES.get(get_origin(annotation) or annotation)
+    return output_class(**values)
@@ -0,0 +1,25 @@
+import re
+
+# Rapporto medio caratteri/token dei tokenizer BPE per testo misto inglese/italiano
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Stima il numero di token di un testo senza dipendere dal tokenizer del provider.
+    Usa il massimo tra la stima per caratteri e il numero di parole, così da non
+    sottostimare testi con molte parole brevi.
+
+    Args:
+        text: Testo da misurare
+
+    Returns:
+        Numero stimato di token
+    """
+    if not text:
+        return 0
+    by_chars = (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    by_words = len(_WORD_RE.findall(text))
+    return max(by_chars, by_words)
@@ -3,7 +3,9 @@ import json
 import os
 from config.config_loader import ConfigLoader
 from data_layer.data_manager import DataManager
+from pdb.analysis_scheduler import AnalysisRun, AnalysisScheduler
 from pdb.brain import PersonalDigitalBrain
+from pdb.stream_ingestor import StreamIngestor
 
 
 def main():
@@ -16,6 +18,15 @@ def main():
     parser.add_argument("--sensors", help="Percorso ai dati sensori")
     parser.add_argument("--apps", help="Percorso ai dati applicazioni")
     parser.add_argument("--output", help="Percorso per salvare risultati")
+    parser.add_argument(
+        "--state",
+        help="Directory dello stato persistito: elabora solo i dati nuovi dall'ultima esecuzione (default: pdb.state_dir)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Modalità continua: segue i feed JSONL indicati da --sensors e --voice fino a Ctrl-C",
+    )
     args = parser.parse_args()
 
     config = ConfigLoader()
@@ -24,14 +35,26 @@ def main():
 
     print("Inizializzazione del sistema Human Digital Twin...")
 
+    # Ingestione incrementale: grafo e watermark dell'esecuzione precedente
+    state_dir = args.state or config.get_value("pdb.state_dir")
+    checkpoint = None
+    if state_dir:
+        if brain.load_state(state_dir):
+            print(f"Stato ripristinato da {state_dir}: {len(brain.knowledge_graph)} triplet")
+        checkpoint = brain.checkpoint
+
+    if args.stream:
+        run_stream(args, data_manager, brain, state_dir)
+        return
+
     # Carica dati da diverse fonti
     print("Caricamento dati non strutturati...")
-    voice_data = data_manager.load_voice_data(args.voice)
-    profile_data = data_manager.load_profile_data(args.profile)
+    voice_data = data_manager.load_voice_data(args.voice, checkpoint)
+    profile_data = data_manager.load_profile_data(args.profile, checkpoint)
 
     print("Caricamento dati strutturati...")
-    sensor_data = data_manager.load_sensor_data(args.sensors)
-    app_data = data_manager.load_app_data(args.apps)
+    sensor_data = data_manager.load_sensor_data(args.sensors, checkpoint)
+    app_data = data_manager.load_app_data(args.apps, checkpoint)
 
     # Elabora dati nel Personal Digital Brain
     print("Elaborazione dati non strutturati nel Personal Digital Brain...")
@@ -40,6 +63,10 @@ def main():
     print("Elaborazione dati strutturati nel Personal Digital Brain...")
     brain.process_structured_data(sensor_data, app_data)
 
+    if state_dir:
+        brain.save_state(state_dir)
+        print(f"Stato salvato in {state_dir}")
+
     # Identifica trigger di intervento
     print(
         "Analisi del knowledge graph per identificare potenziali trigger di intervento..."
@@ -66,5 +93,52 @@ def main():
         print(f"Risultati salvati in {args.output}")
 
 
+def run_stream(args, data_manager: DataManager, brain: PersonalDigitalBrain, state_dir):
+    """
+    Ingestione continua: profilo e dati app sono caricati una volta, sensori e voce
+    vengono seguiti come feed JSONL e inseriti nel grafo a micro-batch
+    """
+    checkpoint = brain.checkpoint
+    if args.profile:
+        brain.process_unstructured_data("", data_manager.load_profile_data(args.profile, checkpoint))
+    if args.apps:
+        brain.process_structured_data({}, data_manager.load_app_data(args.apps, checkpoint))
+
+    ingestor = StreamIngestor(
+        brain,
+        sensor_path=args.sensors,
+        voice_path=args.voice,
+        state_dir=state_dir,
+    )
+
+    # Analisi pianificata in base alle modifiche del grafo, invece che a ogni batch
+    scheduler = None
+    if ConfigLoader().get_value("analysis.scheduler.enabled", True):
+        scheduler = AnalysisScheduler(brain, on_result=print_scheduled_run)
+        scheduler.start()
+
+    print("Ingestione continua avviata (Ctrl-C per terminare)...")
+    try:
+        ingestor.run(report_interval=ConfigLoader().get_value("stream.report_interval", 30))
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+    print(ingestor.format_stats())
+    if state_dir:
+        print(f"Stato salvato in {state_dir}")
+
+
+def print_scheduled_run(run: AnalysisRun):
+    """Stampa l'esito di un'analisi eseguita dallo scheduler"""
+    if run.result is None:
+        return
+    print(
+        f"\n=== Analisi ({run.reason}, punteggio {run.score:.1f}): "
+        f"{len(run.result.identified_triggers)} trigger ==="
+    )
+    for trigger in run.result.identified_triggers:
+        print(f"- {trigger.trigger_type} ({trigger.confidence}): {trigger.description}")
+
+
 if __name__ == "__main__":
     main()
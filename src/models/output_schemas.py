@@ -16,6 +16,25 @@ class TripletList(BaseModel):
     triplets: List[Triple] = Field(..., description="List of extracted triplets")
 
 
+class DocumentTriplets(BaseModel):
+    """Represents the triplets extracted from one document of a batch"""
+
+    document_id: str = Field(
+        ..., description="ID of the document the triplets were extracted from"
+    )
+    triplets: List[Triple] = Field(
+        ..., description="List of triplets extracted from this document"
+    )
+
+
+class BatchTripletList(BaseModel):
+    """Represents the triplets extracted from a batch of documents, grouped by document"""
+
+    documents: List[DocumentTriplets] = Field(
+        ..., description="Extracted triplets for each document in the batch"
+    )
+
+
 class InterventionTrigger(BaseModel):
     """Represents an identified intervention trigger"""
 
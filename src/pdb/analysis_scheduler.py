@@ -0,0 +1,305 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.config_loader import ConfigLoader
+from data_layer.structured.time_series import TimeSeries
+from models.output_schemas import AnalysisResult
+
+# Peso di una riga aggiunta al grafo, per fonte; "other" vale per le modifiche
+# rilevate solo dal contatore di versione (inserimenti diretti nello store)
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "voice": 5.0,
+    "profile": 5.0,
+    "app": 1.0,
+    "sensor": 0.05,
+    "other": 1.0,
+}
+
+
+class AnalysisRun:
+    """Analisi eseguita dallo scheduler, con il motivo e le modifiche che l'hanno causata."""
+
+    def __init__(self, reason: str, score: float, changes: Dict[str, int], version: int, significant: int):
+        self.reason = reason
+        self.score = score
+        self.changes = changes
+        self.version = version
+        self.significant = significant
+        self.started = time.time()
+        self.seconds = 0.0
+        self.result: Optional[AnalysisResult] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "reason": self.reason,
+            "score": round(self.score, 3),
+            "changes": dict(self.changes),
+            "version": self.version,
+            "significant_windows": self.significant,
+            "started": self.started,
+            "seconds": round(self.seconds, 4),
+            "triggers": len(self.result.identified_triggers) if self.result else 0,
+            "error": self.error,
+        }
+
+
+class AnalysisScheduler:
+    """
+    Pianifica l'analisi dei trigger di intervento in base alle modifiche del grafo.
+
+    Lo scheduler è notificato dal brain a ogni modifica (fonte e righe aggiunte) e
+    confronta la versione del grafo con quella dell'ultima analisi. Le modifiche
+    accumulate producono un punteggio pesato per fonte; l'analisi parte quando:
+      - i nuovi dati sensori contengono finestre fisiologicamente significative
+        (pre-screening sulle sole letture nuove) e sono trascorsi priority_debounce
+        secondi senza altre modifiche;
+      - il punteggio supera threshold e sono trascorsi debounce secondi senza altre
+        modifiche, così che una raffica di aggiornamenti produca una sola analisi;
+      - la modifica più vecchia non analizzata supera max_staleness secondi, anche
+        se gli aggiornamenti non si interrompono.
+    Senza modifiche l'analisi non viene mai eseguita. Le modifiche che arrivano
+    durante un'analisi sono conteggiate per la successiva.
+    """
+
+    def __init__(
+        self,
+        brain: Any,
+        debounce: Optional[float] = None,
+        threshold: Optional[float] = None,
+        max_staleness: Optional[float] = None,
+        priority_debounce: Optional[float] = None,
+        weights: Optional[Dict[str, float]] = None,
+        sources: Optional[Iterable[str]] = None,
+        use_cache: bool = True,
+        analyze: Optional[Callable[[], AnalysisResult]] = None,
+        on_result: Optional[Callable[[AnalysisRun], None]] = None,
+    ):
+        """
+        Args:
+            brain: PersonalDigitalBrain da analizzare
+            debounce: Secondi senza modifiche prima di un'analisi
+                      (default: analysis.scheduler.debounce_seconds)
+            threshold: Punteggio minimo delle modifiche (default: analysis.scheduler.threshold)
+            max_staleness: Secondi massimi tra una modifica e la sua analisi
+                           (default: analysis.scheduler.max_staleness_seconds)
+            priority_debounce: Secondi senza modifiche prima di un'analisi prioritaria
+                               (default: analysis.scheduler.priority_debounce_seconds)
+            weights: Pesi per fonte, in aggiunta a quelli predefiniti
+                     (default: analysis.scheduler.weights)
+            sources: Fonti visibili all'analisi; None per tutte
+            use_cache: Se False le risposte non vengono lette né salvate nella cache LLM
+            analyze: Funzione di analisi (default: brain.identify_intervention_triggers)
+            on_result: Funzione chiamata al termine di ogni analisi
+        """
+        config = ConfigLoader()
+        self.brain = brain
+        self.debounce = debounce if debounce is not None else config.get_value(
+            "analysis.scheduler.debounce_seconds", 5.0
+        )
+        self.threshold = threshold if threshold is not None else config.get_value(
+            "analysis.scheduler.threshold", 20.0
+        )
+        self.max_staleness = max_staleness if max_staleness is not None else config.get_value(
+            "analysis.scheduler.max_staleness_seconds", 900.0
+        )
+        self.priority_debounce = (
+            priority_debounce
+            if priority_debounce is not None
+            else config.get_value("analysis.scheduler.priority_debounce_seconds", 1.0)
+        )
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or config.get_value("analysis.scheduler.weights", {}) or {})
+        # Letture precedenti incluse nel pre-screening delle nuove, come contesto della baseline
+        self.context_ms = int(config.get_value("analysis.scheduler.context_seconds", 3600) * 1000)
+        self.tick = config.get_value("analysis.scheduler.tick_seconds", 0.5)
+
+        self.sources = None if sources is None else list(sources)
+        self.use_cache = use_cache
+        self.analyze = analyze or (
+            lambda: brain.identify_intervention_triggers(use_cache=self.use_cache, sources=self.sources)
+        )
+        self.on_result = on_result
+
+        self.runs: List[AnalysisRun] = []
+        self.last_result: Optional[AnalysisResult] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seen_version = brain.knowledge_graph.version
+        self._reset()
+
+        brain.add_change_listener(self._on_change)
+
+    def _reset(self):
+        """Azzera le modifiche in attesa (da chiamare con il lock acquisito)."""
+        self._changes: Dict[str, int] = {}
+        # Inizio delle letture nuove non ancora esaminate, per (dispositivo, tipo lettura)
+        self._sensor_deltas: Dict[Tuple[str, str], int] = {}
+        self._significant = 0
+        self._first_change: Optional[float] = None
+        self._last_change: Optional[float] = None
+
+    def _on_change(
+        self,
+        source: str,
+        added: int,
+        version: int,
+        sensor_data: Optional[Dict[str, Any]] = None,
+    ):
+        """Registra una modifica notificata dal brain."""
+        now = time.monotonic()
+        with self._lock:
+            if added:
+                self._changes[source] = self._changes.get(source, 0) + added
+            for device_id, readings in (sensor_data or {}).items():
+                for reading_type, series in readings.items():
+                    if isinstance(series, TimeSeries) and len(series):
+                        key = (device_id, reading_type)
+                        start = int(series.timestamps[0])
+                        self._sensor_deltas[key] = min(self._sensor_deltas.get(key, start), start)
+            self._seen_version = max(self._seen_version, version)
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+
+    @property
+    def score(self) -> float:
+        """Punteggio delle modifiche in attesa di analisi."""
+        with self._lock:
+            return self._score()
+
+    def _score(self) -> float:
+        return sum(
+            self.weights.get(source, self.weights["other"]) * count
+            for source, count in self._changes.items()
+        )
+
+    def due(self, now: Optional[float] = None) -> Optional[str]:
+        """
+        Verifica se un'analisi è dovuta
+
+        Args:
+            now: Istante (time.monotonic) della verifica
+
+        Returns:
+            Motivo dell'analisi ("physiological", "threshold", "staleness") o None
+        """
+        now = time.monotonic() if now is None else now
+        self._sync_version(now)
+        self._screen_sensor_deltas()
+
+        with self._lock:
+            if self._first_change is None:
+                return None
+            quiet = now - self._last_change
+            if self._significant and quiet >= self.priority_debounce:
+                return "physiological"
+            if self._score() >= self.threshold and quiet >= self.debounce:
+                return "threshold"
+            if now - self._first_change >= self.max_staleness:
+                return "staleness"
+            return None
+
+    def poll(self, now: Optional[float] = None) -> Optional[AnalysisRun]:
+        """
+        Esegue l'analisi se dovuta
+
+        Args:
+            now: Istante (time.monotonic) della verifica
+
+        Returns:
+            Analisi eseguita, o None
+        """
+        reason = self.due(now)
+        if reason is None:
+            return None
+
+        with self._lock:
+            run = AnalysisRun(
+                reason, self._score(), dict(self._changes), self._seen_version, self._significant
+            )
+            self._reset()
+
+        started = time.perf_counter()
+        try:
+            run.result = self.analyze()
+            self.last_result = run.result
+        except Exception as e:
+            run.error = str(e)
+            print(f"Errore nell'analisi pianificata: {e}")
+        run.seconds = time.perf_counter() - started
+
+        self.runs.append(run)
+        if self.on_result is not None:
+            self.on_result(run)
+        return run
+
+    def start(self):
+        """Avvia il thread che verifica periodicamente se un'analisi è dovuta."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analysis-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arresta il thread dello scheduler, attendendo l'eventuale analisi in corso."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        """Arresta lo scheduler e smette di ricevere le notifiche del brain."""
+        self.stop()
+        self.brain.remove_change_listener(self._on_change)
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            self.poll()
+
+    def _sync_version(self, now: float):
+        """Conteggia come "other" le modifiche visibili solo dal contatore di versione."""
+        # La versione è letta con il lock del grafo: le notifiche delle righe già
+        # inserite sono state consegnate, quelle successive avranno versione maggiore
+        with self.brain._graph_lock:
+            version = self.brain.knowledge_graph.version
+        with self._lock:
+            if version < self._seen_version:
+                # Grafo sostituito (es. load_state): nuova numerazione delle versioni
+                self._seen_version = version
+            elif version > self._seen_version:
+                self._changes["other"] = self._changes.get("other", 0) + version - self._seen_version
+                self._seen_version = version
+                if self._first_change is None:
+                    self._first_change = now
+                self._last_change = now
+
+    def _screen_sensor_deltas(self):
+        """Pre-screening fisiologico limitato alle letture nuove, con contesto precedente."""
+        with self._lock:
+            deltas = self._sensor_deltas
+            self._sensor_deltas = {}
+        if not deltas or (self.sources is not None and "sensor" not in self.sources):
+            return
+
+        sensor_data = self.brain._sensor_snapshot()
+        windows = 0
+        for (device_id, reading_type), start in deltas.items():
+            series = sensor_data.get(device_id, {}).get(reading_type)
+            if not isinstance(series, TimeSeries):
+                continue
+            context = {device_id: {reading_type: series.slice(start - self.context_ms)}}
+            windows += sum(
+                1
+                for window in self.brain.anomaly_detector.detect(context, self.brain.profile_data)
+                if window.end_ms >= start
+            )
+
+        if windows:
+            with self._lock:
+                self._significant += windows
@@ -0,0 +1,293 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.config_loader import ConfigLoader
+from data_layer.structured.time_series import TimeSeries, format_timestamps
+
+# Regole predefinite per tipo di lettura. Chiavi supportate:
+#   zscore: soglia sullo z-score rispetto alla baseline e alla finestra mobile
+#   min_delta: scostamento minimo (in unità della lettura) perché uno z-score conti,
+#              così che il rumore di una serie molto stabile non venga segnalato
+#   rate_delta / rate_window_s: variazione massima ammessa in una finestra temporale
+#   drift: scostamento assoluto massimo dalla baseline
+#   high / low: limiti assoluti
+DEFAULT_RULES: Dict[str, Dict[str, float]] = {
+    "heart_rate": {"zscore": 2.5, "min_delta": 10, "rate_delta": 15, "rate_window_s": 600, "high": 110, "low": 45},
+    "skin_temperature": {"zscore": 3.0, "min_delta": 0.3, "drift": 0.4},
+    "electrodermal_activity": {"zscore": 2.5, "min_delta": 1.0, "rate_delta": 1.5, "rate_window_s": 600},
+    "blood_oxygen": {"low": 94},
+}
+
+
+class CandidateWindow:
+    """Finestra temporale di una serie sensore segnalata dal pre-screening."""
+
+    def __init__(
+        self,
+        device_id: str,
+        reading_type: str,
+        start_ms: int,
+        end_ms: int,
+        reasons: List[str],
+        peak_value: float,
+        score: float,
+    ):
+        self.device_id = device_id
+        self.reading_type = reading_type
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.reasons = reasons
+        self.peak_value = peak_value
+        self.score = score
+
+    def describe(self) -> str:
+        """Descrizione testuale compatta, usata nei prompt."""
+        start, end = format_timestamps(np.array([self.start_ms, self.end_ms], dtype=np.int64))
+        return (
+            f"{self.device_id}/{self.reading_type} {start} -> {end}: "
+            f"picco {self.peak_value:g}, punteggio {self.score:.2f} ({'; '.join(self.reasons)})"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        start, end = format_timestamps(np.array([self.start_ms, self.end_ms], dtype=np.int64))
+        return {
+            "device_id": self.device_id,
+            "reading_type": self.reading_type,
+            "start_time": start,
+            "end_time": end,
+            "reasons": list(self.reasons),
+            "peak_value": self.peak_value,
+            "score": self.score,
+        }
+
+
+class PhysiologicalAnomalyDetector:
+    """
+    Pre-screening vettoriale dei dati fisiologici: individua le finestre che
+    potrebbero contenere un trigger di intervento prima di interpellare il LLM.
+
+    Per ogni serie numerica con una regola configurata calcola z-score rispetto
+    alla baseline dell'utente e a una finestra mobile, variazioni rapide in una
+    finestra temporale, derive dalla baseline e superamenti di limiti assoluti.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, float]]] = None):
+        self.config = ConfigLoader()
+        self.rules = {name: dict(rule) for name, rule in DEFAULT_RULES.items()}
+        for name, rule in (rules or self.config.get_value("analysis.prescreen.rules", {}) or {}).items():
+            self.rules.setdefault(name, {}).update(rule)
+
+        # Numero di letture precedenti usate per lo z-score mobile
+        self.rolling_window = self.config.get_value("analysis.prescreen.rolling_window", 30)
+        # Letture segnalate più vicine di questo intervallo formano un'unica finestra
+        self.merge_gap_s = self.config.get_value("analysis.prescreen.merge_gap_s", 900)
+
+    def detect(
+        self,
+        sensor_data: Dict[str, Dict[str, TimeSeries]],
+        profile_data: Optional[Dict[str, Any]] = None,
+    ) -> List[CandidateWindow]:
+        """
+        Individua le finestre candidate in tutte le serie sensore
+
+        Args:
+            sensor_data: Dati sensori ({dispositivo: {tipo_lettura: TimeSeries}})
+            profile_data: Profilo utente, da cui leggere eventuali baseline fisiologiche
+
+        Returns:
+            Finestre candidate ordinate per inizio
+        """
+        baselines = self._profile_baselines(profile_data or {})
+        windows = []
+
+        for device_id, readings in sensor_data.items():
+            for reading_type, series in readings.items():
+                rule = self.rules.get(reading_type)
+                if rule is None or not isinstance(series, TimeSeries):
+                    continue
+                if series.is_categorical or len(series) == 0:
+                    continue
+                windows.extend(
+                    self._detect_series(
+                        device_id, reading_type, series, rule, baselines.get(reading_type)
+                    )
+                )
+
+        windows.sort(key=lambda w: (w.start_ms, w.device_id, w.reading_type))
+        return windows
+
+    def _detect_series(
+        self,
+        device_id: str,
+        reading_type: str,
+        series: TimeSeries,
+        rule: Dict[str, float],
+        baseline: Optional[Tuple[float, float]],
+    ) -> List[CandidateWindow]:
+        """Applica una regola a una singola serie."""
+        timestamps = series.timestamps
+        values = series.values
+        n = len(values)
+
+        # Baseline dal profilo o, in mancanza, stima robusta (mediana e MAD) dai dati
+        if baseline is None:
+            center = float(np.median(values))
+            spread = 1.4826 * float(np.median(np.abs(values - center)))
+        else:
+            center, spread = baseline
+        spread = spread if spread > 0 else max(float(values.std()), 1e-6)
+
+        flags = np.zeros(n, dtype=bool)
+        scores = np.zeros(n, dtype=np.float64)
+        # Per ogni lettura, indice della prima lettura che appartiene alla finestra segnalata
+        window_start = np.arange(n)
+        reasons: Dict[str, np.ndarray] = {}
+
+        if "zscore" in rule:
+            baseline_deviation = np.abs(values - center)
+            rolling_z, rolling_deviation = self._rolling_zscore(values)
+            z = np.maximum(baseline_deviation / spread, np.abs(rolling_z))
+            deviation = np.maximum(baseline_deviation, rolling_deviation)
+            hit = (z >= rule["zscore"]) & (deviation >= rule.get("min_delta", 0.0))
+            reasons[f"z-score oltre {rule['zscore']:g}"] = hit
+            scores = np.maximum(scores, np.where(hit, z / rule["zscore"], 0.0))
+            flags |= hit
+
+        if "rate_delta" in rule:
+            window_ms = int(rule.get("rate_window_s", 600) * 1000)
+            start = np.searchsorted(timestamps, timestamps - window_ms, side="left")
+            # Confronto con minimo e massimo dell'intera finestra [start, i], non solo
+            # con la lettura più vecchia: un'oscillazione interna viene rilevata
+            window_min, window_max = self._window_extrema(values, start)
+            delta = np.maximum(values - window_min, window_max - values)
+            hit = delta >= rule["rate_delta"]
+            reasons[f"variazione >= {rule['rate_delta']:g} in {int(window_ms / 60000)} min"] = hit
+            scores = np.maximum(scores, delta / rule["rate_delta"])
+            window_start = np.where(hit, np.minimum(window_start, start), window_start)
+            flags |= hit
+
+        if "drift" in rule:
+            drift = np.abs(values - center)
+            hit = drift >= rule["drift"]
+            reasons[f"deriva dalla baseline >= {rule['drift']:g}"] = hit
+            scores = np.maximum(scores, drift / rule["drift"])
+            flags |= hit
+
+        if "high" in rule:
+            hit = values > rule["high"]
+            reasons[f"sopra {rule['high']:g}"] = hit
+            scores = np.maximum(scores, np.where(hit, 1.0 + (values - rule["high"]) / rule["high"], 0.0))
+            flags |= hit
+
+        if "low" in rule:
+            hit = values < rule["low"]
+            reasons[f"sotto {rule['low']:g}"] = hit
+            scores = np.maximum(scores, np.where(hit, 1.0 + (rule["low"] - values) / rule["low"], 0.0))
+            flags |= hit
+
+        flagged = np.flatnonzero(flags)
+        if len(flagged) == 0:
+            return []
+
+        # Raggruppa le letture segnalate consecutive (entro merge_gap) in finestre
+        gaps = np.diff(timestamps[flagged]) > self.merge_gap_s * 1000
+        group_ends = np.concatenate((np.flatnonzero(gaps), [len(flagged) - 1]))
+        group_starts = np.concatenate(([0], group_ends[:-1] + 1))
+
+        windows = []
+        for first, last in zip(group_starts.tolist(), group_ends.tolist()):
+            members = flagged[first:last + 1]
+            start_index = int(window_start[members].min())
+            peak = members[int(np.argmax(scores[members]))]
+            window_reasons = [
+                label for label, hit in reasons.items() if hit[members].any()
+            ]
+            windows.append(
+                CandidateWindow(
+                    device_id,
+                    reading_type,
+                    int(timestamps[start_index]),
+                    int(timestamps[members[-1]]),
+                    window_reasons,
+                    float(values[peak]),
+                    float(scores[peak]),
+                )
+            )
+        return windows
+
+    def _rolling_zscore(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Z-score e scostamento assoluto di ogni lettura rispetto alla media delle
+        `rolling_window` letture precedenti, calcolati con somme cumulative.
+        Le letture con meno di 3 letture precedenti valgono 0.
+        """
+        n = len(values)
+        window = max(int(self.rolling_window), 2)
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        cumsq = np.concatenate(([0.0], np.cumsum(values * values)))
+
+        index = np.arange(n)
+        lo = np.maximum(index - window, 0)
+        count = index - lo
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (cumsum[index] - cumsum[lo]) / count
+            variance = (cumsq[index] - cumsq[lo]) / count - mean * mean
+            std = np.sqrt(np.maximum(variance, 0.0))
+            valid = (count >= 3) & (std > 0)
+            z = np.where(valid, (values - mean) / std, 0.0)
+            deviation = np.where(valid, np.abs(values - mean), 0.0)
+        return np.nan_to_num(z), np.nan_to_num(deviation)
+
+    @staticmethod
+    def _window_extrema(values: np.ndarray, start: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Minimo e massimo di values[start[i]:i + 1] per ogni lettura i, con una
+        sparse table (O(n log n) per la costruzione, O(1) vettoriale per le query).
+        """
+        n = len(values)
+        index = np.arange(n)
+        length = index - start + 1
+        level = np.floor(np.log2(length)).astype(np.int64)
+
+        minima = [values]
+        maxima = [values]
+        span = 1
+        while 2 * span <= n:
+            prev_min, prev_max = minima[-1], maxima[-1]
+            minima.append(np.minimum(prev_min[:-span], prev_min[span:]))
+            maxima.append(np.maximum(prev_max[:-span], prev_max[span:]))
+            span *= 2
+
+        window_min = np.empty(n, dtype=np.float64)
+        window_max = np.empty(n, dtype=np.float64)
+        for k in np.unique(level).tolist():
+            rows = np.flatnonzero(level == k)
+            left = start[rows]
+            right = index[rows] - (1 << k) + 1
+            window_min[rows] = np.minimum(minima[k][left], minima[k][right])
+            window_max[rows] = np.maximum(maxima[k][left], maxima[k][right])
+        return window_min, window_max
+
+    @staticmethod
+    def _profile_baselines(profile_data: Dict[str, Any]) -> Dict[str, Tuple[float, float]]:
+        """
+        Estrae le baseline fisiologiche dal profilo, se presenti. Formati accettati
+        (sotto le chiavi physiological_baseline, baselines o baseline):
+            {"heart_rate": 70} oppure {"heart_rate": {"mean": 70, "std": 5}}
+        """
+        baselines = {}
+        for key in ("physiological_baseline", "baselines", "baseline"):
+            section = profile_data.get(key)
+            if not isinstance(section, dict):
+                continue
+            for reading_type, value in section.items():
+                if isinstance(value, (int, float)):
+                    baselines[reading_type] = (float(value), 0.0)
+                elif isinstance(value, dict) and "mean" in value:
+                    baselines[reading_type] = (
+                        float(value["mean"]),
+                        float(value.get("std", 0.0)),
+                    )
+        return baselines
@@ -1,9 +1,39 @@
 from config.config_loader import ConfigLoader
-from llm.provider import get_llm_with_structured_output
+from data_layer.checkpoint import IngestionCheckpoint
+from data_layer.structured.time_series import TimeSeries, load_series, save_series
+from llm.prompt_builder import PromptBuilder
+from llm.provider import ainvoke_structured, invoke_structured
 from models.output_schemas import AnalysisResult
-from pdb.triplet_extraction.extractor import TripletExtractor
+from pdb.triplet_extraction.extractor import TripletExtractor, merge_triplets
 from pdb.ontology.ontology_system import OntologySystem
-from typing import Dict, List, Any
+from pdb.ontology.observation_series import (
+    ObservationSeries,
+    load_observation_series,
+    save_observation_series,
+)
+from pdb.knowledge_graph.triple_store import TripleStore, TripleStoreView
+from pdb.knowledge_graph.query_engine import QueryEngine
+from pdb.anomaly_detection.physiological_detector import (
+    CandidateWindow,
+    PhysiologicalAnomalyDetector,
+)
+from pdb.summarization.sensor_rollup import TABLE_HEADER, RollupRow, SensorRollup
+from pdb.interactive_analysis import InteractiveAnalysis
+from collections import OrderedDict
+from itertools import islice
+import asyncio
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Sequence, Set, Tuple, Union
+
+
+# File dello stato persistito da save_state
+GRAPH_FILE = "graph.npz"
+PENDING_SERIES_FILE = "pending_series.npz"
+SENSOR_CONTEXT_FILE = "sensor_context.npz"
+CONTEXT_FILE = "context.json"
+CHECKPOINT_FILE = "checkpoint.json"
 
 
 class PersonalDigitalBrain:
@@ -16,127 +46,622 @@ class PersonalDigitalBrain:
         self.config = ConfigLoader()
         self.triplet_extractor = TripletExtractor()
         self.ontology_system = OntologySystem()
-        self.knowledge_graph = {}  # Rappresentazione semplificata del knowledge graph
-
-    def process_unstructured_data(self, voice_data: str, profile_data: Dict[str, Any]):
+        self.knowledge_graph = TripleStore()
+        # Numero massimo di triplet materializzati insieme durante l'inserimento
+        self.batch_size = self.config.get_value("pdb.ingestion_batch_size", 1000)
+        self.query_engine = QueryEngine(self.knowledge_graph)
+        self.anomaly_detector = PhysiologicalAnomalyDetector()
+
+        # Serie sensore, profilo e dati app ingeriti, usati dal pre-screening fisiologico
+        # e dal riepilogo statistico dei sensori nel prompt di analisi
+        self.sensor_data: Dict[str, Dict[str, Any]] = {}
+        self.profile_data: Dict[str, Any] = {}
+        self.app_data: Dict[str, Any] = {}
+        self.prescreen_enabled = self.config.get_value("analysis.prescreen.enabled", True)
+        self.sensor_rollup = SensorRollup()
+        self.rollup_enabled = self.config.get_value("analysis.rollup.enabled", True)
+
+        # Serializza l'accesso al knowledge graph: le letture possono materializzare
+        # serie in attesa, per cui più thread che analizzano viste diverse dello stesso
+        # grafo devono alternarsi
+        self._graph_lock = threading.RLock()
+
+        # Memo dei risultati delle query, valido per una versione del grafo
+        self.query_memo_size = self.config.get_value("analysis.interactive.query_memo_size", 256)
+        self._query_memo: "OrderedDict[Tuple, List[Dict[str, str]]]" = OrderedDict()
+        self._query_memo_version: Optional[int] = None
+
+        # Watermark dell'ingestione incrementale, caricati da load_state
+        self.checkpoint: Optional[IngestionCheckpoint] = None
+
+        # Funzioni notificate a ogni modifica del grafo o dei dati sensori registrati
+        self._change_listeners: List[Callable[..., None]] = []
+
+    def process_unstructured_data(
+        self,
+        voice_data: Union[str, Sequence[str]],
+        profile_data: Optional[Dict[str, Any]],
+    ):
         """
-        Elabora dati non strutturati (voce e profilo)
+        Elabora dati non strutturati (voce e profilo). Con l'ingestione incrementale
+        un testo vuoto o un profilo None (invariato) non vengono rielaborati; i triplet
+        di un profilo cambiato sostituiscono quelli estratti dal profilo precedente.
+        Blocchi di espressioni vocali consecutive e profilo sono estratti come
+        documenti distinti con l'estrazione a batch: più documenti brevi
+        condividono una sola richiesta.
 
         Args:
-            voice_data: Testo dalla trascrizione vocale
-            profile_data: Informazioni profilo utente
+            voice_data: Testo dalla trascrizione vocale, o lista di espressioni
+            profile_data: Informazioni profilo utente, o None se non cambiate
         """
-        # Estrai triplet dai dati vocali
-        voice_triplets = self.triplet_extractor.extract_from_text(voice_data)
-
-        # Aggiungi triplet al knowledge graph
-        self._add_triplets_to_graph(voice_triplets, "voice")
+        if profile_data is not None:
+            self.profile_data = profile_data
+
+        documents = self._unstructured_documents(voice_data, profile_data)
+        if not documents:
+            return
+        extracted = self.triplet_extractor.extract_from_documents(documents)
+
+        # Inserimento nell'ordine voce, profilo
+        for source, triplets in self._split_unstructured_triplets(extracted):
+            self._add_triplets_to_graph(triplets, source)
+        if profile_data is not None:
+            self._replace_profile_triplets(extracted["profile"])
+
+    async def aprocess_unstructured_data(
+        self,
+        voice_data: Union[str, Sequence[str]],
+        profile_data: Optional[Dict[str, Any]],
+        use_cache: bool = True,
+    ):
+        """
+        Versione asincrona di process_unstructured_data: i batch di documenti
+        vengono estratti in parallelo sull'event loop
 
-        # Elabora dati del profilo
-        profile_triplets = self.triplet_extractor.extract_from_profile(profile_data)
-        self._add_triplets_to_graph(profile_triplets, "profile")
+        Args:
+            voice_data: Testo dalla trascrizione vocale, o lista di espressioni
+            profile_data: Informazioni profilo utente, o None se non cambiate
+            use_cache: Se False le risposte non vengono lette né salvate nella cache LLM
+        """
+        if profile_data is not None:
+            self.profile_data = profile_data
+
+        documents = self._unstructured_documents(voice_data, profile_data)
+        if not documents:
+            return
+        extracted = await self.triplet_extractor.aextract_from_documents(
+            documents, use_cache=use_cache
+        )
+
+        for source, triplets in self._split_unstructured_triplets(extracted):
+            await self._aadd_triplets_to_graph(triplets, source)
+        if profile_data is not None:
+            await asyncio.to_thread(self._replace_profile_triplets, extracted["profile"])
+
+    def _unstructured_documents(
+        self,
+        voice_data: Union[str, Sequence[str]],
+        profile_data: Optional[Dict[str, Any]],
+    ) -> Dict[str, str]:
+        """
+        Documenti da estrarre: le espressioni vocali consecutive sono raggruppate in
+        blocchi di circa extraction.chunk_tokens, sovrapposti come i chunk di
+        extract_from_text per conservare il contesto tra espressioni; il profilo
+        è un documento a parte
+        """
+        utterances = [voice_data] if isinstance(voice_data, str) else list(voice_data or [])
+        text = "\n".join(utterance for utterance in utterances if utterance)
+        documents = {}
+        if text.strip():
+            chunks = self.triplet_extractor.split_into_chunks(text)
+            documents = {f"voice:{index}": chunk for index, chunk in enumerate(chunks)}
+        if profile_data is not None:
+            documents["profile"] = self.triplet_extractor.profile_to_text(profile_data)
+        return documents
+
+    @staticmethod
+    def _split_unstructured_triplets(
+        extracted: Dict[str, List[Dict[str, str]]]
+    ) -> List[Tuple[str, List[Dict[str, str]]]]:
+        """Raggruppa per fonte i triplet estratti dai documenti di _unstructured_documents."""
+        voice = merge_triplets(
+            triplets for doc_id, triplets in extracted.items() if doc_id != "profile"
+        )
+        return [("voice", voice), ("profile", extracted.get("profile", []))]
 
     def process_structured_data(
         self, sensor_data: Dict[str, Any], app_data: Dict[str, Any]
     ):
         """
-        Elabora dati strutturati (sensori e app)
+        Elabora dati strutturati (sensori e app). I campi delle entry app modificate
+        sostituiscono i valori registrati in precedenza.
 
         Args:
             sensor_data: Dati da sensori/dispositivi IoT
             app_data: Dati da applicazioni
         """
-        # Elabora dati sensori
-        sensor_triplets = self.ontology_system.sensor_data_to_triplets(sensor_data)
-        self._add_triplets_to_graph(sensor_triplets, "sensor")
+        self.record_context(sensor_data=sensor_data, app_data=app_data)
+
+        # Elabora dati sensori: la conversione è un generatore consumato a blocchi
+        if self.ontology_system.sensor_mode == "series":
+            # Un nodo per blocco temporale; le osservazioni sono materializzate su richiesta
+            self.add_sensor_series(self.ontology_system.iter_sensor_series(sensor_data))
+        else:
+            sensor_triplets = self.ontology_system.iter_sensor_triplets(sensor_data)
+            self._add_triplets_to_graph(sensor_triplets, "sensor")
 
         # Elabora dati app
-        app_triplets = self.ontology_system.app_data_to_triplets(app_data)
+        app_triplets = self.ontology_system.iter_app_triplets(app_data)
         self._add_triplets_to_graph(app_triplets, "app")
+        self._retract_superseded_values(self.ontology_system.iter_app_triplets(app_data), "app")
 
-    def identify_intervention_triggers(self) -> AnalysisResult:
+    async def aprocess_structured_data(
+        self, sensor_data: Dict[str, Any], app_data: Dict[str, Any]
+    ):
+        """
+        Versione asincrona di process_structured_data. La conversione non usa il LLM:
+        conversione e inserimento di ogni blocco avvengono in un thread, perché il
+        lock del grafo può essere tenuto a lungo da una query, così che un processo
+        che gestisce molti gemelli sullo stesso loop resti reattivo.
+
+        Args:
+            sensor_data: Dati da sensori/dispositivi IoT
+            app_data: Dati da applicazioni
+        """
+        await asyncio.to_thread(
+            self.record_context, sensor_data=sensor_data, app_data=app_data
+        )
+
+        if self.ontology_system.sensor_mode == "series":
+            iterator = iter(self.ontology_system.iter_sensor_series(sensor_data))
+            while await asyncio.to_thread(self._add_series_batch, iterator, self.batch_size):
+                pass
+        else:
+            sensor_triplets = self.ontology_system.iter_sensor_triplets(sensor_data)
+            await self._aadd_triplets_to_graph(sensor_triplets, "sensor")
+
+        app_triplets = self.ontology_system.iter_app_triplets(app_data)
+        await self._aadd_triplets_to_graph(app_triplets, "app")
+        await asyncio.to_thread(
+            self._retract_superseded_values,
+            self.ontology_system.iter_app_triplets(app_data),
+            "app",
+        )
+
+    def identify_intervention_triggers(
+        self, use_cache: bool = True, sources: Optional[Iterable[str]] = None
+    ) -> AnalysisResult:
         """
         Analizza il knowledge graph per identificare potenziali trigger di intervento
 
+        Args:
+            use_cache: Se False la risposta non viene letta né salvata nella cache LLM
+            sources: Fonti da considerare (es. ["voice", "sensor"]); None per tutte
+
         Returns:
             Risultato analisi con trigger identificati
         """
-        # Crea un prompt basato sul knowledge graph
-        prompt = self._create_analysis_prompt()
+        prompt = self._prepare_analysis_prompt(sources)
+        if prompt is None:
+            return self._prescreen_negative_result()
 
         # Usa LLM per analizzare il knowledge graph
-        llm = get_llm_with_structured_output(AnalysisResult)
-        result = llm.invoke(prompt)
+        result = invoke_structured(AnalysisResult, prompt, use_cache=use_cache)
 
         return result
 
-    def _add_triplets_to_graph(self, triplets: List[Dict[str, str]], source: str):
+    def add_triplets(self, triplets: Iterable[Dict[str, str]], source: str):
         """
-        Aggiungi triplet estratti al knowledge graph
+        Aggiunge al knowledge graph triplet già estratti o convertiti, ad esempio
+        riutilizzati da un'elaborazione precedente degli stessi dati
 
         Args:
-            triplets: Lista di triplet da aggiungere
+            triplets: Triplet da aggiungere (lista o generatore)
             source: Fonte dei triplet (voice, profile, sensor, app)
         """
-        # Implementazione semplificata - in un sistema reale, questo userebbe un database a grafo
-        for triplet in triplets:
-            # Crea un identificatore unico per il triplet
-            triplet_id = (
-                f"{triplet['subject']}_{triplet['predicate']}_{triplet['object']}"
-            )
+        self._add_triplets_to_graph(triplets, source)
 
-            # Aggiungi al knowledge graph con informazioni sulla fonte
-            if triplet_id not in self.knowledge_graph:
-                self.knowledge_graph[triplet_id] = {
-                    "triplet": triplet,
-                    "sources": [source],
-                }
-            else:
-                # Se il triplet esiste già, aggiungi la nuova fonte
-                if source not in self.knowledge_graph[triplet_id]["sources"]:
-                    self.knowledge_graph[triplet_id]["sources"].append(source)
+    def add_sensor_series(self, series: Iterable[ObservationSeries]):
+        """
+        Aggiunge al knowledge graph nodi serie già convertiti. Le serie non vengono
+        modificate e possono essere condivise tra più istanze
 
-    def _create_analysis_prompt(self) -> str:
+        Args:
+            series: Serie di osservazioni (modalità sensori "series")
         """
-        Crea un prompt per il LLM che spiega come interrogare il knowledge graph
+        iterator = iter(series)
+        while self._add_series_batch(iterator, self.batch_size):
+            pass
+
+    def _add_series_batch(self, iterator: Iterator[ObservationSeries], batch_size: int) -> int:
+        """Aggiunge al grafo al più batch_size serie dell'iteratore; restituisce quante."""
+        added = 0
+        for item in islice(iterator, batch_size):
+            with self._graph_lock:
+                version = self.knowledge_graph.version
+                self.knowledge_graph.add_series(item, "sensor")
+                self._notify_change("sensor", self.knowledge_graph.version - version)
+            added += 1
+        return added
+
+    def record_context(
+        self,
+        sensor_data: Optional[Dict[str, Any]] = None,
+        profile_data: Optional[Dict[str, Any]] = None,
+        app_data: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Registra i dati grezzi usati dal pre-screening fisiologico e dal riepilogo
+        dei sensori, senza aggiungere triplet al knowledge graph
+
+        Args:
+            sensor_data: Dati sensori da unire a quelli già registrati
+            profile_data: Profilo utente (sostituisce quello registrato)
+            app_data: Dati app da unire a quelli già registrati (eventi del calendario);
+                      le entry con lo stesso ID vengono aggiornate campo per campo
+        """
+        # L'ingestione continua registra i dati da più thread
+        with self._graph_lock:
+            for device_id, readings in (sensor_data or {}).items():
+                recorded = self.sensor_data.setdefault(device_id, {})
+                for reading_type, series in readings.items():
+                    previous = recorded.get(reading_type)
+                    # Le letture di un'ingestione incrementale si aggiungono a quelle registrate
+                    if isinstance(previous, TimeSeries) and isinstance(series, TimeSeries):
+                        series = previous.merge(series)
+                    recorded[reading_type] = series
+            if profile_data is not None:
+                self.profile_data = profile_data
+            if app_data:
+                _merge_nested(self.app_data, app_data)
+            if sensor_data:
+                self._notify_change("sensor", 0, sensor_data)
+
+    def add_change_listener(self, listener: Callable[..., None]):
+        """
+        Registra una funzione chiamata a ogni modifica, con la fonte, le righe
+        aggiunte al grafo, la versione del grafo risultante e, per i dati sensori
+        registrati, le nuove serie. La funzione è chiamata con il lock del grafo
+        acquisito: deve limitarsi a registrare la modifica.
+
+        Args:
+            listener: Funzione listener(source, added, version, sensor_data=None)
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener: Callable[..., None]):
+        """Rimuove una funzione registrata con add_change_listener."""
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def _notify_change(
+        self, source: str, added: int, sensor_data: Optional[Dict[str, Any]] = None
+    ):
+        if not added and not sensor_data:
+            return
+        for listener in list(self._change_listeners):
+            listener(source, added, self.knowledge_graph.version, sensor_data)
+
+    async def aidentify_intervention_triggers(
+        self, use_cache: bool = True, sources: Optional[Iterable[str]] = None
+    ) -> AnalysisResult:
+        """
+        Versione asincrona di identify_intervention_triggers, basata su ainvoke
+
+        Args:
+            use_cache: Se False la risposta non viene letta né salvata nella cache LLM
+            sources: Fonti da considerare (es. ["voice", "sensor"]); None per tutte
 
         Returns:
-            Stringa prompt formattata
+            Risultato analisi con trigger identificati
         """
-        # Creazione di metadati del knowledge graph
-        sources = set()
-        predicates = set()
-        entity_types = set()
+        # Pre-screening e costruzione del prompt leggono il grafo sotto lock: in un thread
+        prompt = await asyncio.to_thread(self._prepare_analysis_prompt, sources)
+        if prompt is None:
+            return self._prescreen_negative_result()
 
-        for triplet_id, data in self.knowledge_graph.items():
-            triplet = data["triplet"]
-            sources.update(data["sources"])
-            predicates.add(triplet["predicate"])
+        return await ainvoke_structured(AnalysisResult, prompt, use_cache=use_cache)
 
-            # Estrazione informazioni sui tipi se disponibili
-            if triplet["predicate"] == "rdf:type":
-                entity_types.add(triplet["object"])
+    def _prepare_analysis_prompt(
+        self, sources: Optional[Iterable[str]] = None
+    ) -> Optional[str]:
+        """
+        Esegue il pre-screening fisiologico e crea il prompt di analisi
 
-        # Rappresentazione testuale dei metadati
-        metadata = f"""
-        Fonti dati: {', '.join(sources)}
-        Tipi di relazioni: {', '.join(predicates)}
-        Tipi di entità: {', '.join(entity_types)}
+        Args:
+            sources: Fonti da considerare; None per tutte
+
+        Returns:
+            Prompt di analisi, oppure None se il pre-screening non segnala alcuna
+            finestra e la chiamata al LLM può essere evitata
         """
+        sources = None if sources is None else list(sources)
+        candidate_windows = self._prescreen(sources)
+        if candidate_windows == []:
+            return None
+        return self._create_analysis_prompt(candidate_windows, sources)
+
+    def graph_view(
+        self, sources: Optional[Iterable[str]] = None
+    ) -> Union[TripleStore, TripleStoreView]:
+        """
+        Restituisce il knowledge graph limitato alle fonti indicate, senza copiarlo
 
-        # Prompt principale
-        prompt = f"""
+        Args:
+            sources: Fonti visibili (voice, profile, sensor, app); None per tutte
+
+        Returns:
+            Lo store completo o una sua vista filtrata per fonte
+        """
+        if sources is None:
+            return self.knowledge_graph
+        return self.knowledge_graph.view(sources)
+
+    def _prescreen(
+        self, sources: Optional[Iterable[str]] = None
+    ) -> Optional[List[CandidateWindow]]:
+        """
+        Esegue il pre-screening fisiologico sui dati delle fonti visibili
+
+        Args:
+            sources: Fonti da considerare; None per tutte
+
+        Returns:
+            Finestre candidate, oppure None se il pre-screening non si applica
+        """
+        sources = None if sources is None else set(sources)
+        if not self.prescreen_enabled or not self.sensor_data:
+            return None
+        if sources is not None and "sensor" not in sources:
+            return None
+
+        # Senza la fonte profilo le baseline sono stimate dai dati
+        profile_data = self.profile_data if sources is None or "profile" in sources else {}
+        return self.anomaly_detector.detect(self._sensor_snapshot(), profile_data)
+
+    def _rollup_rows(self, sources: Optional[Iterable[str]] = None) -> List[RollupRow]:
+        """
+        Calcola il riepilogo statistico dei sensori visibili
+
+        Args:
+            sources: Fonti da considerare; None per tutte
+
+        Returns:
+            Righe del riepilogo (vuoto se i sensori non sono visibili)
+        """
+        sources = None if sources is None else set(sources)
+        if not self.rollup_enabled or not self.sensor_data:
+            return []
+        if sources is not None and "sensor" not in sources:
+            return []
+
+        # Gli eventi del calendario delimitano le finestre solo se la fonte app è visibile
+        app_data = self.app_data if sources is None or "app" in sources else {}
+        return self.sensor_rollup.summarize(self._sensor_snapshot(), app_data)
+
+    def _sensor_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copia superficiale dei dati sensori registrati, stabile durante l'ingestione continua."""
+        with self._graph_lock:
+            return {device_id: dict(readings) for device_id, readings in self.sensor_data.items()}
+
+    @staticmethod
+    def _prescreen_negative_result() -> AnalysisResult:
+        """Risultato restituito quando il pre-screening non segnala alcuna finestra."""
+        return AnalysisResult(
+            extracted_triples=[],
+            identified_triggers=[],
+            reasoning=(
+                "Pre-screening fisiologico: nessuna lettura supera le soglie "
+                "configurate, analisi LLM non eseguita."
+            ),
+        )
+
+    def _add_triplets_to_graph(
+        self,
+        triplets: Iterable[Dict[str, str]],
+        source: str,
+        batch_size: Optional[int] = None,
+    ):
+        """
+        Aggiungi triplet estratti al knowledge graph, a blocchi di dimensione fissa.
+        Con un generatore in ingresso, la memoria di picco è limitata al blocco corrente.
+
+        Args:
+            triplets: Triplet da aggiungere (lista o generatore)
+            source: Fonte dei triplet (voice, profile, sensor, app)
+            batch_size: Dimensione dei blocchi (default: pdb.ingestion_batch_size)
+        """
+        batch_size = batch_size or self.batch_size
+        iterator = iter(triplets)
+
+        while self._add_triplet_batch(iterator, source, batch_size):
+            pass
+
+    def _add_triplet_batch(
+        self, iterator: Iterator[Dict[str, str]], source: str, batch_size: int
+    ) -> int:
+        """Aggiunge al grafo al più batch_size triplet dell'iteratore; restituisce quanti."""
+        batch = list(islice(iterator, batch_size))
+        if batch:
+            with self._graph_lock:
+                version = self.knowledge_graph.version
+                self.knowledge_graph.add_triplets(batch, source)
+                self._notify_change(source, self.knowledge_graph.version - version)
+        return len(batch)
+
+    def _retract_superseded_values(self, triplets: Iterable[Dict[str, str]], source: str):
+        """
+        Ritira dalla fonte i valori precedenti delle coppie (soggetto, predicato) dei
+        triplet indicati, già inseriti: es. il vecchio orario di un evento modificato
+
+        Args:
+            triplets: Triplet con i valori correnti
+            source: Fonte dei triplet
+        """
+        values: Dict[Tuple[str, str], Set[str]] = {}
+        for triplet in triplets:
+            key = (triplet["subject"], triplet["predicate"])
+            values.setdefault(key, set()).add(triplet["object"])
+
+        with self._graph_lock:
+            graph = self.knowledge_graph
+            version = graph.version
+            source_mask = graph.source_bit(source)
+            lookup = graph.terms.lookup
+            stale = []
+            for (subject, predicate), objects in values.items():
+                s, p = lookup(subject), lookup(predicate)
+                if s is None or p is None:
+                    continue
+                current = {lookup(obj) for obj in objects}
+                stale.extend(
+                    row
+                    for row in graph.match_ids(s, p)
+                    if graph.row_ids(row)[2] not in current
+                    and graph.row_source_mask(row) & source_mask
+                )
+            # Dalla riga più alta, perché la rimozione sposta l'ultima riga nel posto libero
+            for row in sorted(stale, reverse=True):
+                graph.remove_row_source(row, source_mask)
+            self._notify_change(source, graph.version - version)
+
+    def _replace_profile_triplets(self, triplets: List[Dict[str, str]]):
+        """Ritira la fonte profile dai triplet che non compaiono nell'ultima estrazione."""
+        with self._graph_lock:
+            version = self.knowledge_graph.version
+            self.knowledge_graph.remove_source("profile", keep=triplets)
+            self._notify_change("profile", self.knowledge_graph.version - version)
+
+    async def _aadd_triplets_to_graph(
+        self,
+        triplets: Iterable[Dict[str, str]],
+        source: str,
+        batch_size: Optional[int] = None,
+    ):
+        """
+        Come _add_triplets_to_graph, ma ogni blocco è materializzato e inserito in un
+        thread: il lock del grafo non viene mai atteso nel thread dell'event loop
+
+        Args:
+            triplets: Triplet da aggiungere (lista o generatore)
+            source: Fonte dei triplet (voice, profile, sensor, app)
+            batch_size: Dimensione dei blocchi (default: pdb.ingestion_batch_size)
+        """
+        batch_size = batch_size or self.batch_size
+        iterator = iter(triplets)
+
+        while await asyncio.to_thread(self._add_triplet_batch, iterator, source, batch_size):
+            pass
+
+    def _create_analysis_prompt(
+        self,
+        candidate_windows: Optional[List[CandidateWindow]] = None,
+        sources: Optional[Iterable[str]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Crea un prompt per il LLM che spiega come interrogare il knowledge graph
+
+        Args:
+            candidate_windows: Finestre segnalate dal pre-screening fisiologico, se disponibili
+            sources: Fonti da descrivere nel prompt; None per tutte
+            max_tokens: Budget di token del prompt (default: llm.prompt.max_tokens)
+
+        Returns:
+            Stringa prompt formattata
+        """
+        sources_filter = None if sources is None else list(sources)
+        graph = self.graph_view(sources_filter)
+
+        # Creazione di metadati del knowledge graph
+        with self._graph_lock:
+            sources = sorted(graph.sources())
+            predicates = graph.predicates()
+
+            # Estrazione informazioni sui tipi tramite l'indice POS, senza materializzare
+            # le serie in attesa: le loro osservazioni sono tutte di tipo sosa:Observation
+            entity_types = set()
+            rdf_type = graph.terms.lookup("rdf:type")
+            if rdf_type is not None:
+                entity_types = {
+                    graph.terms.decode(graph.row_ids(row)[2])
+                    for row in graph.match_ids(p=rdf_type)
+                }
+            if graph.pending_series_count():
+                entity_types.add("sosa:Observation")
+            entity_types = sorted(entity_types)
+
+        # Il prompt è assemblato entro il budget di token: se i metadati sono troppi,
+        # le liste vengono troncate a partire dalle sezioni meno prioritarie
+        builder = PromptBuilder(max_tokens)
+        builder.add_text("""
         Stai analizzando un knowledge graph di un Human Digital Twin per identificare potenziali trigger di intervento.
         
         Il knowledge graph contiene i seguenti tipi di informazioni:
-        {metadata}
+        
+""")
+
+        # Rappresentazione testuale dei metadati
+        def add_list(name: str, label: str, values: List[str], priority: int):
+            builder.add_section(
+                name,
+                values,
+                header=f"        {label}: ",
+                separator=", ",
+                priority=priority,
+                omitted_text=lambda count: f"altri {count}",
+            )
+
+        add_list("sources", "Fonti dati", sources, 6)
+        add_list("predicates", "Tipi di relazioni", predicates, 4)
+        add_list("entity_types", "Tipi di entità", entity_types, 3)
+
+        # Solo le finestre segnalate dal pre-screening entrano nel prompt,
+        # le più significative per prime se non entrano tutte
+        if candidate_windows:
+            builder.add_section(
+                "candidate_windows",
+                candidate_windows,
+                header="""
+        Finestre fisiologiche segnalate dal pre-screening (da approfondire con query sui sensori):
+""",
+                priority=5,
+                formatter=lambda window: f"        - {window.describe()}",
+                rank=lambda window: window.score,
+                omitted_text=lambda count: f"        ... ({count} finestre omesse)",
+            )
+
+        # Statistiche per finestra al posto delle singole letture: le righe sono limitate
+        # da analysis.rollup.max_rows, per cui i token restano stabili al crescere dei dati
+        rollup_rows = self._rollup_rows(sources_filter)
+        if rollup_rows:
+            builder.add_section(
+                "sensor_rollup",
+                rollup_rows,
+                header=f"""
+        Riepilogo statistico dei sensori per finestra temporale:
+        {TABLE_HEADER}
+""",
+                priority=5,
+                formatter=lambda row: f"        {row.format()}",
+                rank=lambda row: row.score,
+                omitted_text=lambda count: f"        ... ({count} finestre omesse)",
+            )
+
+        # Prompt principale
+        builder.add_text("""
         
         Invece di fornirti l'intero knowledge graph, puoi interrogarlo usando query SPARQL-like. Ad esempio:
         
-        QUERY: SELECT ?subject ?predicate ?object WHERE {{ ?subject ?predicate ?object . FILTER(?predicate = "sosa:hasSimpleResult") }}
+        QUERY: SELECT ?subject ?predicate ?object WHERE { ?subject ?predicate ?object . FILTER(?predicate = "sosa:hasSimpleResult") }
         
         Questa query restituirebbe tutti i triplet dove il predicato è "sosa:hasSimpleResult".
         
+        Puoi combinare più triple pattern sulle stesse variabili, filtrare con confronti (=, !=, <, <=, >, >=, &&, ||)
+        e limitare i risultati con ORDER BY, LIMIT e OFFSET. Ad esempio:
+        
+        QUERY: SELECT ?obs ?value ?time WHERE { ?obs sosa:observedProperty property:heart_rate . ?obs sosa:hasSimpleResult ?value . ?obs sosa:resultTime ?time . FILTER(?value > 90 && ?time >= "2025-04-01T15:00:00Z") } ORDER BY ?time LIMIT 20
+        
         Il tuo compito è:
         
         1. Formulare query per recuperare parti rilevanti del knowledge graph
@@ -148,46 +673,209 @@ class PersonalDigitalBrain:
         d. Evidenze a supporto dal knowledge graph
         
         Inizia formulando alcune query iniziali per comprendere cosa è disponibile nel knowledge graph.
-        """
+        """)
 
+        prompt = builder.build()
         return prompt
 
-    def query_knowledge_graph(self, query_str: str) -> List[Dict[str, str]]:
+    def save_state(self, directory: str):
+        """
+        Salva knowledge graph, serie in attesa, dati di contesto e checkpoint di
+        ingestione. Il checkpoint è scritto per ultimo: se il salvataggio si interrompe,
+        i dati vengono rielaborati alla prossima esecuzione (l'unione nel grafo è
+        idempotente).
+
+        Args:
+            directory: Directory dello stato
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._graph_lock:
+            self.knowledge_graph.save(os.path.join(directory, GRAPH_FILE))
+            # Le serie non ancora materializzate si salvano in forma colonnare
+            save_observation_series(
+                os.path.join(directory, PENDING_SERIES_FILE),
+                self.knowledge_graph.pending_series(),
+            )
+
+            save_series(
+                os.path.join(directory, SENSOR_CONTEXT_FILE),
+                {
+                    device_id: {
+                        reading_type: series
+                        for reading_type, series in readings.items()
+                        if isinstance(series, TimeSeries)
+                    }
+                    for device_id, readings in self.sensor_data.items()
+                },
+            )
+            context_path = os.path.join(directory, CONTEXT_FILE)
+            with open(f"{context_path}.tmp", "w") as f:
+                json.dump({"profile": self.profile_data, "app": self.app_data}, f, default=str)
+            os.replace(f"{context_path}.tmp", context_path)
+
+        if self.checkpoint is None:
+            self.checkpoint = IngestionCheckpoint()
+        self.checkpoint.path = os.path.join(directory, CHECKPOINT_FILE)
+        self.checkpoint.commit()
+
+    def memory_bytes(self) -> int:
+        """
+        Stima della memoria occupata dal knowledge graph e dalle serie sensore registrate
+
+        Returns:
+            Byte stimati
+        """
+        with self._graph_lock:
+            total = self.knowledge_graph.nbytes
+            for readings in self.sensor_data.values():
+                for series in readings.values():
+                    if isinstance(series, TimeSeries):
+                        total += series.nbytes
+        return total
+
+    def load_state(self, directory: str) -> bool:
+        """
+        Ripristina lo stato salvato con save_state e ne carica il checkpoint, che
+        i loader del DataManager usano per restituire solo i dati nuovi
+
+        Args:
+            directory: Directory dello stato
+
+        Returns:
+            True se è stato trovato uno stato salvato
+        """
+        self.checkpoint = IngestionCheckpoint(os.path.join(directory, CHECKPOINT_FILE))
+
+        graph_path = os.path.join(directory, GRAPH_FILE)
+        if not os.path.exists(graph_path):
+            return False
+
+        with self._graph_lock:
+            self.knowledge_graph = TripleStore.load(graph_path)
+            series_path = os.path.join(directory, PENDING_SERIES_FILE)
+            if os.path.exists(series_path):
+                # I triplet di riepilogo sono già nel grafo: add_series non li duplica
+                for series, source in load_observation_series(series_path):
+                    self.knowledge_graph.add_series(series, source)
+            self.query_engine = QueryEngine(self.knowledge_graph)
+            # Il nuovo store ha una propria numerazione delle versioni
+            self._query_memo.clear()
+            self._query_memo_version = None
+
+        sensor_path = os.path.join(directory, SENSOR_CONTEXT_FILE)
+        if os.path.exists(sensor_path):
+            self.sensor_data = load_series(sensor_path)
+        context_path = os.path.join(directory, CONTEXT_FILE)
+        if os.path.exists(context_path):
+            with open(context_path, "r") as f:
+                context = json.load(f)
+            self.profile_data = context.get("profile") or {}
+            self.app_data = context.get("app") or {}
+        return True
+
+    def query_knowledge_graph(
+        self, query_str: str, sources: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, str]]:
         """
         Esegue una query sul knowledge graph
 
         Args:
-            query_str: Stringa di query in formato SPARQL-like
+            query_str: Stringa di query in formato SPARQL (pattern multipli,
+                       FILTER con confronti, ORDER BY, LIMIT/OFFSET)
+            sources: Fonti visibili alla query (es. ["voice", "sensor"]); None per tutte
+
+        Returns:
+            Lista di binding variabile -> valore per le variabili proiettate
+
+        Raises:
+            ValueError: Se la query non rientra nel sottoinsieme SPARQL supportato
+        """
+        results, _ = self.memoized_query(query_str, sources)
+        return list(results)
+
+    def memoized_query(
+        self, query_str: str, sources: Optional[Iterable[str]] = None
+    ) -> Tuple[List[Dict[str, str]], bool]:
+        """
+        Esegue una query riusando il risultato di un'esecuzione precedente,
+        se il grafo non è cambiato nel frattempo
+
+        Args:
+            query_str: Stringa di query in formato SPARQL
+            sources: Fonti visibili alla query; None per tutte
 
         Returns:
-            Lista di triplet corrispondenti
-        """
-        # Implementazione semplificata di parsing query
-        filters = {}
-
-        # Parsing base per scopo dimostrativo
-        if "FILTER" in query_str:
-            filter_parts = query_str.split("FILTER")[1].strip("(){} ").split(" AND ")
-            for part in filter_parts:
-                if "=" in part:
-                    field, value = part.split("=")
-                    field = field.strip("? ")
-                    value = value.strip(" \"'")
-                    filters[field] = value
-
-        # Applicazione filtri al knowledge graph
-        results = []
-        for triplet_id, data in self.knowledge_graph.items():
-            triplet = data["triplet"]
-
-            # Verifica se il triplet corrisponde a tutti i filtri
-            match = True
-            for field, value in filters.items():
-                if field in triplet and triplet[field] != value:
-                    match = False
-                    break
-
-            if match:
-                results.append(triplet)
-
-        return results
+            (risultati, True se ripresi dal memo); la lista è condivisa con il memo
+            e non va modificata
+
+        Raises:
+            ValueError: Se la query non rientra nel sottoinsieme SPARQL supportato
+        """
+        key = (None if sources is None else tuple(sorted(set(sources))), query_str.strip())
+
+        with self._graph_lock:
+            # Un grafo modificato invalida tutti i risultati memorizzati
+            if self._query_memo_version != self.knowledge_graph.version:
+                self._query_memo.clear()
+                self._query_memo_version = self.knowledge_graph.version
+
+            results = self._query_memo.get(key)
+            if results is not None:
+                self._query_memo.move_to_end(key)
+                return results, True
+
+            engine = self.query_engine
+            if sources is not None:
+                engine = QueryEngine(self.graph_view(sources))
+            results = engine.execute(query_str)
+
+            self._query_memo[key] = results
+            while len(self._query_memo) > self.query_memo_size:
+                self._query_memo.popitem(last=False)
+            return results, False
+
+    def interactive_analysis(
+        self,
+        sources: Optional[Iterable[str]] = None,
+        max_iterations: Optional[int] = None,
+        page_size: Optional[int] = None,
+        use_cache: bool = True,
+    ) -> InteractiveAnalysis:
+        """
+        Analisi in cui il LLM interroga il knowledge graph per più iterazioni
+        prima di identificare i trigger di intervento
+
+        Args:
+            sources: Fonti da considerare; None per tutte
+            max_iterations: Numero massimo di iterazioni con query
+                            (default: analysis.interactive.max_iterations)
+            page_size: Risultati per pagina (default: analysis.interactive.page_size)
+            use_cache: Se False le risposte non vengono lette né salvate nella cache LLM
+
+        Returns:
+            Sessione conclusa: risultato in result, tempi per iterazione in timings()
+        """
+        session = InteractiveAnalysis(self, sources, max_iterations, page_size, use_cache)
+
+        # Come nell'analisi singola, senza finestre sospette il LLM non viene interpellato
+        candidate_windows = self._prescreen(session.sources)
+        if candidate_windows == []:
+            session.result = self._prescreen_negative_result()
+            return session
+
+        session.run(candidate_windows)
+        return session
+
+
+def _merge_nested(target: Dict[str, Any], update: Dict[str, Any]):
+    """Unisce update in target, ricorsivamente sui dizionari annidati."""
+    for key, value in update.items():
+        current = target.get(key)
+        if isinstance(value, dict):
+            # I dizionari vengono copiati: i dati ricevuti possono essere condivisi
+            # (es. output degli stadi della simulazione) e non vanno modificati
+            if not isinstance(current, dict):
+                current = target[key] = {}
+            _merge_nested(current, value)
+        else:
+            target[key] = value
@@ -0,0 +1,223 @@
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.config_loader import ConfigLoader
+from llm.provider import invoke_structured
+from models.output_schemas import AnalysisResult
+
+_QUERY_RE = re.compile(r"QUERY:\s*(SELECT.+)")
+_MORE_RE = re.compile(r"MORE:\s*(p\d+)")
+
+# Lunghezza massima di un valore nei risultati restituiti al modello
+_MAX_VALUE_CHARS = 200
+
+_PROTOCOL = """
+        Per interrogare il knowledge graph scrivi nel campo reasoning una query per riga nel formato
+        QUERY: SELECT ...
+        I risultati sono restituiti a pagine: se una query ha altri risultati riceverai un token,
+        e potrai chiedere la pagina successiva scrivendo MORE: <token>.
+        Quando hai raccolto abbastanza evidenze rispondi con le conclusioni, senza altre query.
+"""
+
+
+class IterationRecord:
+    """Tempi e volumi di un'iterazione dell'analisi interattiva."""
+
+    def __init__(self, iteration: int):
+        self.iteration = iteration
+        self.llm_seconds = 0.0
+        self.query_seconds = 0.0
+        self.queries: List[str] = []
+        self.rows = 0
+        self.memo_hits = 0
+        self.errors = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "iteration": self.iteration,
+            "llm_seconds": round(self.llm_seconds, 4),
+            "query_seconds": round(self.query_seconds, 4),
+            "queries": list(self.queries),
+            "rows": self.rows,
+            "memo_hits": self.memo_hits,
+            "errors": self.errors,
+        }
+
+
+class InteractiveAnalysis:
+    """
+    Analisi interattiva: il LLM interroga il knowledge graph per più iterazioni
+    prima di fornire le conclusioni.
+
+    A ogni iterazione le query (QUERY: SELECT ...) e le richieste di pagine successive
+    (MORE: <token>) presenti nel campo reasoning vengono eseguite e i risultati
+    restituiti nella conversazione, a pagine di dimensione fissa, così che il contesto
+    non cresca con la dimensione dei risultati. Le query passano per il memo del brain,
+    valido finché la versione del grafo non cambia: ripetere una query o chiederne la
+    pagina successiva non la riesegue. Il numero di iterazioni è limitato; al limite il
+    modello viene invitato a concludere. Per ogni iterazione sono registrati i tempi
+    del LLM e delle query.
+    """
+
+    def __init__(
+        self,
+        brain: Any,
+        sources: Optional[Iterable[str]] = None,
+        max_iterations: Optional[int] = None,
+        page_size: Optional[int] = None,
+        use_cache: bool = True,
+    ):
+        """
+        Args:
+            brain: PersonalDigitalBrain da interrogare
+            sources: Fonti visibili all'analisi; None per tutte
+            max_iterations: Numero massimo di iterazioni con query
+                            (default: analysis.interactive.max_iterations)
+            page_size: Risultati per pagina (default: analysis.interactive.page_size)
+            use_cache: Se False le risposte non vengono lette né salvate nella cache LLM
+        """
+        config = ConfigLoader()
+        self.brain = brain
+        self.sources = None if sources is None else list(sources)
+        self.max_iterations = max_iterations or config.get_value(
+            "analysis.interactive.max_iterations", 5
+        )
+        self.page_size = page_size or config.get_value("analysis.interactive.page_size", 25)
+        # Query eseguite al massimo per iterazione, le altre vengono ignorate
+        self.max_queries = config.get_value("analysis.interactive.max_queries_per_iteration", 3)
+        self.use_cache = use_cache
+
+        self.conversation: List[Dict[str, str]] = []
+        self.iterations: List[IterationRecord] = []
+        self.result: Optional[AnalysisResult] = None
+        self.total_seconds = 0.0
+
+        # Token di paginazione -> (query, offset della pagina successiva)
+        self._pages: Dict[str, Tuple[str, int]] = {}
+
+    def run(self, candidate_windows: Optional[List[Any]] = None) -> AnalysisResult:
+        """
+        Esegue l'analisi fino alle conclusioni del modello o al limite di iterazioni
+
+        Args:
+            candidate_windows: Finestre del pre-screening da includere nel prompt iniziale
+
+        Returns:
+            Risultato finale dell'analisi
+        """
+        started = time.perf_counter()
+        prompt = self.brain._create_analysis_prompt(candidate_windows, self.sources)
+        self.conversation = [{"role": "system", "content": prompt + _PROTOCOL}]
+
+        response = None
+        for iteration in range(1, self.max_iterations + 1):
+            record = IterationRecord(iteration)
+            self.iterations.append(record)
+
+            response = self._invoke(record)
+            feedback = self._answer(response.reasoning, record)
+            if feedback is None:
+                # Nessuna query: la risposta contiene le conclusioni
+                break
+
+            if iteration < self.max_iterations:
+                follow_up = "Puoi continuare l'analisi con altre query o fornire le tue conclusioni."
+            else:
+                follow_up = (
+                    f"Hai raggiunto il limite di {self.max_iterations} iterazioni: "
+                    "fornisci ora le tue conclusioni, senza altre query."
+                )
+            self.conversation.append({"role": "assistant", "content": response.reasoning})
+            self.conversation.append({"role": "user", "content": f"{feedback}\n\n{follow_up}"})
+        else:
+            # Limite raggiunto: un'ultima richiesta per le conclusioni
+            record = IterationRecord(self.max_iterations + 1)
+            self.iterations.append(record)
+            response = self._invoke(record)
+
+        self.result = response
+        self.total_seconds = time.perf_counter() - started
+        return response
+
+    def timings(self) -> List[Dict[str, Any]]:
+        """Tempi e volumi di ogni iterazione, serializzabili in JSON."""
+        return [record.to_dict() for record in self.iterations]
+
+    def _invoke(self, record: IterationRecord) -> AnalysisResult:
+        started = time.perf_counter()
+        response = invoke_structured(
+            AnalysisResult, list(self.conversation), use_cache=self.use_cache
+        )
+        record.llm_seconds = time.perf_counter() - started
+        return response
+
+    def _answer(self, reasoning: str, record: IterationRecord) -> Optional[str]:
+        """
+        Esegue query e richieste di pagina presenti nella risposta
+
+        Returns:
+            Testo dei risultati da restituire al modello, o None se non ci sono richieste
+        """
+        requests: List[Tuple[str, int]] = []
+        for line in (reasoning or "").splitlines():
+            query = _QUERY_RE.search(line)
+            if query:
+                requests.append((query.group(1).strip(), 0))
+                continue
+            more = _MORE_RE.search(line)
+            if more and more.group(1) in self._pages:
+                requests.append(self._pages[more.group(1)])
+        if not requests:
+            return None
+
+        sections = []
+        started = time.perf_counter()
+        for query, offset in requests[: self.max_queries]:
+            record.queries.append(query if not offset else f"{query} [offset {offset}]")
+            sections.append(self._page(query, offset, record))
+        if len(requests) > self.max_queries:
+            sections.append(
+                f"Eseguite solo le prime {self.max_queries} richieste; "
+                f"{len(requests) - self.max_queries} ignorate."
+            )
+        record.query_seconds = time.perf_counter() - started
+        return "\n\n".join(sections)
+
+    def _page(self, query: str, offset: int, record: IterationRecord) -> str:
+        """Esegue (o riprende dal memo) una query e ne restituisce una pagina di risultati."""
+        try:
+            results, memo_hit = self.brain.memoized_query(query, self.sources)
+        except ValueError as e:
+            record.errors += 1
+            return f"Query: {query}\nErrore: {e}"
+
+        record.memo_hits += int(memo_hit)
+        page = results[offset: offset + self.page_size]
+        record.rows += len(page)
+
+        lines = [f"Query: {query}"]
+        if not results:
+            lines.append("Nessun risultato.")
+        else:
+            lines.append(
+                f"Risultati {offset + 1}-{offset + len(page)} di {len(results)}:"
+            )
+            lines.extend(
+                "- " + ", ".join(f"?{var}: {_truncate(value)}" for var, value in binding.items())
+                for binding in page
+            )
+
+        remaining = len(results) - offset - len(page)
+        if remaining > 0:
+            token = f"p{len(self._pages) + 1}"
+            self._pages[token] = (query, offset + len(page))
+            lines.append(f"Altri {remaining} risultati: scrivi MORE: {token} per la pagina successiva.")
+        return "\n".join(lines)
+
+
+def _truncate(value: Any) -> str:
+    text = str(value)
+    if len(text) <= _MAX_VALUE_CHARS:
+        return text
+    return text[:_MAX_VALUE_CHARS] + "..."
@@ -0,0 +1,695 @@
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from pdb.knowledge_graph.triple_store import TripleStore, TripleStoreView
+
+# Espressione regolare del tokenizer: l'ordine delle alternative è significativo
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+|\#[^\n]*)
+    | (?P<var>[?$][A-Za-z_][\w]*)
+    | (?P<iri><[^<>\s]*>)
+    | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<datatype>\^\^)
+    | (?P<number>[+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w:]))
+    | (?P<op>!=|<=|>=|&&|\|\||[=<>!(){}.,*])
+    | (?P<name>[A-Za-z_][\w\-]*:[^\s{}()<>"',;]*|[A-Za-z_][\w\-]*)
+    """,
+    re.VERBOSE,
+)
+
+_COMPARISONS = {"=", "!=", "<", "<=", ">", ">="}
+_FUNCTIONS = {"CONTAINS", "STRSTARTS", "STRENDS", "BOUND"}
+
+Term = Tuple[str, str]  # ("var", nome) oppure ("const", valore)
+
+
+class QueryPattern:
+    """Triple pattern di un basic graph pattern."""
+
+    def __init__(self, subject: Term, predicate: Term, obj: Term):
+        self.terms = (subject, predicate, obj)
+
+    def variables(self) -> Set[str]:
+        """Restituisce le variabili del pattern."""
+        return {value for kind, value in self.terms if kind == "var"}
+
+    def __repr__(self) -> str:
+        return " ".join(
+            f"?{value}" if kind == "var" else value for kind, value in self.terms
+        )
+
+
+class FilterExpression:
+    """Nodo dell'albero di un'espressione FILTER."""
+
+    def __init__(self, op: str, args: List[Any]):
+        self.op = op
+        self.args = args
+
+    def variables(self) -> Set[str]:
+        """Restituisce le variabili referenziate dall'espressione."""
+        found = set()
+        for arg in self.args:
+            if isinstance(arg, FilterExpression):
+                found |= arg.variables()
+            elif arg[0] == "var":
+                found.add(arg[1])
+        return found
+
+
+class SparqlQuery:
+    """Rappresentazione di una query SELECT già analizzata."""
+
+    def __init__(self):
+        self.projection: Optional[List[str]] = None  # None significa SELECT *
+        self.distinct = False
+        self.patterns: List[QueryPattern] = []
+        self.filters: List[FilterExpression] = []
+        self.order_by: List[Tuple[str, bool]] = []  # (variabile, discendente)
+        self.limit: Optional[int] = None
+        self.offset = 0
+
+    def variables(self) -> List[str]:
+        """Restituisce le variabili dei pattern nell'ordine di comparsa."""
+        ordered = []
+        for pattern in self.patterns:
+            for kind, value in pattern.terms:
+                if kind == "var" and value not in ordered:
+                    ordered.append(value)
+        return ordered
+
+
+class QueryParser:
+    """
+    Parser per un sottoinsieme di SPARQL:
+    SELECT [DISTINCT] (?var ... | *) WHERE { pattern . pattern . FILTER(...) }
+    [ORDER BY [ASC|DESC](?var) ...] [LIMIT n] [OFFSET n]
+    """
+
+    def parse(self, query_str: str) -> SparqlQuery:
+        """
+        Analizza una stringa di query
+
+        Args:
+            query_str: Query in formato SPARQL
+
+        Returns:
+            Query analizzata
+
+        Raises:
+            ValueError: Se la query non rispetta il sottoinsieme supportato
+        """
+        self._tokens = self._tokenize(query_str)
+        self._pos = 0
+        query = SparqlQuery()
+
+        self._expect_keyword("SELECT")
+        if self._accept_keyword("DISTINCT"):
+            query.distinct = True
+
+        if self._accept("op", "*"):
+            query.projection = None
+        else:
+            query.projection = []
+            while self._peek_kind() == "var":
+                query.projection.append(self._next()[1])
+            if not query.projection:
+                raise ValueError("Query non valida: nessuna variabile nella SELECT")
+
+        self._accept_keyword("WHERE")
+        self._expect("op", "{")
+        self._parse_group(query)
+        self._expect("op", "}")
+
+        self._parse_modifiers(query)
+
+        if self._pos < len(self._tokens):
+            raise ValueError(f"Query non valida: token inatteso '{self._tokens[self._pos][1]}'")
+        if not query.patterns:
+            raise ValueError("Query non valida: nessun triple pattern nella clausola WHERE")
+
+        return query
+
+    def _parse_group(self, query: SparqlQuery):
+        """Analizza il contenuto del blocco WHERE."""
+        while not self._check("op", "}"):
+            if self._accept_keyword("FILTER"):
+                # Le congiunzioni vengono separate per valutare ogni termine il prima possibile
+                query.filters.extend(_conjuncts(self._parse_filter_call()))
+            else:
+                subject = self._parse_term()
+                # Più pattern sullo stesso soggetto separati da ';' non sono supportati
+                predicate = self._parse_term(allow_a=True)
+                obj = self._parse_term()
+                query.patterns.append(QueryPattern(subject, predicate, obj))
+                while self._accept("op", ","):
+                    query.patterns.append(QueryPattern(subject, predicate, self._parse_term()))
+
+            self._accept("op", ".")
+
+    def _parse_modifiers(self, query: SparqlQuery):
+        """Analizza ORDER BY, LIMIT e OFFSET."""
+        while self._pos < len(self._tokens):
+            if self._accept_keyword("ORDER"):
+                self._expect_keyword("BY")
+                while True:
+                    descending = False
+                    if self._accept_keyword("DESC"):
+                        descending = True
+                    elif not self._accept_keyword("ASC"):
+                        if self._peek_kind() != "var":
+                            break
+                        query.order_by.append((self._next()[1], False))
+                        continue
+                    self._expect("op", "(")
+                    query.order_by.append((self._expect_kind("var")[1], descending))
+                    self._expect("op", ")")
+                if not query.order_by:
+                    raise ValueError("Query non valida: ORDER BY senza variabili")
+            elif self._accept_keyword("LIMIT"):
+                query.limit = self._parse_count()
+            elif self._accept_keyword("OFFSET"):
+                query.offset = self._parse_count()
+            else:
+                break
+
+    def _parse_count(self) -> int:
+        """Analizza un intero non negativo per LIMIT/OFFSET."""
+        token = self._expect_kind("number")
+        if not token[1].isdigit():
+            raise ValueError(f"Query non valida: valore non intero '{token[1]}'")
+        return int(token[1])
+
+    def _parse_filter_call(self) -> FilterExpression:
+        """Analizza FILTER(espressione) o FILTER funzione(...)."""
+        if self._check("op", "("):
+            self._next()
+            expression = self._parse_or()
+            self._expect("op", ")")
+            return expression
+        return self._parse_primary()
+
+    def _parse_or(self) -> FilterExpression:
+        left = self._parse_and()
+        while self._accept("op", "||") or self._accept_keyword("OR"):
+            left = FilterExpression("||", [left, self._parse_and()])
+        return left
+
+    def _parse_and(self) -> FilterExpression:
+        left = self._parse_unary()
+        while self._accept("op", "&&") or self._accept_keyword("AND"):
+            left = FilterExpression("&&", [left, self._parse_unary()])
+        return left
+
+    def _parse_unary(self) -> FilterExpression:
+        if self._accept("op", "!") or self._accept_keyword("NOT"):
+            return FilterExpression("!", [self._parse_unary()])
+        return self._parse_primary()
+
+    def _parse_primary(self) -> FilterExpression:
+        if self._accept("op", "("):
+            expression = self._parse_or()
+            self._expect("op", ")")
+            return expression
+
+        kind, value = self._peek()
+        if kind == "name" and value.upper() in _FUNCTIONS:
+            self._next()
+            self._expect("op", "(")
+            args = [self._parse_operand()]
+            while self._accept("op", ","):
+                args.append(self._parse_operand())
+            self._expect("op", ")")
+            return FilterExpression(value.upper(), args)
+
+        left = self._parse_operand()
+        kind, op = self._peek()
+        if kind != "op" or op not in _COMPARISONS:
+            raise ValueError(f"Query non valida: operatore di confronto atteso, trovato '{op}'")
+        self._next()
+        return FilterExpression(op, [left, self._parse_operand()])
+
+    def _parse_operand(self) -> Term:
+        kind, value = self._peek()
+        if kind == "number":
+            self._next()
+            return ("const", value)
+        return self._parse_term()
+
+    def _parse_term(self, allow_a: bool = False) -> Term:
+        """Analizza una variabile, un IRI, un nome con prefisso o un letterale."""
+        kind, value = self._next()
+        if kind == "var":
+            return ("var", value)
+        if kind == "iri":
+            return ("const", value[1:-1])
+        if kind == "string":
+            literal = _unescape(value[1:-1])
+            # I tipi di dato dei letterali (^^xsd:...) non sono memorizzati nel grafo
+            if self._accept("datatype", "^^"):
+                self._next()
+            return ("const", literal)
+        if kind == "number":
+            return ("const", value)
+        if kind == "name":
+            if allow_a and value == "a":
+                return ("const", "rdf:type")
+            if ":" in value:
+                # Un nome locale non può terminare con '.': è il separatore dei pattern
+                if value.endswith(".") and not value.endswith(":."):
+                    stripped = value.rstrip(".")
+                    self._tokens.insert(self._pos, ("op", "."))
+                    return ("const", stripped)
+                return ("const", value)
+        raise ValueError(f"Query non valida: termine inatteso '{value}'")
+
+    # --- Gestione token ---
+
+    def _tokenize(self, query_str: str) -> List[Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        while pos < len(query_str):
+            match = _TOKEN_RE.match(query_str, pos)
+            if not match:
+                raise ValueError(f"Query non valida: carattere inatteso '{query_str[pos]}'")
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "ws":
+                continue
+            value = match.group(kind)
+            if kind == "var":
+                value = value[1:]
+            tokens.append((kind, value))
+        return tokens
+
+    def _peek(self) -> Tuple[str, str]:
+        if self._pos >= len(self._tokens):
+            return ("eof", "")
+        return self._tokens[self._pos]
+
+    def _peek_kind(self) -> str:
+        return self._peek()[0]
+
+    def _next(self) -> Tuple[str, str]:
+        token = self._peek()
+        if token[0] == "eof":
+            raise ValueError("Query non valida: fine inattesa della query")
+        self._pos += 1
+        return token
+
+    def _check(self, kind: str, value: str) -> bool:
+        return self._peek() == (kind, value)
+
+    def _accept(self, kind: str, value: str) -> bool:
+        if self._check(kind, value):
+            self._pos += 1
+            return True
+        return False
+
+    def _accept_keyword(self, keyword: str) -> bool:
+        kind, value = self._peek()
+        if kind == "name" and value.upper() == keyword:
+            self._pos += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value: str):
+        if not self._accept(kind, value):
+            raise ValueError(f"Query non valida: atteso '{value}', trovato '{self._peek()[1]}'")
+
+    def _expect_keyword(self, keyword: str):
+        if not self._accept_keyword(keyword):
+            raise ValueError(f"Query non valida: atteso '{keyword}', trovato '{self._peek()[1]}'")
+
+    def _expect_kind(self, kind: str) -> Tuple[str, str]:
+        if self._peek_kind() != kind:
+            raise ValueError(f"Query non valida: token inatteso '{self._peek()[1]}'")
+        return self._next()
+
+
+class QueryEngine:
+    """
+    Esegue query SPARQL (sottoinsieme) su un TripleStore o su una sua vista per fonti.
+
+    I triple pattern vengono ordinati da un planner basato sulla cardinalità
+    stimata tramite gli indici dello store, poi uniti con un index nested-loop
+    join sulle variabili condivise. I FILTER vengono valutati non appena tutte
+    le loro variabili sono legate.
+    """
+
+    def __init__(self, store: Union[TripleStore, TripleStoreView]):
+        self.store = store
+        self.parser = QueryParser()
+
+    def execute(self, query_str: str) -> List[Dict[str, str]]:
+        """
+        Esegue una query e restituisce i binding delle variabili proiettate
+
+        Args:
+            query_str: Query in formato SPARQL
+
+        Returns:
+            Lista di dizionari variabile -> valore
+
+        Raises:
+            ValueError: Se la query non è valida
+        """
+        query = self.parser.parse(query_str)
+        return list(self.run(query))
+
+    def run(self, query: SparqlQuery) -> Iterator[Dict[str, str]]:
+        """
+        Esegue una query già analizzata
+
+        Args:
+            query: Query analizzata
+
+        Returns:
+            Iteratore di binding decodificati
+        """
+        variables = query.variables()
+        projection = query.projection if query.projection is not None else variables
+        for name in projection:
+            if name not in variables:
+                raise ValueError(f"Query non valida: variabile '?{name}' non usata nei pattern")
+
+        decode = self.store.terms.decode
+        bindings = self._solve(query)
+
+        if query.order_by:
+            # L'ordinamento richiede di materializzare tutte le soluzioni
+            solutions = list(bindings)
+            for name, descending in reversed(query.order_by):
+                solutions.sort(
+                    key=lambda b: _sort_key(decode(b[name]) if name in b else ""),
+                    reverse=descending,
+                )
+            bindings = iter(solutions)
+
+        seen = set()
+        skipped = 0
+        produced = 0
+        for binding in bindings:
+            row = tuple(binding[name] for name in projection)
+            if query.distinct:
+                if row in seen:
+                    continue
+                seen.add(row)
+
+            if skipped < query.offset:
+                skipped += 1
+                continue
+            if query.limit is not None and produced >= query.limit:
+                break
+
+            produced += 1
+            yield {name: decode(term_id) for name, term_id in zip(projection, row)}
+
+    def explain(self, query_str: str) -> List[str]:
+        """
+        Restituisce l'ordine di esecuzione dei pattern scelto dal planner
+
+        Args:
+            query_str: Query in formato SPARQL
+
+        Returns:
+            Pattern nell'ordine di esecuzione con la cardinalità stimata
+        """
+        query = self.parser.parse(query_str)
+        self._materialize_series(query)
+        constants = self._equality_constants(query)
+        if constants is None:
+            return []
+        plan = self._plan(query.patterns, constants)
+        return [f"{pattern} (stima: {estimate})" for pattern, estimate in plan]
+
+    def _solve(self, query: SparqlQuery) -> Iterator[Dict[str, int]]:
+        """Calcola i binding (ID dei termini) che soddisfano pattern e filtri."""
+        self._materialize_series(query)
+        constants = self._equality_constants(query)
+        if constants is None:
+            return iter(())
+
+        plan = self._plan(query.patterns, constants)
+        if any(estimate == 0 for _, estimate in plan):
+            return iter(())
+
+        encoded_plan = []
+        bound = set(constants)
+        pending_filters = list(query.filters)
+        for pattern, _ in plan:
+            encoded = []
+            for kind, value in pattern.terms:
+                if kind == "var":
+                    encoded.append(("var", value))
+                else:
+                    encoded.append(("const", self.store.terms.lookup(value)))
+            bound |= pattern.variables()
+
+            # Spinge ogni filtro subito dopo il pattern che ne lega l'ultima variabile
+            ready = [f for f in pending_filters if f.variables() <= bound]
+            pending_filters = [f for f in pending_filters if f not in ready]
+            encoded_plan.append((encoded, ready))
+
+        if pending_filters:
+            # Filtri su variabili mai legate: vengono valutati alla fine
+            encoded_plan[-1][1].extend(pending_filters)
+
+        initial = {name: term_id for name, term_id in constants.items()}
+        return self._join(encoded_plan, 0, initial)
+
+    def _join(
+        self, plan: List[Tuple[List[Tuple[str, Any]], List[FilterExpression]]], step: int, binding: Dict[str, int]
+    ) -> Iterator[Dict[str, int]]:
+        """Index nested-loop join ricorsivo sui pattern pianificati."""
+        if step == len(plan):
+            yield binding
+            return
+
+        pattern, filters = plan[step]
+        bound_ids = []
+        for kind, value in pattern:
+            if kind == "const":
+                bound_ids.append(value)
+            else:
+                bound_ids.append(binding.get(value))
+
+        for row in self.store.match_ids(*bound_ids):
+            row_ids = self.store.row_ids(row)
+            extended = binding
+            consistent = True
+            for (kind, value), term_id in zip(pattern, row_ids):
+                if kind != "var":
+                    continue
+                current = extended.get(value)
+                if current is None:
+                    if extended is binding:
+                        extended = dict(binding)
+                    extended[value] = term_id
+                elif current != term_id:
+                    # Stessa variabile ripetuta nel pattern con valori diversi
+                    consistent = False
+                    break
+
+            if not consistent:
+                continue
+            if filters and not all(self._evaluate(f, extended) for f in filters):
+                continue
+
+            yield from self._join(plan, step + 1, extended)
+
+    def _materialize_series(self, query: SparqlQuery):
+        """
+        Materializza nello store le osservazioni delle serie temporali che i pattern
+        della query potrebbero richiedere, usando i termini costanti e i filtri ?var = costante
+        """
+        equalities = {}
+        for expression in query.filters:
+            if expression.op != "=" or any(isinstance(a, FilterExpression) for a in expression.args):
+                continue
+            left, right = expression.args
+            if left[0] == "const" and right[0] == "var":
+                left, right = right, left
+            if left[0] == "var" and right[0] == "const":
+                equalities[left[1]] = right[1]
+
+        resolved = [
+            [value if kind == "const" else equalities.get(value) for kind, value in pattern.terms]
+            for pattern in query.patterns
+        ]
+
+        # Vincoli (predicato, oggetto) noti per ogni variabile soggetto
+        related: Dict[str, List[Tuple[str, str]]] = {}
+        for pattern, (_, predicate, obj) in zip(query.patterns, resolved):
+            kind, name = pattern.terms[0]
+            if kind == "var" and predicate is not None and obj is not None:
+                related.setdefault(name, []).append((predicate, obj))
+
+        for pattern, terms in zip(query.patterns, resolved):
+            kind, name = pattern.terms[0]
+            constraints = related.get(name, []) if kind == "var" else []
+            self.store.materialize_series(*terms, related=constraints)
+
+    def _plan(
+        self, patterns: List[QueryPattern], constants: Dict[str, int]
+    ) -> List[Tuple[QueryPattern, int]]:
+        """
+        Ordina i pattern in modo greedy: a ogni passo sceglie il pattern
+        con cardinalità stimata minore, preferendo quelli collegati alle
+        variabili già legate per evitare prodotti cartesiani.
+        """
+        remaining = list(patterns)
+        bound = set(constants)
+        plan = []
+
+        while remaining:
+            best = None
+            for pattern in remaining:
+                estimate = self._estimate(pattern, constants)
+                shared = len(pattern.variables() & bound)
+                disconnected = bool(bound) and shared == 0 and bool(pattern.variables())
+                # Ogni variabile già legata riduce di un ordine di grandezza la stima
+                score = (disconnected, estimate / (10 ** shared))
+                if best is None or score < best[0]:
+                    best = (score, pattern, estimate)
+
+            _, pattern, estimate = best
+            remaining.remove(pattern)
+            bound |= pattern.variables()
+            plan.append((pattern, estimate))
+
+        return plan
+
+    def _estimate(self, pattern: QueryPattern, constants: Dict[str, int]) -> int:
+        """Stima la cardinalità del pattern usando solo i termini costanti."""
+        ids = []
+        for kind, value in pattern.terms:
+            if kind == "var":
+                ids.append(constants.get(value))
+                continue
+            term_id = self.store.terms.lookup(value)
+            if term_id is None:
+                return 0
+            ids.append(term_id)
+        return self.store.estimate_ids(*ids)
+
+    def _equality_constants(self, query: SparqlQuery) -> Optional[Dict[str, int]]:
+        """
+        Individua i filtri di primo livello del tipo ?var = costante e li
+        trasforma in termini vincolati, così da usare gli indici.
+        Restituisce None se una costante non compare nel grafo.
+        """
+        constants = {}
+        pattern_vars = set(query.variables())
+        for expression in query.filters:
+            if expression.op != "=":
+                continue
+            left, right = expression.args
+            if isinstance(left, FilterExpression) or isinstance(right, FilterExpression):
+                continue
+            if left[0] == "const" and right[0] == "var":
+                left, right = right, left
+            if left[0] != "var" or right[0] != "const" or left[1] not in pattern_vars:
+                continue
+
+            # Un confronto numerico (es. 72 = "72.0") è uguaglianza di valore, non di
+            # termine: resta alla valutazione del filtro, qualunque termine contenga il grafo
+            if _to_number(right[1]) is not None:
+                continue
+            term_id = self.store.terms.lookup(right[1])
+            if term_id is None:
+                return None
+            if constants.get(left[1], term_id) != term_id:
+                return None
+            constants[left[1]] = term_id
+        return constants
+
+    def _evaluate(self, expression: FilterExpression, binding: Dict[str, int]) -> bool:
+        """Valuta un'espressione FILTER su un binding."""
+        op = expression.op
+        if op == "&&":
+            return all(self._evaluate(arg, binding) for arg in expression.args)
+        if op == "||":
+            return any(self._evaluate(arg, binding) for arg in expression.args)
+        if op == "!":
+            return not self._evaluate(expression.args[0], binding)
+        if op == "BOUND":
+            return expression.args[0][1] in binding
+
+        values = [self._operand_value(arg, binding) for arg in expression.args]
+        if any(value is None for value in values):
+            return False
+
+        if op in _COMPARISONS:
+            return _compare(values[0], values[1], op)
+
+        text, part = values[0], values[1]
+        if op == "CONTAINS":
+            return part.lower() in text.lower()
+        if op == "STRSTARTS":
+            return text.startswith(part)
+        if op == "STRENDS":
+            return text.endswith(part)
+        return False
+
+    def _operand_value(self, operand: Term, binding: Dict[str, int]) -> Optional[str]:
+        kind, value = operand
+        if kind == "var":
+            term_id = binding.get(value)
+            return None if term_id is None else self.store.terms.decode(term_id)
+        return value
+
+
+def _conjuncts(expression: FilterExpression) -> List[FilterExpression]:
+    """Scompone un'espressione nei suoi termini in congiunzione (&&)."""
+    if expression.op != "&&":
+        return [expression]
+    found = []
+    for arg in expression.args:
+        found.extend(_conjuncts(arg))
+    return found
+
+
+def _to_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _compare(left: str, right: str, op: str) -> bool:
+    """Confronta due valori: numericamente se entrambi sono numeri, altrimenti come stringhe."""
+    left_number = _to_number(left)
+    right_number = _to_number(right)
+    a: Union[str, float] = left
+    b: Union[str, float] = right
+    if left_number is not None and right_number is not None:
+        a, b = left_number, right_number
+    elif (left_number is None) != (right_number is None) and op not in ("=", "!="):
+        # Come in SPARQL, l'ordinamento tra un numero e una stringa non è definito
+        return False
+
+    if op == "=":
+        return a == b
+    if op == "!=":
+        return a != b
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+def _sort_key(value: str) -> Tuple[int, Union[float, str]]:
+    """Chiave di ordinamento: i numeri precedono le stringhe."""
+    number = _to_number(value)
+    if number is not None:
+        return (0, number)
+    return (1, value)
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
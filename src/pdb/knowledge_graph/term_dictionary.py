@@ -0,0 +1,85 @@
+import sys
+from typing import Dict, Iterable, List, Optional
+
+# Memoria stimata per termine oltre alla stringa: voce del dizionario e della lista
+_ENTRY_BYTES = 120
+
+
+class TermDictionary:
+    """
+    Dizionario dei termini del knowledge graph: associa ogni IRI o letterale
+    a un identificativo intero, così che ogni stringa venga memorizzata una sola volta.
+    """
+
+    def __init__(self):
+        self._term_to_id: Dict[str, int] = {}
+        self._id_to_term: List[str] = []
+        self._nbytes = 0
+
+    def encode(self, term: str) -> int:
+        """
+        Restituisce l'ID del termine, registrandolo se non ancora presente
+
+        Args:
+            term: IRI o letterale
+
+        Returns:
+            Identificativo intero del termine
+        """
+        term_id = self._term_to_id.get(term)
+        if term_id is None:
+            term_id = len(self._id_to_term)
+            self._term_to_id[term] = term_id
+            self._id_to_term.append(term)
+            self._nbytes += sys.getsizeof(term) + _ENTRY_BYTES
+        return term_id
+
+    def lookup(self, term: str) -> Optional[int]:
+        """
+        Restituisce l'ID del termine senza registrarlo
+
+        Args:
+            term: IRI o letterale
+
+        Returns:
+            Identificativo intero o None se il termine è sconosciuto
+        """
+        return self._term_to_id.get(term)
+
+    def decode(self, term_id: int) -> str:
+        """
+        Restituisce il termine associato a un ID
+
+        Args:
+            term_id: Identificativo intero
+
+        Returns:
+            IRI o letterale corrispondente
+        """
+        return self._id_to_term[term_id]
+
+    def terms(self) -> List[str]:
+        """Restituisce i termini ordinati per ID."""
+        return list(self._id_to_term)
+
+    def load(self, terms: Iterable[str]):
+        """
+        Sostituisce il contenuto del dizionario con i termini forniti, nell'ordine degli ID
+
+        Args:
+            terms: Termini ordinati per ID
+        """
+        self._id_to_term = list(terms)
+        self._term_to_id = {term: i for i, term in enumerate(self._id_to_term)}
+        self._nbytes = sum(sys.getsizeof(term) + _ENTRY_BYTES for term in self._id_to_term)
+
+    @property
+    def nbytes(self) -> int:
+        """Stima della memoria occupata dai termini, aggiornata a ogni inserimento."""
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._id_to_term)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._term_to_id
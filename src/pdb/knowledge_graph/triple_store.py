@@ -0,0 +1,1011 @@
+import json
+import os
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from pdb.knowledge_graph.term_dictionary import TermDictionary
+
+Triple = Tuple[str, str, str]
+EncodedTriple = Tuple[int, int, int]
+Rows = Union[int, array]
+
+# Bit assegnati alle fonti note; fonti nuove ricevono il primo bit libero
+DEFAULT_SOURCE_BITS = {"voice": 1, "profile": 2, "sensor": 4, "app": 8}
+
+# Memoria stimata di una chiave degli indici e dei contatori (voce del dict e intero)
+_INDEX_KEY_BYTES = 100
+
+
+class TripleStore:
+    """
+    Triple store in memoria con indici hash SPO, POS e OSP.
+
+    I termini sono codificati come interi tramite un TermDictionary e i triplet
+    sono memorizzati in array compatti (una colonna per soggetto, predicato e
+    oggetto) affiancati da una bitmask con le fonti (voice, profile, sensor, app)
+    da cui ogni triplet è stato ricavato. Gli indici contengono solo numeri di riga:
+    SPO e OSP mappano il primo termine sulle sue righe (i termini successivi si
+    filtrano sulle colonne), POS mappa predicato e oggetto sulle righe.
+    Ritirare l'ultima fonte di un triplet lo elimina: l'ultima riga ne prende il posto.
+    """
+
+    def __init__(self):
+        self.terms = TermDictionary()
+
+        # Colonne dei triplet: la riga i-esima è (s[i], p[i], o[i])
+        self._subjects = array("i")
+        self._predicates = array("i")
+        self._objects = array("i")
+        self._source_masks = array("I")
+
+        # Indici: termine -> righe, oppure predicato -> oggetto -> righe.
+        # Un gruppo con una sola riga è memorizzato come intero, per risparmiare memoria
+        self._spo: Dict[int, Rows] = {}
+        self._pos: Dict[int, Dict[int, Rows]] = {}
+        self._osp: Dict[int, Rows] = {}
+
+        # Contatori per termine, usati per stimare la cardinalità dei pattern
+        self._subject_counts: Dict[int, int] = {}
+        self._predicate_counts: Dict[int, int] = {}
+        self._object_counts: Dict[int, int] = {}
+
+        self._source_bits: Dict[str, int] = dict(DEFAULT_SOURCE_BITS)
+        self._used_sources_mask = 0
+
+        # Serie di osservazioni i cui triplet non sono ancora stati materializzati
+        self._pending_series: List[Tuple[Any, int]] = []
+
+        # Versione del contenuto: cresce a ogni triplet o fonte aggiunti, così che
+        # i risultati calcolati sul grafo (es. memo delle query) possano essere invalidati
+        self.version = 0
+
+    def add(self, subject: str, predicate: str, obj: str, source: str) -> bool:
+        """
+        Aggiunge un triplet allo store registrandone la fonte
+
+        Args:
+            subject: Soggetto del triplet
+            predicate: Predicato del triplet
+            obj: Oggetto del triplet
+            source: Fonte del triplet (voice, profile, sensor, app)
+
+        Returns:
+            True se il triplet non era presente nello store
+        """
+        return self.add_encoded(
+            self.terms.encode(subject),
+            self.terms.encode(predicate),
+            self.terms.encode(obj),
+            self.source_bit(source),
+        )
+
+    def add_encoded(self, s: int, p: int, o: int, source_mask: int) -> bool:
+        """
+        Aggiunge un triplet già codificato
+
+        Args:
+            s: ID del soggetto
+            p: ID del predicato
+            o: ID dell'oggetto
+            source_mask: Bitmask delle fonti del triplet
+
+        Returns:
+            True se il triplet non era presente nello store
+        """
+        self._used_sources_mask |= source_mask
+
+        row = self._find_row(s, p, o)
+        if row is not None:
+            # Triplet già presente: aggiorna solo la provenienza
+            if self._source_masks[row] | source_mask != self._source_masks[row]:
+                self._source_masks[row] |= source_mask
+                self.version += 1
+            return False
+
+        self.version += 1
+
+        row = len(self._subjects)
+        self._subjects.append(s)
+        self._predicates.append(p)
+        self._objects.append(o)
+        self._source_masks.append(source_mask)
+
+        self._index(self._spo, s, row)
+        self._index(self._pos.setdefault(p, {}), o, row)
+        self._index(self._osp, o, row)
+
+        self._subject_counts[s] = self._subject_counts.get(s, 0) + 1
+        self._predicate_counts[p] = self._predicate_counts.get(p, 0) + 1
+        self._object_counts[o] = self._object_counts.get(o, 0) + 1
+
+        return True
+
+    def remove(
+        self, subject: str, predicate: str, obj: str, source: Optional[str] = None
+    ) -> bool:
+        """
+        Ritira un triplet da una fonte: il triplet viene eliminato quando non ha
+        più fonti, altrimenti resta con le fonti rimanenti
+
+        Args:
+            subject: Soggetto del triplet
+            predicate: Predicato del triplet
+            obj: Oggetto del triplet
+            source: Fonte da ritirare; None per eliminare il triplet per tutte le fonti
+
+        Returns:
+            True se lo store è cambiato
+        """
+        encoded = self._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return False
+        row = self._find_row(*encoded)
+        if row is None:
+            return False
+        source_mask = self._source_masks[row] if source is None else self.source_bit(source)
+        return self.remove_row_source(row, source_mask)
+
+    def remove_row_source(self, row: int, source_mask: int) -> bool:
+        """
+        Toglie le fonti di una bitmask da una riga, eliminandola se non ne restano.
+        L'ultima riga prende il posto di quella eliminata: i numeri di riga
+        ottenuti prima della rimozione non sono più validi.
+
+        Args:
+            row: Numero di riga
+            source_mask: Bitmask delle fonti da togliere
+
+        Returns:
+            True se la riga aveva almeno una delle fonti
+        """
+        mask = self._source_masks[row]
+        if not mask & source_mask:
+            return False
+
+        self.version += 1
+        if mask & ~source_mask:
+            self._source_masks[row] = mask & ~source_mask
+            return True
+
+        s, p, o = self.row_ids(row)
+        self._unindex(self._spo, s, row)
+        self._unindex(self._pos[p], o, row)
+        if not self._pos[p]:
+            del self._pos[p]
+        self._unindex(self._osp, o, row)
+        _decrement(self._subject_counts, s)
+        _decrement(self._predicate_counts, p)
+        _decrement(self._object_counts, o)
+
+        last = len(self._subjects) - 1
+        if row != last:
+            # L'ultima riga viene spostata nel posto libero e rinumerata negli indici
+            ls, lp, lo = self.row_ids(last)
+            self._renumber(self._spo, ls, last, row)
+            self._renumber(self._pos[lp], lo, last, row)
+            self._renumber(self._osp, lo, last, row)
+            self._subjects[row] = ls
+            self._predicates[row] = lp
+            self._objects[row] = lo
+            self._source_masks[row] = self._source_masks[last]
+
+        self._subjects.pop()
+        self._predicates.pop()
+        self._objects.pop()
+        self._source_masks.pop()
+        return True
+
+    def remove_source(self, source: str, keep: Iterable[Dict[str, str]] = ()) -> int:
+        """
+        Ritira una fonte da tutti i triplet tranne quelli indicati, ad esempio per
+        sostituire i triplet ricavati da un documento che è stato rielaborato
+
+        Args:
+            source: Fonte da ritirare
+            keep: Triplet in formato dizionario che mantengono la fonte
+
+        Returns:
+            Numero di triplet da cui la fonte è stata ritirata
+        """
+        source_mask = self.source_bit(source)
+        kept = set()
+        for triplet in keep:
+            encoded = self._encode_pattern(
+                triplet["subject"], triplet["predicate"], triplet["object"]
+            )
+            if encoded is not None:
+                kept.add(encoded)
+
+        rows = np.flatnonzero(
+            np.frombuffer(self._source_masks, dtype=np.uint32) & source_mask
+        ).tolist()
+        stale = [row for row in rows if self.row_ids(row) not in kept]
+        # Dalla riga più alta: le righe spostate al posto di quelle eliminate
+        # provengono dalla coda e non sono tra quelle ancora da visitare
+        for row in reversed(stale):
+            self.remove_row_source(row, source_mask)
+        return len(stale)
+
+    def add_triplet(self, triplet: Dict[str, str], source: str) -> bool:
+        """
+        Aggiunge un triplet in formato dizionario
+
+        Args:
+            triplet: Dizionario con chiavi subject, predicate, object
+            source: Fonte del triplet
+
+        Returns:
+            True se il triplet non era presente nello store
+        """
+        return self.add(
+            triplet["subject"], triplet["predicate"], triplet["object"], source
+        )
+
+    def add_triplets(self, triplets: Iterable[Dict[str, str]], source: str) -> int:
+        """
+        Aggiunge più triplet in formato dizionario
+
+        Args:
+            triplets: Triplet da aggiungere
+            source: Fonte dei triplet
+
+        Returns:
+            Numero di triplet nuovi inseriti
+        """
+        return self._add_masked(triplets, self.source_bit(source))
+
+    def add_series(self, series: Any, source: str) -> int:
+        """
+        Aggiunge una serie di osservazioni (es. ObservationSeries): vengono inseriti
+        subito solo i triplet di riepilogo del nodo, mentre quelli delle singole
+        osservazioni sono materializzati quando un pattern li richiede
+
+        Args:
+            series: Oggetto con node_triplets(), observation_triplets() e may_match()
+            source: Fonte della serie
+
+        Returns:
+            Numero di triplet nuovi inseriti
+        """
+        source_mask = self.source_bit(source)
+        self._pending_series.append((series, source_mask))
+        self.version += 1
+        return self._add_masked(series.node_triplets(), source_mask)
+
+    def materialize_series(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+        related: Iterable[Tuple[str, str]] = (),
+    ) -> int:
+        """
+        Materializza i triplet delle serie in attesa che possono corrispondere al pattern
+
+        Args:
+            subject: Soggetto vincolato o None
+            predicate: Predicato vincolato o None
+            obj: Oggetto vincolato o None
+            related: Coppie (predicato, oggetto) che lo stesso soggetto deve avere
+                     in altri pattern della query (es. la proprietà osservata)
+
+        Returns:
+            Numero di triplet nuovi inseriti
+        """
+        if not self._pending_series:
+            return 0
+
+        related = list(related)
+        added = 0
+        remaining = []
+        # La materializzazione rende espliciti triplet già presenti in forma logica:
+        # la versione del contenuto non cambia
+        version = self.version
+        for series, source_mask in self._pending_series:
+            if series.may_match(subject, predicate, obj) and all(
+                series.may_match(None, p, o) for p, o in related
+            ):
+                added += self._add_masked(series.observation_triplets(), source_mask)
+            else:
+                remaining.append((series, source_mask))
+        self._pending_series = remaining
+        self.version = version
+        return added
+
+    def pending_series_count(self) -> int:
+        """Restituisce il numero di serie non ancora materializzate."""
+        return len(self._pending_series)
+
+    def pending_series(self) -> List[Tuple[Any, str]]:
+        """
+        Restituisce le serie non ancora materializzate con la loro fonte, ad esempio
+        per salvarle accanto allo store e registrarle di nuovo con add_series
+
+        Returns:
+            Coppie (serie, fonte)
+        """
+        return [
+            (series, self.mask_to_sources(source_mask)[0])
+            for series, source_mask in self._pending_series
+        ]
+
+    def source_bit(self, source: str) -> int:
+        """
+        Restituisce il bit associato a una fonte, assegnandone uno nuovo se necessario
+
+        Args:
+            source: Nome della fonte
+
+        Returns:
+            Bit della fonte
+        """
+        bit = self._source_bits.get(source)
+        if bit is None:
+            bit = 1 << len(self._source_bits)
+            self._source_bits[source] = bit
+        return bit
+
+    def source_mask(self, sources: Iterable[str]) -> int:
+        """
+        Combina più fonti in una bitmask
+
+        Args:
+            sources: Nomi delle fonti
+
+        Returns:
+            Bitmask delle fonti
+        """
+        mask = 0
+        for source in sources:
+            mask |= self.source_bit(source)
+        return mask
+
+    def mask_to_sources(self, mask: int) -> List[str]:
+        """
+        Converte una bitmask nei nomi delle fonti corrispondenti
+
+        Args:
+            mask: Bitmask delle fonti
+
+        Returns:
+            Lista delle fonti, nell'ordine di registrazione
+        """
+        return [source for source, bit in self._source_bits.items() if mask & bit]
+
+    def match_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> Iterator[int]:
+        """
+        Restituisce le righe dei triplet che corrispondono al pattern codificato.
+        Gli ID a None sono variabili; viene usato l'indice che copre
+        i termini vincolati, così da visitare solo le righe pertinenti.
+
+        Args:
+            s: ID del soggetto vincolato o None
+            p: ID del predicato vincolato o None
+            o: ID dell'oggetto vincolato o None
+
+        Returns:
+            Iteratore di numeri di riga
+        """
+        if s is not None:
+            # Le righe di un soggetto sono poche: P e O si filtrano sulle colonne
+            predicates = self._predicates
+            objects = self._objects
+            for row in _iter_rows(self._spo.get(s)):
+                if (p is None or predicates[row] == p) and (
+                    o is None or objects[row] == o
+                ):
+                    yield row
+            return
+
+        if p is not None:
+            if o is not None:
+                yield from _iter_rows(self._pos.get(p, {}).get(o))
+                return
+
+            for rows in self._pos.get(p, {}).values():
+                yield from _iter_rows(rows)
+            return
+
+        if o is not None:
+            yield from _iter_rows(self._osp.get(o))
+            return
+
+        yield from range(len(self._subjects))
+
+    def match(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+    ) -> Iterator[Triple]:
+        """
+        Restituisce i triplet che corrispondono al pattern indicato
+
+        Args:
+            subject: Soggetto vincolato o None
+            predicate: Predicato vincolato o None
+            obj: Oggetto vincolato o None
+
+        Returns:
+            Iteratore di triplet (soggetto, predicato, oggetto)
+        """
+        self.materialize_series(subject, predicate, obj)
+        encoded = self._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return
+
+        for row in self.match_ids(*encoded):
+            yield self.decode_row(row)
+
+    def count_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> int:
+        """
+        Conta i triplet che corrispondono al pattern codificato senza materializzarli
+
+        Args:
+            s: ID del soggetto vincolato o None
+            p: ID del predicato vincolato o None
+            o: ID dell'oggetto vincolato o None
+
+        Returns:
+            Numero di triplet corrispondenti
+        """
+        if s is not None and (p is not None or o is not None):
+            return sum(1 for _ in self.match_ids(s, p, o))
+        if p is not None and o is not None:
+            return _len_rows(self._pos.get(p, {}).get(o))
+        if s is not None:
+            return self._subject_counts.get(s, 0)
+        if p is not None:
+            return self._predicate_counts.get(p, 0)
+        if o is not None:
+            return self._object_counts.get(o, 0)
+        return len(self._subjects)
+
+    def count(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+    ) -> int:
+        """
+        Conta i triplet che corrispondono al pattern senza materializzarli
+
+        Args:
+            subject: Soggetto vincolato o None
+            predicate: Predicato vincolato o None
+            obj: Oggetto vincolato o None
+
+        Returns:
+            Numero di triplet corrispondenti
+        """
+        self.materialize_series(subject, predicate, obj)
+        encoded = self._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return 0
+        return self.count_ids(*encoded)
+
+    def estimate_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> int:
+        """
+        Stima la cardinalità di un pattern codificato, usata dal planner delle query.
+        Sullo store completo coincide con count_ids.
+        """
+        return self.count_ids(s, p, o)
+
+    def view(self, sources: Iterable[str]) -> "TripleStoreView":
+        """
+        Restituisce una vista dello store limitata ai triplet di alcune fonti,
+        senza copiare i dati
+
+        Args:
+            sources: Fonti visibili (es. ["voice", "sensor"])
+
+        Returns:
+            Vista filtrata con la stessa API di lettura dello store
+        """
+        return TripleStoreView(self, self.source_mask(sources))
+
+    def row_ids(self, row: int) -> EncodedTriple:
+        """Restituisce gli ID (soggetto, predicato, oggetto) di una riga."""
+        return (self._subjects[row], self._predicates[row], self._objects[row])
+
+    def row_source_mask(self, row: int) -> int:
+        """Restituisce la bitmask delle fonti di una riga."""
+        return self._source_masks[row]
+
+    def decode_row(self, row: int) -> Triple:
+        """Restituisce il triplet testuale memorizzato in una riga."""
+        decode = self.terms.decode
+        return (
+            decode(self._subjects[row]),
+            decode(self._predicates[row]),
+            decode(self._objects[row]),
+        )
+
+    def get_sources(self, subject: str, predicate: str, obj: str) -> List[str]:
+        """
+        Restituisce le fonti di un triplet
+
+        Args:
+            subject: Soggetto del triplet
+            predicate: Predicato del triplet
+            obj: Oggetto del triplet
+
+        Returns:
+            Lista delle fonti (vuota se il triplet non è presente)
+        """
+        encoded = self._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return []
+
+        row = self._find_row(*encoded)
+        if row is None:
+            return []
+        return self.mask_to_sources(self._source_masks[row])
+
+    def predicates(self) -> List[str]:
+        """Restituisce i predicati presenti nello store."""
+        return [self.terms.decode(p) for p in self._pos.keys()]
+
+    def sources(self) -> Set[str]:
+        """Restituisce l'insieme delle fonti registrate nello store."""
+        return set(self.mask_to_sources(self._used_sources_mask))
+
+    def triplets(self) -> Iterator[Dict[str, str]]:
+        """
+        Restituisce tutti i triplet in formato dizionario
+
+        Returns:
+            Iteratore di dizionari con chiavi subject, predicate, object
+        """
+        for row in range(len(self._subjects)):
+            subject, predicate, obj = self.decode_row(row)
+            yield {"subject": subject, "predicate": predicate, "object": obj}
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, object]]]:
+        """
+        Vista compatibile con la precedente rappresentazione a dizionario
+        del knowledge graph: (id triplet, {"triplet": ..., "sources": [...]})
+
+        Returns:
+            Iteratore di coppie (id, dati triplet)
+        """
+        for row in range(len(self._subjects)):
+            subject, predicate, obj = self.decode_row(row)
+            yield (
+                f"{subject}_{predicate}_{obj}",
+                {
+                    "triplet": {
+                        "subject": subject,
+                        "predicate": predicate,
+                        "object": obj,
+                    },
+                    "sources": self.mask_to_sources(self._source_masks[row]),
+                },
+            )
+
+    def to_dict(self) -> Dict[str, Dict[str, object]]:
+        """
+        Esporta lo store nella rappresentazione a dizionario usata in precedenza
+
+        Returns:
+            Dizionario id triplet -> {"triplet": ..., "sources": [...]}
+        """
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, knowledge_graph: Dict[str, Dict[str, object]]) -> "TripleStore":
+        """
+        Costruisce uno store a partire dalla rappresentazione a dizionario
+
+        Args:
+            knowledge_graph: Dizionario id triplet -> {"triplet": ..., "sources": [...]}
+
+        Returns:
+            Nuovo TripleStore
+        """
+        store = cls()
+        for data in knowledge_graph.values():
+            for source in data["sources"]:
+                store.add_triplet(data["triplet"], source)
+        return store
+
+    def save(self, path: str):
+        """
+        Salva lo store in un file .npz: colonne dei triplet, bitmask delle fonti,
+        dizionario dei termini e bit delle fonti. Le serie in attesa non vengono
+        materializzate né salvate: vanno persistite a parte (vedi pending_series).
+        Il file è scritto in modo atomico.
+
+        Args:
+            path: Percorso del file
+        """
+        meta = {
+            "terms": self.terms.terms(),
+            "sources": self._source_bits,
+            "version": self.version,
+        }
+
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(
+                f,
+                subjects=np.frombuffer(self._subjects, dtype=np.int32),
+                predicates=np.frombuffer(self._predicates, dtype=np.int32),
+                objects=np.frombuffer(self._objects, dtype=np.int32),
+                source_masks=np.frombuffer(self._source_masks, dtype=np.uint32),
+                meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TripleStore":
+        """
+        Carica uno store salvato con save, ricostruendo indici e contatori
+
+        Args:
+            path: Percorso del file
+
+        Returns:
+            Nuovo TripleStore
+        """
+        store = cls()
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            store._subjects.frombytes(data["subjects"].astype(np.int32).tobytes())
+            store._predicates.frombytes(data["predicates"].astype(np.int32).tobytes())
+            store._objects.frombytes(data["objects"].astype(np.int32).tobytes())
+            store._source_masks.frombytes(data["source_masks"].astype(np.uint32).tobytes())
+
+        store.terms.load(meta["terms"])
+        store._source_bits = dict(meta["sources"])
+        store.version = meta.get("version", 0)
+
+        # Le righe salvate sono già distinte: gli indici si ricostruiscono senza deduplica
+        for row in range(len(store._subjects)):
+            s = store._subjects[row]
+            p = store._predicates[row]
+            o = store._objects[row]
+            store._index(store._spo, s, row)
+            store._index(store._pos.setdefault(p, {}), o, row)
+            store._index(store._osp, o, row)
+            store._subject_counts[s] = store._subject_counts.get(s, 0) + 1
+            store._predicate_counts[p] = store._predicate_counts.get(p, 0) + 1
+            store._object_counts[o] = store._object_counts.get(o, 0) + 1
+            store._used_sources_mask |= store._source_masks[row]
+        return store
+
+    def _add_masked(self, triplets: Iterable[Dict[str, str]], source_mask: int) -> int:
+        """Aggiunge triplet in formato dizionario con una bitmask di fonti già calcolata."""
+        encode = self.terms.encode
+
+        added = 0
+        for triplet in triplets:
+            if self.add_encoded(
+                encode(triplet["subject"]),
+                encode(triplet["predicate"]),
+                encode(triplet["object"]),
+                source_mask,
+            ):
+                added += 1
+        return added
+
+    def _find_row(self, s: int, p: int, o: int) -> Optional[int]:
+        """Cerca la riga di un triplet codificato scandendo il gruppo più piccolo tra SPO e POS."""
+        by_subject = self._spo.get(s)
+        by_object = self._pos.get(p, {}).get(o)
+        if by_subject is None or by_object is None:
+            return None
+
+        if _len_rows(by_subject) <= _len_rows(by_object):
+            predicates = self._predicates
+            objects = self._objects
+            for row in _iter_rows(by_subject):
+                if predicates[row] == p and objects[row] == o:
+                    return row
+        else:
+            subjects = self._subjects
+            for row in _iter_rows(by_object):
+                if subjects[row] == s:
+                    return row
+        return None
+
+    def _encode_pattern(
+        self, subject: Optional[str], predicate: Optional[str], obj: Optional[str]
+    ) -> Optional[Tuple[Optional[int], Optional[int], Optional[int]]]:
+        """
+        Codifica i termini vincolati di un pattern.
+        Restituisce None se un termine vincolato non compare nello store.
+        """
+        encoded = []
+        for term in (subject, predicate, obj):
+            if term is None:
+                encoded.append(None)
+                continue
+            term_id = self.terms.lookup(term)
+            if term_id is None:
+                return None
+            encoded.append(term_id)
+        return tuple(encoded)
+
+    @staticmethod
+    def _index(index: Dict[int, Rows], key: int, row: int):
+        """Registra una riga in un indice."""
+        rows = index.get(key)
+        if rows is None:
+            index[key] = row
+        elif isinstance(rows, int):
+            index[key] = array("i", (rows, row))
+        else:
+            rows.append(row)
+
+    @staticmethod
+    def _unindex(index: Dict[int, Rows], key: int, row: int):
+        """Toglie una riga da un indice."""
+        rows = index[key]
+        if isinstance(rows, int):
+            del index[key]
+            return
+        rows.remove(row)
+        if len(rows) == 1:
+            index[key] = rows[0]
+
+    @staticmethod
+    def _renumber(index: Dict[int, Rows], key: int, old: int, new: int):
+        """Sostituisce un numero di riga in un indice."""
+        rows = index[key]
+        if isinstance(rows, int):
+            index[key] = new
+        else:
+            rows[rows.index(old)] = new
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Stima della memoria occupata da colonne, indici, contatori e termini,
+        calcolata senza scorrere le righe (le serie in attesa non sono incluse)
+        """
+        columns = 4 * len(self._subjects) * 4
+        index_rows = 3 * len(self._subjects) * 4
+        keys = (
+            len(self._spo)
+            + len(self._osp)
+            + sum(len(objects) for objects in self._pos.values())
+            + len(self._subject_counts)
+            + len(self._predicate_counts)
+            + len(self._object_counts)
+        )
+        return columns + index_rows + keys * _INDEX_KEY_BYTES + self.terms.nbytes
+
+    def __len__(self) -> int:
+        return len(self._subjects)
+
+    def __contains__(self, triple: Triple) -> bool:
+        encoded = self._encode_pattern(*triple)
+        return encoded is not None and self._find_row(*encoded) is not None
+
+
+class TripleStoreView:
+    """
+    Vista in sola lettura di un TripleStore limitata ai triplet che hanno almeno
+    una fonte in una bitmask (es. solo voice+sensor).
+
+    La vista condivide dati, indici e dizionario dei termini con lo store: il filtro
+    sulla bitmask delle fonti è applicato riga per riga durante la lettura, per cui
+    più viste sullo stesso store non costano memoria aggiuntiva. Espone la stessa API
+    di lettura dello store e può essere usata direttamente dal QueryEngine.
+    """
+
+    def __init__(self, store: TripleStore, source_mask: int):
+        self.store = store
+        self.mask = source_mask
+        self.terms = store.terms
+
+    def view(self, sources: Iterable[str]) -> "TripleStoreView":
+        """Restituisce una vista ulteriormente limitata alle fonti indicate."""
+        return TripleStoreView(self.store, self.mask & self.store.source_mask(sources))
+
+    @property
+    def version(self) -> int:
+        """Versione del contenuto dello store sottostante."""
+        return self.store.version
+
+    def source_bit(self, source: str) -> int:
+        return self.store.source_bit(source)
+
+    def source_mask(self, sources: Iterable[str]) -> int:
+        return self.store.source_mask(sources)
+
+    def mask_to_sources(self, mask: int) -> List[str]:
+        return self.store.mask_to_sources(mask & self.mask)
+
+    def materialize_series(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+        related: Iterable[Tuple[str, str]] = (),
+    ) -> int:
+        """Materializza le serie in attesa nello store sottostante (vedi TripleStore)."""
+        return self.store.materialize_series(subject, predicate, obj, related)
+
+    def pending_series_count(self) -> int:
+        """Numero di serie non ancora materializzate con una fonte visibile."""
+        return sum(
+            1 for _, source_mask in self.store._pending_series if source_mask & self.mask
+        )
+
+    def match_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> Iterator[int]:
+        """Come TripleStore.match_ids, limitato alle righe visibili."""
+        masks = self.store._source_masks
+        mask = self.mask
+        for row in self.store.match_ids(s, p, o):
+            if masks[row] & mask:
+                yield row
+
+    def match(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+    ) -> Iterator[Triple]:
+        """Come TripleStore.match, limitato ai triplet visibili."""
+        self.materialize_series(subject, predicate, obj)
+        encoded = self.store._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return
+
+        for row in self.match_ids(*encoded):
+            yield self.store.decode_row(row)
+
+    def count_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> int:
+        """Conta le righe visibili che corrispondono al pattern codificato."""
+        if self.mask & self.store._used_sources_mask == self.store._used_sources_mask:
+            # Tutte le fonti presenti sono visibili: valgono i contatori dello store
+            return self.store.count_ids(s, p, o)
+        return sum(1 for _ in self.match_ids(s, p, o))
+
+    def estimate_ids(
+        self,
+        s: Optional[int] = None,
+        p: Optional[int] = None,
+        o: Optional[int] = None,
+    ) -> int:
+        """
+        Stima per il planner: il conteggio dello store completo, un limite superiore
+        ottenuto dagli indici senza scandire le righe
+        """
+        return self.store.count_ids(s, p, o)
+
+    def count(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+    ) -> int:
+        """Come TripleStore.count, limitato ai triplet visibili."""
+        self.materialize_series(subject, predicate, obj)
+        encoded = self.store._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return 0
+        return self.count_ids(*encoded)
+
+    def row_ids(self, row: int) -> EncodedTriple:
+        return self.store.row_ids(row)
+
+    def row_source_mask(self, row: int) -> int:
+        return self.store.row_source_mask(row) & self.mask
+
+    def decode_row(self, row: int) -> Triple:
+        return self.store.decode_row(row)
+
+    def get_sources(self, subject: str, predicate: str, obj: str) -> List[str]:
+        """Fonti visibili di un triplet (vuota se il triplet non è visibile)."""
+        encoded = self.store._encode_pattern(subject, predicate, obj)
+        if encoded is None:
+            return []
+
+        row = self.store._find_row(*encoded)
+        if row is None:
+            return []
+        return self.mask_to_sources(self.store.row_source_mask(row))
+
+    def predicates(self) -> List[str]:
+        """Restituisce i predicati con almeno un triplet visibile."""
+        decode = self.terms.decode
+        return [
+            decode(p)
+            for p in self.store._pos.keys()
+            if next(self.match_ids(p=p), None) is not None
+        ]
+
+    def sources(self) -> Set[str]:
+        """Restituisce le fonti visibili presenti nello store."""
+        return set(self.mask_to_sources(self.store._used_sources_mask))
+
+    def triplets(self) -> Iterator[Dict[str, str]]:
+        """Restituisce i triplet visibili in formato dizionario."""
+        for row in self.match_ids():
+            subject, predicate, obj = self.store.decode_row(row)
+            yield {"subject": subject, "predicate": predicate, "object": obj}
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, object]]]:
+        """Come TripleStore.items, limitato ai triplet visibili e alle fonti visibili."""
+        for row in self.match_ids():
+            subject, predicate, obj = self.store.decode_row(row)
+            yield (
+                f"{subject}_{predicate}_{obj}",
+                {
+                    "triplet": {
+                        "subject": subject,
+                        "predicate": predicate,
+                        "object": obj,
+                    },
+                    "sources": self.mask_to_sources(self.store.row_source_mask(row)),
+                },
+            )
+
+    def to_dict(self) -> Dict[str, Dict[str, object]]:
+        return dict(self.items())
+
+    def __len__(self) -> int:
+        return self.count_ids()
+
+    def __contains__(self, triple: Triple) -> bool:
+        encoded = self.store._encode_pattern(*triple)
+        if encoded is None:
+            return False
+        row = self.store._find_row(*encoded)
+        return row is not None and bool(self.store.row_source_mask(row) & self.mask)
+
+
+def _iter_rows(rows: Optional[Rows]) -> Iterable[int]:
+    """Itera le righe di un gruppo dell'indice."""
+    if rows is None:
+        return ()
+    if isinstance(rows, int):
+        return (rows,)
+    return rows
+
+
+def _decrement(counts: Dict[int, int], key: int):
+    """Decrementa un contatore per termine, eliminandolo quando arriva a zero."""
+    if counts[key] == 1:
+        del counts[key]
+    else:
+        counts[key] -= 1
+
+
+def _len_rows(rows: Optional[Rows]) -> int:
+    """Conta le righe di un gruppo dell'indice."""
+    if rows is None:
+        return 0
+    if isinstance(rows, int):
+        return 1
+    return len(rows)
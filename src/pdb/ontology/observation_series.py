@@ -0,0 +1,178 @@
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from data_layer.structured.time_series import TimeSeries, format_timestamps, parse_timestamp
+
+# Predicati dei triplet sosa:Observation generati per ogni lettura
+OBSERVATION_PREDICATES = {
+    "rdf:type",
+    "sosa:madeBySensor",
+    "sosa:observedProperty",
+    "sosa:hasSimpleResult",
+    "sosa:resultTime",
+    "sosa:hasMember",
+}
+
+
+class ObservationSeries:
+    """
+    Nodo sosa:ObservationCollection che rappresenta le letture di un
+    (dispositivo, proprietà, intervallo temporale) come un'unica entità.
+
+    Il nodo è descritto da pochi triplet di riepilogo; i singoli triplet
+    sosa:Observation vengono generati dal buffer colonnare solo quando
+    una query li richiede.
+    """
+
+    def __init__(self, device_id: str, reading_type: str, series: TimeSeries):
+        self.device_id = device_id
+        self.reading_type = reading_type
+        self.series = series
+
+        self.start_ms = int(series.timestamps[0]) if len(series) else 0
+        self.end_ms = int(series.timestamps[-1]) if len(series) else 0
+
+        start_iso = format_timestamps(series.timestamps[:1])
+        self.node_id = f"series:{device_id}_{reading_type}_{start_iso[0] if start_iso else 'empty'}"
+        self.device_term = f"device:{device_id}"
+        self.property_term = f"property:{reading_type}"
+        self.observation_prefix = f"observation:{device_id}_{reading_type}_"
+
+    def node_triplets(self) -> Iterator[Dict[str, str]]:
+        """
+        Triplet di riepilogo del nodo collezione
+
+        Returns:
+            Iteratore di triplet di conoscenza
+        """
+        node = self.node_id
+        yield {"subject": self.device_term, "predicate": "rdf:type", "object": "sosa:Sensor"}
+        yield {"subject": node, "predicate": "rdf:type", "object": "sosa:ObservationCollection"}
+        yield {"subject": node, "predicate": "sosa:madeBySensor", "object": self.device_term}
+        yield {"subject": node, "predicate": "sosa:observedProperty", "object": self.property_term}
+        yield {"subject": node, "predicate": "hdt:sampleCount", "object": str(len(self.series))}
+
+        if len(self.series):
+            start, end = format_timestamps(self.series.timestamps[[0, -1]])
+            yield {"subject": node, "predicate": "hdt:startTime", "object": start}
+            yield {"subject": node, "predicate": "hdt:endTime", "object": end}
+
+            if not self.series.is_categorical:
+                values = self.series.values
+                yield {"subject": node, "predicate": "hdt:minResult", "object": f"{values.min():g}"}
+                yield {"subject": node, "predicate": "hdt:maxResult", "object": f"{values.max():g}"}
+                yield {"subject": node, "predicate": "hdt:meanResult", "object": f"{values.mean():.2f}"}
+
+    def observation_triplets(self) -> Iterator[Dict[str, str]]:
+        """
+        Materializza i triplet sosa:Observation delle singole letture,
+        nello stesso formato prodotto dalla modalità per osservazione
+
+        Returns:
+            Iteratore di triplet di conoscenza
+        """
+        for timestamp, value in self.series.items():
+            observation_id = f"{self.observation_prefix}{timestamp}"
+            yield {"subject": self.node_id, "predicate": "sosa:hasMember", "object": observation_id}
+            yield {"subject": observation_id, "predicate": "rdf:type", "object": "sosa:Observation"}
+            yield {"subject": observation_id, "predicate": "sosa:madeBySensor", "object": self.device_term}
+            yield {"subject": observation_id, "predicate": "sosa:observedProperty", "object": self.property_term}
+            yield {"subject": observation_id, "predicate": "sosa:hasSimpleResult", "object": str(value)}
+            yield {"subject": observation_id, "predicate": "sosa:resultTime", "object": timestamp}
+
+    def may_match(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        obj: Optional[str] = None,
+    ) -> bool:
+        """
+        Verifica se le osservazioni materializzate potrebbero corrispondere al pattern.
+        La verifica è conservativa: può restituire True per pattern che poi non hanno risultati.
+
+        Args:
+            subject: Soggetto vincolato o None
+            predicate: Predicato vincolato o None
+            obj: Oggetto vincolato o None
+
+        Returns:
+            False solo se nessuna osservazione della serie può corrispondere
+        """
+        if predicate is not None and predicate not in OBSERVATION_PREDICATES:
+            return False
+
+        if subject is not None and subject != self.node_id:
+            if not subject.startswith(self.observation_prefix):
+                return False
+            if not self._covers(subject[len(self.observation_prefix):]):
+                return False
+
+        if obj is not None:
+            if predicate == "rdf:type":
+                return obj == "sosa:Observation"
+            if predicate == "sosa:madeBySensor":
+                return obj == self.device_term
+            if predicate == "sosa:observedProperty":
+                return obj == self.property_term
+            if predicate == "sosa:resultTime":
+                return self._covers(obj)
+            if predicate == "sosa:hasMember":
+                return obj.startswith(self.observation_prefix)
+
+        return True
+
+    def _covers(self, timestamp: str) -> bool:
+        """Verifica se un timestamp ISO cade nell'intervallo della serie."""
+        try:
+            moment = parse_timestamp(timestamp)
+        except ValueError:
+            return False
+        return self.start_ms <= moment <= self.end_ms
+
+
+def save_observation_series(path: str, series: List[Tuple[ObservationSeries, str]]):
+    """
+    Salva serie di osservazioni con la relativa fonte in un file .npz,
+    scritto in modo atomico
+
+    Args:
+        path: Percorso del file
+        series: Coppie (serie, fonte)
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    index = []
+    for position, (item, source) in enumerate(series):
+        index.append([item.device_id, item.reading_type, item.series.categories, source])
+        arrays[f"t{position}"] = item.series.timestamps
+        arrays[f"v{position}"] = item.series.values
+    arrays["index"] = np.frombuffer(json.dumps(index).encode("utf-8"), dtype=np.uint8)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def load_observation_series(path: str) -> List[Tuple[ObservationSeries, str]]:
+    """
+    Carica le serie di osservazioni salvate con save_observation_series
+
+    Args:
+        path: Percorso del file
+
+    Returns:
+        Coppie (serie, fonte), nell'ordine di salvataggio
+    """
+    series = []
+    with np.load(path) as data:
+        index = json.loads(data["index"].tobytes().decode("utf-8"))
+        for position, (device_id, reading_type, categories, source) in enumerate(index):
+            values = TimeSeries.__new__(TimeSeries)
+            values.timestamps = data[f"t{position}"]
+            values.values = data[f"v{position}"]
+            values.categories = categories
+            series.append((ObservationSeries(device_id, reading_type, values), source))
+    return series
@@ -1,4 +1,8 @@
-from typing import Dict, List, Any
+import numpy as np
+from config.config_loader import ConfigLoader
+from data_layer.structured.time_series import TimeSeries
+from pdb.ontology.observation_series import ObservationSeries
+from typing import Dict, Iterator, List, Any
 
 class OntologySystem:
     """
@@ -9,7 +13,11 @@ class OntologySystem:
     def __init__(self):
         # In un'implementazione reale, questo caricherebbe e integrerebbe le ontologie
         # Per ora, usiamo un approccio semplificato
-        pass
+        self.config = ConfigLoader()
+
+        # "observations": cinque triplet per lettura; "series": un nodo per blocco temporale
+        self.sensor_mode = self.config.get_value("ontology.sensor_mode", "observations")
+        self.series_chunk_seconds = self.config.get_value("ontology.series_chunk_seconds", 3600)
     
     def sensor_data_to_triplets(self, sensor_data: Dict[str, Any]) -> List[Dict[str, str]]:
         """
@@ -17,60 +25,118 @@ class OntologySystem:
         
         Args:
             sensor_data: Dati dai sensori/dispositivi IoT
+                         ({dispositivo: {tipo_lettura: TimeSeries}})
             
         Returns:
             Lista di triplet di conoscenza
         """
-        triplets = []
+        return list(self.iter_sensor_triplets(sensor_data))
+    
+    def iter_sensor_triplets(self, sensor_data: Dict[str, Any]) -> Iterator[Dict[str, str]]:
+        """
+        Genera i triplet di conoscenza dei dati sensori uno alla volta,
+        senza costruire la lista completa in memoria
         
+        Args:
+            sensor_data: Dati dai sensori/dispositivi IoT
+                         ({dispositivo: {tipo_lettura: TimeSeries}})
+            
+        Returns:
+            Iteratore di triplet di conoscenza
+        """
         # Elabora ogni lettura del sensore
         for device_id, readings in sensor_data.items():
             # Aggiungi informazioni sul dispositivo
-            triplets.append({
+            yield {
                 "subject": f"device:{device_id}",
                 "predicate": "rdf:type",
                 "object": "sosa:Sensor"
-            })
+            }
             
-            # Elabora letture
+            # Elabora letture: items() converte in blocco i timestamp della serie in ISO
             for reading_type, values in readings.items():
                 for timestamp, value in values.items():
                     # Crea un ID unico per questa osservazione
                     observation_id = f"observation:{device_id}_{reading_type}_{timestamp}"
                     
                     # Aggiungi informazioni sull'osservazione
-                    triplets.append({
+                    yield {
                         "subject": observation_id,
                         "predicate": "rdf:type", 
                         "object": "sosa:Observation"
-                    })
+                    }
                     
-                    triplets.append({
+                    yield {
                         "subject": observation_id,
                         "predicate": "sosa:madeBySensor",
                         "object": f"device:{device_id}"
-                    })
+                    }
                     
-                    triplets.append({
+                    yield {
                         "subject": observation_id,
                         "predicate": "sosa:observedProperty",
                         "object": f"property:{reading_type}"
-                    })
+                    }
                     
-                    triplets.append({
+                    yield {
                         "subject": observation_id,
                         "predicate": "sosa:hasSimpleResult",
                         "object": str(value)
-                    })
+                    }
                     
-                    triplets.append({
+                    yield {
                         "subject": observation_id,
                         "predicate": "sosa:resultTime",
                         "object": timestamp
-                    })
-        
-        return triplets
+                    }
     
+    def sensor_data_to_series(self, sensor_data: Dict[str, Any]) -> List[ObservationSeries]:
+        """
+        Converte dati dei sensori in nodi sosa:ObservationCollection, uno per
+        (dispositivo, tipo lettura, blocco temporale), che referenziano il buffer colonnare
+
+        Args:
+            sensor_data: Dati dai sensori/dispositivi IoT
+                         ({dispositivo: {tipo_lettura: TimeSeries}})
+
+        Returns:
+            Lista di serie di osservazioni
+        """
+        return list(self.iter_sensor_series(sensor_data))
+
+    def iter_sensor_series(self, sensor_data: Dict[str, Any]) -> Iterator[ObservationSeries]:
+        """
+        Genera i nodi sosa:ObservationCollection dei dati sensori uno alla volta
+
+        Args:
+            sensor_data: Dati dai sensori/dispositivi IoT
+                         ({dispositivo: {tipo_lettura: TimeSeries}})
+
+        Returns:
+            Iteratore di serie di osservazioni
+        """
+        chunk_ms = int(self.series_chunk_seconds * 1000)
+
+        for device_id, readings in sensor_data.items():
+            for reading_type, values in readings.items():
+                if not isinstance(values, TimeSeries):
+                    values = TimeSeries.from_mapping(values)
+                if len(values) == 0:
+                    continue
+
+                # Confini dei blocchi allineati all'intervallo configurato
+                chunk_ids = values.timestamps // chunk_ms
+                boundaries = np.flatnonzero(np.diff(chunk_ids)) + 1
+                starts = np.concatenate(([0], boundaries))
+                ends = np.concatenate((boundaries, [len(values)]))
+
+                for start, end in zip(starts.tolist(), ends.tolist()):
+                    chunk = values.slice(
+                        int(values.timestamps[start]),
+                        int(values.timestamps[end - 1]) + 1,
+                    )
+                    yield ObservationSeries(device_id, reading_type, chunk)
+
     def app_data_to_triplets(self, app_data: Dict[str, Any]) -> List[Dict[str, str]]:
         """
         Converte dati delle applicazioni in triplet di conoscenza
@@ -81,16 +147,26 @@ class OntologySystem:
         Returns:
             Lista di triplet di conoscenza
         """
-        triplets = []
+        return list(self.iter_app_triplets(app_data))
+    
+    def iter_app_triplets(self, app_data: Dict[str, Any]) -> Iterator[Dict[str, str]]:
+        """
+        Genera i triplet di conoscenza dei dati delle applicazioni uno alla volta
         
+        Args:
+            app_data: Dati dalle applicazioni
+            
+        Returns:
+            Iteratore di triplet di conoscenza
+        """
         # Elabora i dati di ogni app
         for app_id, entries in app_data.items():
             # Aggiungi informazioni sull'app
-            triplets.append({
+            yield {
                 "subject": f"app:{app_id}",
                 "predicate": "rdf:type",
                 "object": "schema:SoftwareApplication"
-            })
+            }
             
             # Elabora le entries
             for entry_id, entry_data in entries.items():
@@ -98,26 +174,24 @@ class OntologySystem:
                 item_id = f"entry:{app_id}_{entry_id}"
                 
                 # Aggiungi informazioni sull'entry
-                triplets.append({
+                yield {
                     "subject": item_id,
                     "predicate": "schema:sourceApplication",
                     "object": f"app:{app_id}"
-                })
+                }
                 
                 # Elabora ogni campo nell'entry
                 for key, value in entry_data.items():
                     if key == "timestamp":
-                        triplets.append({
+                        yield {
                             "subject": item_id,
                             "predicate": "schema:dateCreated",
                             "object": value
-                        })
+                        }
                     else:
                         # Usa la chiave come predicato, con namespace appropriato
-                        triplets.append({
+                        yield {
                             "subject": item_id,
                             "predicate": f"schema:{key}",
                             "object": str(value)
-                        })
-        
-        return triplets
\ No newline at end of file
+                        }
@@ -0,0 +1,309 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.config_loader import ConfigLoader
+from data_layer.checkpoint import IngestionCheckpoint
+from data_layer.streaming import JsonlTailer, StreamItem, sensor_records_to_series
+
+
+class _Feed:
+    """Feed seguito dall'ingestore: tailer, coda limitata e statistiche."""
+
+    def __init__(
+        self,
+        name: str,
+        tailer: JsonlTailer,
+        records: "queue.Queue[StreamItem]",
+        parse: Callable[[List[Dict[str, Any]]], Tuple[Any, int]],
+        handler: Callable[[Any], None],
+    ):
+        self.name = name
+        self.tailer = tailer
+        self.queue = records
+        # parse scarta i record non validi e restituisce (dati, record utili);
+        # handler inserisce i dati nel grafo e può essere ripetuto in caso di errore
+        self.parse = parse
+        self.handler = handler
+        self.threads: List[threading.Thread] = []
+
+        # Offset (per file) dei record già inseriti nel grafo
+        self.acked: Dict[str, int] = {}
+        self.ingested = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.retries = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records_read": self.tailer.records,
+            "records_ingested": self.ingested,
+            "invalid_lines": self.tailer.invalid_lines,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "retries": self.retries,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+        }
+
+
+class StreamIngestor:
+    """
+    Ingestione continua dei feed JSONL di sensori e trascrizioni vocali.
+
+    Per ogni feed un thread segue il file (o la directory) e inserisce i nuovi record
+    in una coda limitata; un secondo thread li raccoglie in micro-batch, chiusi al
+    raggiungimento di batch_size record o dopo batch_interval secondi dal primo, e li
+    inserisce nel grafo con una sola elaborazione per batch (per le trascrizioni,
+    un'estrazione a batch che raggruppa più espressioni in ogni richiesta LLM). Se
+    l'elaborazione è più lenta del feed la coda si riempie e la lettura si ferma
+    (backpressure): la memoria resta limitata e i record attendono sul file. Un
+    batch la cui elaborazione fallisce (ad esempio per un errore temporaneo del LLM)
+    viene ripetuto con backoff esponenziale, e i suoi offset avanzano solo dopo il
+    successo: sono scartati soltanto i record non validi. Gli offset dei record
+    inseriti sono salvati nel checkpoint (fonte "stream") insieme allo stato del
+    brain ogni checkpoint_interval secondi e all'arresto, così che una ripresa
+    continui dall'ultimo stato salvato.
+
+    Record attesi, uno per riga:
+        sensori: letture nel formato di sensor_records_to_series
+        voce:    {"text": "...", "timestamp": "..."}
+    """
+
+    def __init__(
+        self,
+        brain: Any,
+        sensor_path: Optional[str] = None,
+        voice_path: Optional[str] = None,
+        state_dir: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        batch_interval: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            brain: PersonalDigitalBrain da aggiornare
+            sensor_path: File JSONL o directory del feed sensori
+            voice_path: File JSONL o directory del feed vocale
+            state_dir: Directory dello stato del brain; se None lo stato non viene salvato
+            batch_size: Record massimi per micro-batch (default: stream.batch_size)
+            batch_interval: Secondi massimi di attesa per completare un micro-batch
+                            (default: stream.batch_interval)
+            queue_size: Capacità di ogni coda (default: stream.queue_size)
+            poll_interval: Secondi tra due controlli di un feed senza dati nuovi
+                           (default: stream.poll_interval)
+        """
+        if not sensor_path and not voice_path:
+            raise ValueError("Indicare almeno un feed (sensori o voce)")
+
+        config = ConfigLoader()
+        self.brain = brain
+        self.state_dir = state_dir
+        self.batch_size = batch_size or config.get_value("stream.batch_size", 500)
+        self.batch_interval = batch_interval or config.get_value("stream.batch_interval", 1.0)
+        queue_size = queue_size or config.get_value("stream.queue_size", 10000)
+        poll_interval = poll_interval or config.get_value("stream.poll_interval", 0.5)
+        self.checkpoint_interval = config.get_value("stream.checkpoint_interval", 60)
+        # Attesa prima di ripetere un batch fallito, raddoppiata a ogni errore fino al massimo
+        self.retry_delay = config.get_value("stream.retry_delay", 1.0)
+        self.max_retry_delay = config.get_value("stream.max_retry_delay", 60.0)
+
+        if brain.checkpoint is None:
+            brain.checkpoint = IngestionCheckpoint()
+        # Offset salvati da una sessione precedente, per file
+        offsets = dict(brain.checkpoint.state.get("stream", {}))
+
+        self.feeds: List[_Feed] = []
+        for name, path, parse, handler in (
+            ("sensor", sensor_path, self._parse_sensor, self._ingest_sensor),
+            ("voice", voice_path, self._parse_voice, self._ingest_voice),
+        ):
+            if path:
+                records: "queue.Queue[StreamItem]" = queue.Queue(maxsize=queue_size)
+                tailer = JsonlTailer(path, records, offsets, poll_interval)
+                self.feeds.append(_Feed(name, tailer, records, parse, handler))
+
+        # Arresto della lettura e, una volta svuotate le code, dei consumatori
+        self._stop = threading.Event()
+        self._drained = threading.Event()
+        self._save_lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self.started = False
+
+    def start(self):
+        """Avvia i thread di lettura ed elaborazione di tutti i feed."""
+        if self.started:
+            return
+        self.started = True
+        for feed in self.feeds:
+            feed.threads = [
+                threading.Thread(
+                    target=feed.tailer.run, args=(self._stop,), name=f"{feed.name}-tail", daemon=True
+                ),
+                threading.Thread(
+                    target=self._consume, args=(feed,), name=f"{feed.name}-batch", daemon=True
+                ),
+            ]
+            for thread in feed.threads:
+                thread.start()
+
+    def stop(self):
+        """Interrompe la lettura, elabora i record già in coda e salva lo stato."""
+        if not self.started:
+            return
+        self._stop.set()
+        for feed in self.feeds:
+            feed.threads[0].join()
+        self._drained.set()
+        for feed in self.feeds:
+            feed.threads[1].join()
+        self.started = False
+        self.save()
+
+    def run(self, duration: Optional[float] = None, report_interval: Optional[float] = None):
+        """
+        Esegue l'ingestione fino allo scadere di duration o a un'interruzione (Ctrl-C)
+
+        Args:
+            duration: Secondi di esecuzione; None per continuare fino all'interruzione
+            report_interval: Se indicato, stampa le statistiche con questa cadenza
+        """
+        self.start()
+        deadline = None if duration is None else time.monotonic() + duration
+        last_report = time.monotonic()
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                time.sleep(0.2)
+                if report_interval and time.monotonic() - last_report >= report_interval:
+                    last_report = time.monotonic()
+                    print(self.format_stats())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def save(self):
+        """
+        Salva lo stato del brain con gli offset dei record inseriti. Gli offset sono
+        letti prima del salvataggio del grafo, che contiene quindi tutti i record
+        a cui si riferiscono.
+        """
+        if not self.state_dir:
+            return
+        with self._save_lock:
+            for feed in self.feeds:
+                for file_path, offset in list(feed.acked.items()):
+                    self.brain.checkpoint.stage("stream", file_path, offset)
+            self.brain.save_state(self.state_dir)
+            self._last_save = time.monotonic()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Statistiche per feed: record letti e inseriti, batch, profondità delle code, ritardo."""
+        return {feed.name: feed.stats() for feed in self.feeds}
+
+    def format_stats(self) -> str:
+        """Statistiche in una riga per feed, per i report periodici."""
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append(
+                f"[{name}] letti {stats['records_read']}, inseriti {stats['records_ingested']}, "
+                f"batch {stats['batches']}, coda {stats['queue_depth']}/{stats['queue_size']}, "
+                f"ritardo {stats['last_lag_seconds']}s"
+            )
+        return "\n".join(lines)
+
+    def _consume(self, feed: _Feed):
+        """Raccoglie i record di un feed in micro-batch e li inserisce nel grafo."""
+        while True:
+            batch = self._next_batch(feed)
+            if not batch:
+                if self._drained.is_set() and feed.queue.empty():
+                    return
+                continue
+
+            payload, ingested = feed.parse([record for _, _, record, _ in batch])
+            if ingested and not self._process(feed, payload):
+                # Arresto durante i tentativi: il batch e i record successivi non sono
+                # confermati e verranno riletti alla ripresa
+                return
+
+            for file_path, offset, _, _ in batch:
+                feed.acked[file_path] = offset
+            feed.ingested += ingested
+            feed.batches += 1
+            feed.last_lag = time.time() - batch[0][3]
+            feed.max_lag = max(feed.max_lag, feed.last_lag)
+
+            if time.monotonic() - self._last_save >= self.checkpoint_interval:
+                self.save()
+
+    def _process(self, feed: _Feed, payload: Any) -> bool:
+        """
+        Inserisce i dati di un batch, ripetendo con backoff esponenziale finché non
+        riesce. Restituisce False se l'ingestore viene arrestato prima del successo.
+        """
+        delay = self.retry_delay
+        failed = False
+        while True:
+            try:
+                feed.handler(payload)
+                return True
+            except Exception as e:
+                if not failed:
+                    failed = True
+                    feed.failed_batches += 1
+                feed.retries += 1
+                print(
+                    f"Errore nell'elaborazione di un batch del feed {feed.name}, "
+                    f"nuovo tentativo tra {delay:g}s: {e}"
+                )
+            # Con l'arresto in corso e le code svuotate il batch resta da elaborare
+            if self._drained.wait(delay):
+                return False
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _next_batch(self, feed: _Feed) -> List[StreamItem]:
+        """Attende il primo record e raccoglie i successivi fino a batch_size o batch_interval."""
+        try:
+            first = feed.queue.get(timeout=0.2)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(feed.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _parse_sensor(records: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+        """Converte un batch di letture in serie per dispositivo, scartando le letture non valide."""
+        sensor_data = sensor_records_to_series(records)
+        readings = sum(len(series) for device in sensor_data.values() for series in device.values())
+        return sensor_data, readings
+
+    @staticmethod
+    def _parse_voice(records: List[Dict[str, Any]]) -> Tuple[List[str], int]:
+        """Testi delle espressioni di un batch, scartando i record senza testo."""
+        texts = [str(record["text"]) for record in records if record.get("text")]
+        return texts, len(texts)
+
+    def _ingest_sensor(self, sensor_data: Dict[str, Any]):
+        """Inserisce nel grafo le serie di un batch."""
+        self.brain.process_structured_data(sensor_data, {})
+
+    def _ingest_voice(self, texts: List[str]):
+        """Estrae i triplet delle espressioni di un batch, raggruppate in richieste a batch."""
+        self.brain.process_unstructured_data(texts, None)
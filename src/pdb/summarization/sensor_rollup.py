@@ -0,0 +1,341 @@
+import heapq
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config.config_loader import ConfigLoader
+from data_layer.structured.time_series import TimeSeries, format_timestamps, parse_timestamp
+from pdb.anomaly_detection.physiological_detector import DEFAULT_RULES
+
+_MS_PER_HOUR = 3_600_000
+
+# Intestazione della tabella compatta prodotta da SensorRollup.format_table
+TABLE_HEADER = "sensore | finestra | n | min | max | media | pendenza/h | tempo sopra soglia"
+
+
+class RollupRow:
+    """Statistiche di una serie sensore in una finestra temporale."""
+
+    def __init__(
+        self,
+        device_id: str,
+        reading_type: str,
+        label: str,
+        start_ms: int,
+        end_ms: int,
+        count: int,
+        minimum: float,
+        maximum: float,
+        mean: float,
+        slope_per_hour: float,
+        seconds_above: Optional[float],
+        threshold: Optional[float],
+        score: float,
+    ):
+        self.device_id = device_id
+        self.reading_type = reading_type
+        self.label = label
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.count = count
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.slope_per_hour = slope_per_hour
+        self.seconds_above = seconds_above
+        self.threshold = threshold
+        self.score = score
+
+    def format(self) -> str:
+        """Riga della tabella compatta, usata nei prompt."""
+        if self.threshold is None:
+            above = "-"
+        else:
+            above = f"{self.seconds_above / 60:.0f}m (>{self.threshold:g})"
+        return (
+            f"{self.device_id}/{self.reading_type} | {self.label} | {self.count} | "
+            f"{self.minimum:.4g} | {self.maximum:.4g} | {self.mean:.4g} | "
+            f"{self.slope_per_hour:+.3g} | {above}"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        start, end = format_timestamps(np.array([self.start_ms, self.end_ms], dtype=np.int64))
+        return {
+            "device_id": self.device_id,
+            "reading_type": self.reading_type,
+            "window": self.label,
+            "start_time": start,
+            "end_time": end,
+            "count": self.count,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.mean,
+            "slope_per_hour": self.slope_per_hour,
+            "seconds_above": self.seconds_above,
+            "threshold": self.threshold,
+        }
+
+
+class SensorRollup:
+    """
+    Riassume le serie sensore in statistiche per finestra temporale, da inserire
+    nei prompt al posto delle singole osservazioni.
+
+    Per ogni (dispositivo, tipo lettura) calcola numero di letture, minimo, massimo,
+    media, pendenza ai minimi quadrati (unità per ora) e tempo trascorso sopra la
+    soglia "high" della lettura, per ora o per evento del calendario. Il calcolo è
+    vettoriale: le letture di tutte le finestre sono raccolte in un unico array e
+    aggregate con ufunc.reduceat. In modalità oraria la durata delle finestre cresce
+    con l'arco temporale dei dati; in modalità "calendar" di ogni serie si tengono
+    le finestre degli eventi più rilevanti. In entrambi i casi il numero di righe
+    (e quindi di token) resta limitato da max_rows qualunque sia il numero di
+    letture o di eventi.
+    """
+
+    def __init__(
+        self,
+        window: Optional[str] = None,
+        max_rows: Optional[int] = None,
+        thresholds: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            window: "hour" per finestre orarie, "calendar" per finestre sugli eventi
+                    (default: analysis.rollup.window)
+            max_rows: Numero massimo di righe, ripartito tra le serie
+                      (default: analysis.rollup.max_rows)
+            thresholds: Soglie per tipo di lettura, in aggiunta ai limiti "high" delle
+                        regole del pre-screening (default: analysis.rollup.thresholds)
+        """
+        self.config = ConfigLoader()
+        self.window = window or self.config.get_value("analysis.rollup.window", "hour")
+        if self.window not in ("hour", "calendar"):
+            raise ValueError(f"Finestra di aggregazione non supportata: {self.window}")
+        self.max_rows = max_rows or self.config.get_value("analysis.rollup.max_rows", 48)
+        # Durata massima attribuita a una lettura nel calcolo del tempo sopra soglia
+        self.max_gap_ms = int(self.config.get_value("analysis.rollup.max_gap_seconds", 900) * 1000)
+
+        self.thresholds = {
+            name: rule["high"] for name, rule in DEFAULT_RULES.items() if "high" in rule
+        }
+        self.thresholds.update(
+            thresholds or self.config.get_value("analysis.rollup.thresholds", {}) or {}
+        )
+
+    def summarize(
+        self,
+        sensor_data: Dict[str, Dict[str, Any]],
+        app_data: Optional[Dict[str, Any]] = None,
+    ) -> List[RollupRow]:
+        """
+        Calcola le statistiche per finestra di tutte le serie numeriche
+
+        Args:
+            sensor_data: Dati sensori ({dispositivo: {tipo_lettura: TimeSeries}})
+            app_data: Dati delle app; in modalità "calendar" fornisce gli eventi.
+                      Senza eventi si usano le finestre orarie.
+
+        Returns:
+            Righe ordinate per serie e per inizio finestra
+        """
+        series = []
+        for device_id, readings in sensor_data.items():
+            for reading_type, values in readings.items():
+                if not isinstance(values, TimeSeries):
+                    values = TimeSeries.from_mapping(values)
+                # Le letture categoriali (es. activity_level) non hanno statistiche numeriche
+                if len(values) and not values.is_categorical:
+                    series.append((device_id, reading_type, values))
+        if not series:
+            return []
+
+        events = calendar_windows(app_data) if self.window == "calendar" else []
+        rows_per_series = max(1, self.max_rows // len(series))
+
+        rows: List[RollupRow] = []
+        for device_id, reading_type, values in series:
+            if events:
+                bounds = self._event_bounds(values, events)
+                series_rows = self._rollup(device_id, reading_type, values, *bounds)
+                rows.extend(_most_relevant(series_rows, rows_per_series))
+            else:
+                bounds = self._hourly_bounds(values, rows_per_series)
+                rows.extend(self._rollup(device_id, reading_type, values, *bounds))
+        return rows
+
+    def format_table(self, rows: Iterable[RollupRow]) -> str:
+        """
+        Tabella compatta delle statistiche, una riga per finestra
+
+        Args:
+            rows: Righe da rappresentare
+
+        Returns:
+            Testo della tabella con intestazione
+        """
+        return "\n".join([TABLE_HEADER] + [row.format() for row in rows])
+
+    def _hourly_bounds(self, values: TimeSeries, max_windows: int):
+        """Finestre allineate a multipli di ora, abbastanza ampie da non superare max_windows."""
+        timestamps = values.timestamps
+        span_hours = (int(timestamps[-1]) // _MS_PER_HOUR) - (int(timestamps[0]) // _MS_PER_HOUR) + 1
+        hours = max(1, math.ceil(span_hours / max_windows))
+        window_ms = hours * _MS_PER_HOUR
+
+        window_ids = timestamps // window_ms
+        boundaries = np.flatnonzero(np.diff(window_ids)) + 1
+        lo = np.concatenate(([0], boundaries))
+        hi = np.concatenate((boundaries, [len(timestamps)]))
+        starts = window_ids[lo] * window_ms
+        ends = starts + window_ms
+
+        iso_starts = format_timestamps(starts)
+        labels = [f"{start[:16]}Z +{hours}h" for start in iso_starts]
+        return lo, hi, starts, ends, labels
+
+    @staticmethod
+    def _event_bounds(values: TimeSeries, events: List[Tuple[str, int, int]]):
+        """Finestre corrispondenti agli eventi del calendario, individuate per ricerca binaria."""
+        starts = np.array([start for _, start, _ in events], dtype=np.int64)
+        ends = np.array([end for _, _, end in events], dtype=np.int64)
+        lo = np.searchsorted(values.timestamps, starts, side="left")
+        hi = np.searchsorted(values.timestamps, ends, side="left")
+        # Titolo e inizio distinguono le occorrenze degli eventi ricorrenti
+        labels = [
+            f"{title} ({start[:16]}Z)"
+            for (title, _, _), start in zip(events, format_timestamps(starts))
+        ]
+        return lo, hi, starts, ends, labels
+
+    def _rollup(
+        self,
+        device_id: str,
+        reading_type: str,
+        values: TimeSeries,
+        lo: np.ndarray,
+        hi: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        labels: List[str],
+    ) -> List[RollupRow]:
+        """Statistiche vettoriali di una serie sulle finestre [lo, hi)."""
+        keep = np.flatnonzero(hi > lo)
+        if len(keep) == 0:
+            return []
+        lo, hi, starts, ends = lo[keep], hi[keep], starts[keep], ends[keep]
+        labels = [labels[i] for i in keep.tolist()]
+
+        # Letture di tutte le finestre in un unico array: le finestre degli eventi
+        # possono sovrapporsi, per cui gli indici vengono raccolti per segmento
+        counts = hi - lo
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        group = np.repeat(np.arange(len(counts)), counts)
+        index = np.arange(int(counts.sum())) - offsets[group] + lo[group]
+        timestamps = values.timestamps[index]
+        readings = values.values[index]
+
+        # Tempo in ore dall'inizio della finestra, per la pendenza ai minimi quadrati
+        hours = (timestamps - starts[group]) / _MS_PER_HOUR
+        sum_t = np.add.reduceat(hours, offsets)
+        sum_v = np.add.reduceat(readings, offsets)
+        sum_tt = np.add.reduceat(hours * hours, offsets)
+        sum_tv = np.add.reduceat(hours * readings, offsets)
+        minimum = np.minimum.reduceat(readings, offsets)
+        maximum = np.maximum.reduceat(readings, offsets)
+        mean = sum_v / counts
+        denominator = counts * sum_tt - sum_t * sum_t
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(
+                denominator > 0, (counts * sum_tv - sum_t * sum_v) / denominator, 0.0
+            )
+        # Residui numerici delle serie costanti
+        slope[np.abs(slope) < 1e-9] = 0.0
+
+        # Ogni lettura vale fino alla successiva (entro la finestra e max_gap)
+        following = np.empty_like(timestamps)
+        following[:-1] = timestamps[1:]
+        last = offsets + counts - 1
+        following[last] = ends
+        following = np.minimum(following, ends[group])
+        held = np.clip(following - timestamps, 0, self.max_gap_ms)
+
+        threshold = self.thresholds.get(reading_type)
+        if threshold is not None:
+            above = np.add.reduceat(np.where(readings > threshold, held, 0), offsets) / 1000.0
+            above_fraction = above * 1000.0 / np.maximum(ends - starts, 1)
+        else:
+            above = np.zeros(len(counts))
+            above_fraction = above
+
+        # Rilevanza: scostamento della media dalla media della serie e tempo sopra soglia
+        spread = float(values.values.std()) or 1.0
+        score = np.abs(mean - float(values.values.mean())) / spread + above_fraction
+
+        return [
+            RollupRow(
+                device_id,
+                reading_type,
+                label,
+                start,
+                end,
+                count,
+                low,
+                high,
+                average,
+                trend,
+                seconds if threshold is not None else None,
+                threshold,
+                relevance,
+            )
+            for label, start, end, count, low, high, average, trend, seconds, relevance in zip(
+                labels,
+                starts.tolist(),
+                ends.tolist(),
+                counts.tolist(),
+                minimum.tolist(),
+                maximum.tolist(),
+                mean.tolist(),
+                slope.tolist(),
+                above.tolist(),
+                score.tolist(),
+            )
+        ]
+
+
+def _most_relevant(rows: List[RollupRow], limit: int) -> List[RollupRow]:
+    """Le limit righe con punteggio più alto, nell'ordine originale (per inizio finestra)."""
+    if len(rows) <= limit:
+        return rows
+    keep = heapq.nlargest(limit, range(len(rows)), key=lambda index: rows[index].score)
+    return [rows[index] for index in sorted(keep)]
+
+
+def calendar_windows(app_data: Optional[Dict[str, Any]]) -> List[Tuple[str, int, int]]:
+    """
+    Estrae gli eventi del calendario come finestre (titolo, inizio ms, fine ms)
+
+    Args:
+        app_data: Dati delle app ({"calendar": {"events": {id: evento}}} o eventi in lista)
+
+    Returns:
+        Finestre ordinate per inizio; gli eventi senza orari validi sono ignorati
+    """
+    calendar = (app_data or {}).get("calendar") or {}
+    events = calendar.get("events", {}) if isinstance(calendar, dict) else calendar
+    if isinstance(events, dict):
+        events = events.values()
+
+    windows = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        try:
+            start = parse_timestamp(event["start_time"])
+            end = parse_timestamp(event["end_time"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if end > start:
+            windows.append((str(event.get("title", "evento"))[:40], start, end))
+    windows.sort(key=lambda window: window[1])
+    return windows
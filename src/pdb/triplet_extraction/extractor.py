@@ -1,7 +1,13 @@
 from config.config_loader import ConfigLoader
-from llm.provider import get_llm_with_structured_output
-from models.output_schemas import Triple, TripletList
-from typing import List, Dict, Any
+from llm.provider import ainvoke_structured, invoke_structured
+from models.output_schemas import BatchTripletList, Triple, TripletList
+from llm.tokens import estimate_tokens
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from typing import Iterable, List, Dict, Any, Mapping, Tuple
+import re
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
 
 
 class TripletExtractor:
@@ -12,21 +18,182 @@ class TripletExtractor:
     def __init__(self):
         self.config = ConfigLoader()
 
-    def extract_from_text(self, text: str) -> List[Dict[str, str]]:
+        # Long inputs are split into utterance-aligned chunks of at most chunk_tokens,
+        # each repeating the last chunk_overlap utterances of the previous chunk
+        self.chunk_tokens = self.config.get_value("extraction.chunk_tokens", 1500)
+        self.chunk_overlap = self.config.get_value("extraction.chunk_overlap", 1)
+        self.max_concurrency = self.config.get_value("extraction.max_concurrency", 4)
+
+        # Batched extraction packs several short documents into one request,
+        # up to batch_tokens of document text and batch_max_documents documents
+        self.batch_tokens = self.config.get_value("extraction.batch_tokens", self.chunk_tokens)
+        self.batch_max_documents = self.config.get_value("extraction.batch_max_documents", 20)
+
+    def extract_from_text(self, text: str, use_cache: bool = True) -> List[Dict[str, str]]:
+        """
+        Extracts triplets from unstructured text.
+        Long texts are split into token-budgeted chunks that are extracted
+        concurrently; the resulting triplets are merged and deduplicated.
+
+        Args:
+            text: Input text to process
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            List of extracted triplets
+        """
+        chunks = self.split_into_chunks(text)
+        if len(chunks) <= 1:
+            return self._extract_chunk(text, use_cache)
+
+        workers = max(1, min(self.max_concurrency, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(lambda chunk: self._extract_chunk(chunk, use_cache), chunks)
+            )
+
+        return merge_triplets(results)
+
+    async def aextract_from_text(
+        self, text: str, use_cache: bool = True
+    ) -> List[Dict[str, str]]:
         """
-        Extracts triplets from unstructured text
+        Async version of extract_from_text: chunks are extracted concurrently
+        on the running event loop, at most max_concurrency at a time
 
         Args:
             text: Input text to process
+            use_cache: Whether to reuse a cached response for an identical prompt
 
         Returns:
             List of extracted triplets
         """
-        # Get LLM with structured output using TripletList model
-        llm = get_llm_with_structured_output(TripletList)
+        chunks = self.split_into_chunks(text)
+        if len(chunks) <= 1:
+            return await self._aextract_chunk(text, use_cache)
+
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def extract(chunk: str) -> List[Dict[str, str]]:
+            async with semaphore:
+                return await self._aextract_chunk(chunk, use_cache)
+
+        results = await asyncio.gather(*(extract(chunk) for chunk in chunks))
+        return merge_triplets(results)
+
+    def split_into_chunks(self, text: str) -> List[str]:
+        """
+        Split text into utterance-aligned chunks that fit the token budget
 
-        # Create the message with explicit JSON formatting instructions
-        message = f"""
+        Args:
+            text: Input text, one utterance per line
+
+        Returns:
+            List of chunk texts (a single element if the text fits the budget)
+        """
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return [text]
+
+        utterances = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line:
+                utterances.extend(self._split_long_utterance(line))
+
+        chunks = []
+        current: List[str] = []
+        current_tokens = 0
+        for utterance in utterances:
+            tokens = estimate_tokens(utterance)
+            if current and current_tokens + tokens > self.chunk_tokens:
+                chunks.append("\n".join(current))
+                # Carry the tail of the previous chunk over to keep cross-utterance context
+                current = current[-self.chunk_overlap:] if self.chunk_overlap > 0 else []
+                current_tokens = sum(estimate_tokens(u) for u in current)
+                if current_tokens + tokens > self.chunk_tokens:
+                    current, current_tokens = [], 0
+            current.append(utterance)
+            current_tokens += tokens
+
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def _split_long_utterance(self, utterance: str) -> List[str]:
+        """
+        Split a single utterance exceeding the budget at sentence, then word boundaries
+
+        Args:
+            utterance: Utterance text
+
+        Returns:
+            List of pieces, each within the token budget
+        """
+        if estimate_tokens(utterance) <= self.chunk_tokens:
+            return [utterance]
+
+        pieces = []
+        current = ""
+        for part in _SENTENCE_RE.split(utterance):
+            units = [part] if estimate_tokens(part) <= self.chunk_tokens else part.split()
+            for unit in units:
+                candidate = f"{current} {unit}".strip()
+                if current and estimate_tokens(candidate) > self.chunk_tokens:
+                    pieces.append(current)
+                    current = unit
+                else:
+                    current = candidate
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _extract_chunk(self, text: str, use_cache: bool) -> List[Dict[str, str]]:
+        """
+        Extracts triplets from a single chunk with one LLM call
+
+        Args:
+            text: Chunk text
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            List of extracted triplets
+        """
+        # Extract triplets using structured output (TripletList model)
+        result = invoke_structured(
+            TripletList, self._extraction_prompt(text), use_cache=use_cache
+        )
+
+        # Convert to dictionary format
+        return [triplet.dict() for triplet in result.triplets]
+
+    async def _aextract_chunk(self, text: str, use_cache: bool) -> List[Dict[str, str]]:
+        """
+        Async version of _extract_chunk
+
+        Args:
+            text: Chunk text
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            List of extracted triplets
+        """
+        result = await ainvoke_structured(
+            TripletList, self._extraction_prompt(text), use_cache=use_cache
+        )
+        return [triplet.dict() for triplet in result.triplets]
+
+    @staticmethod
+    def _extraction_prompt(text: str) -> str:
+        """
+        Build the extraction message with explicit formatting instructions
+
+        Args:
+            text: Text to extract triplets from
+
+        Returns:
+            Prompt text
+        """
+        return f"""
         You are a knowledge triplet extraction system. Your task is to extract subject-predicate-object triplets from the provided text.
 
         Guidelines:
@@ -40,31 +207,258 @@ class TripletExtractor:
         {text}
         """
 
-        # Extract triplets using structured output
-        result = llm.invoke(message)
-
-        # Convert to dictionary format
-        return [triplet.dict() for triplet in result.triplets]
-
     def extract_from_profile(
-        self, profile_data: Dict[str, Any]
+        self, profile_data: Dict[str, Any], use_cache: bool = True
     ) -> List[Dict[str, str]]:
         """
         Extract triplets from profile information
 
         Args:
             profile_data: User profile data
+            use_cache: Whether to reuse a cached response for an identical prompt
 
         Returns:
             List of extracted triplets
         """
         # Convert profile data to text format
-        profile_text = self._profile_to_text(profile_data)
+        profile_text = self.profile_to_text(profile_data)
 
         # Use the same text extraction method
-        return self.extract_from_text(profile_text)
+        return self.extract_from_text(profile_text, use_cache=use_cache)
+
+    async def aextract_from_profile(
+        self, profile_data: Dict[str, Any], use_cache: bool = True
+    ) -> List[Dict[str, str]]:
+        """
+        Async version of extract_from_profile
+
+        Args:
+            profile_data: User profile data
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            List of extracted triplets
+        """
+        profile_text = self.profile_to_text(profile_data)
+        return await self.aextract_from_text(profile_text, use_cache=use_cache)
+
+    def extract_from_documents(
+        self, documents: Mapping[str, str], use_cache: bool = True
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Extract triplets from many short documents, packing several documents into
+        each LLM call so the instruction preamble is paid once per batch.
+        Documents larger than the batch budget are extracted on their own
+        (with chunking, like extract_from_text).
+
+        Args:
+            documents: Document texts keyed by document ID
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            Extracted triplets keyed by document ID, in input order
+        """
+        batches, singles = self.plan_batches(documents)
+
+        def run(job: Tuple[str, Any]) -> Dict[str, List[Dict[str, str]]]:
+            kind, payload = job
+            if kind == "single":
+                return {payload: self.extract_from_text(documents[payload], use_cache)}
+            return self._extract_batch(payload, documents, use_cache)
+
+        jobs = [("batch", batch) for batch in batches] + [("single", doc_id) for doc_id in singles]
+        results: Dict[str, List[Dict[str, str]]] = {}
+        if jobs:
+            workers = max(1, min(self.max_concurrency, len(jobs)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for partial in executor.map(run, jobs):
+                    results.update(partial)
+
+        return {doc_id: results.get(doc_id, []) for doc_id in documents}
+
+    async def aextract_from_documents(
+        self, documents: Mapping[str, str], use_cache: bool = True
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Async version of extract_from_documents
+
+        Args:
+            documents: Document texts keyed by document ID
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            Extracted triplets keyed by document ID, in input order
+        """
+        batches, singles = self.plan_batches(documents)
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def run_batch(batch: List[str]) -> Dict[str, List[Dict[str, str]]]:
+            async with semaphore:
+                return await self._aextract_batch(batch, documents, use_cache)
+
+        async def run_single(doc_id: str) -> Dict[str, List[Dict[str, str]]]:
+            return {doc_id: await self.aextract_from_text(documents[doc_id], use_cache)}
+
+        results: Dict[str, List[Dict[str, str]]] = {}
+        for partial in await asyncio.gather(
+            *(run_batch(batch) for batch in batches),
+            *(run_single(doc_id) for doc_id in singles),
+        ):
+            results.update(partial)
+
+        return {doc_id: results.get(doc_id, []) for doc_id in documents}
 
-    def _profile_to_text(self, profile_data: Dict[str, Any]) -> str:
+    def plan_batches(self, documents: Mapping[str, str]) -> Tuple[List[List[str]], List[str]]:
+        """
+        Group documents into batches within the token budget, in input order
+
+        Args:
+            documents: Document texts keyed by document ID
+
+        Returns:
+            Tuple of (batches of document IDs, IDs of documents too large to batch)
+        """
+        batches: List[List[str]] = []
+        singles: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for doc_id, text in documents.items():
+            tokens = estimate_tokens(text)
+            if tokens > self.batch_tokens:
+                singles.append(doc_id)
+                continue
+            if current and (
+                current_tokens + tokens > self.batch_tokens
+                or len(current) >= self.batch_max_documents
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(doc_id)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches, singles
+
+    def _extract_batch(
+        self, batch: List[str], documents: Mapping[str, str], use_cache: bool
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Extract triplets for one batch of documents with a single LLM call
+
+        Args:
+            batch: Document IDs in the batch
+            documents: Document texts keyed by document ID
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            Extracted triplets keyed by document ID
+        """
+        if len(batch) == 1:
+            # A batch of one uses the plain prompt, sharing cache entries with extract_from_text
+            return {batch[0]: self._extract_chunk(documents[batch[0]], use_cache)}
+
+        result = invoke_structured(
+            BatchTripletList, self._batch_prompt(batch, documents), use_cache=use_cache
+        )
+        routed, missing = self._route_batch(batch, result)
+
+        # Documents the model skipped are extracted on their own
+        for doc_id in missing:
+            routed[doc_id] = self._extract_chunk(documents[doc_id], use_cache)
+        return routed
+
+    async def _aextract_batch(
+        self, batch: List[str], documents: Mapping[str, str], use_cache: bool
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Async version of _extract_batch
+
+        Args:
+            batch: Document IDs in the batch
+            documents: Document texts keyed by document ID
+            use_cache: Whether to reuse a cached response for an identical prompt
+
+        Returns:
+            Extracted triplets keyed by document ID
+        """
+        if len(batch) == 1:
+            return {batch[0]: await self._aextract_chunk(documents[batch[0]], use_cache)}
+
+        result = await ainvoke_structured(
+            BatchTripletList, self._batch_prompt(batch, documents), use_cache=use_cache
+        )
+        routed, missing = self._route_batch(batch, result)
+
+        extracted = await asyncio.gather(
+            *(self._aextract_chunk(documents[doc_id], use_cache) for doc_id in missing)
+        )
+        routed.update(zip(missing, extracted))
+        return routed
+
+    @staticmethod
+    def _batch_prompt(batch: List[str], documents: Mapping[str, str]) -> str:
+        """
+        Build the batched extraction message. Documents are labelled with
+        positional IDs (D1, D2, ...) so arbitrary caller IDs never reach the model.
+
+        Args:
+            batch: Document IDs in the batch
+            documents: Document texts keyed by document ID
+
+        Returns:
+            Prompt text
+        """
+        sections = "\n\n".join(
+            f'<document id="D{index}">\n{documents[doc_id]}\n</document>'
+            for index, doc_id in enumerate(batch, 1)
+        )
+        return f"""
+        You are a knowledge triplet extraction system. Your task is to extract subject-predicate-object triplets from each of the provided documents.
+
+        Guidelines:
+        - Focus on extracting factual information
+        - Identify entities (people, objects, concepts) as subjects and objects
+        - Identify relationships between entities as predicates
+        - Extract only explicit information, do not infer
+        - Treat each document independently: only use a document's own text for its triplets
+        - Return one entry per document, using its id exactly as given, with an empty list if it contains no facts
+
+        Extract knowledge triplets from the following documents:
+
+{sections}
+        """
+
+    @staticmethod
+    def _route_batch(
+        batch: List[str], result: BatchTripletList
+    ) -> Tuple[Dict[str, List[Dict[str, str]]], List[str]]:
+        """
+        Map the triplets of a batched response back to the caller's document IDs
+
+        Args:
+            batch: Document IDs in the batch, in prompt order
+            result: Structured response of the batched call
+
+        Returns:
+            Tuple of (triplets keyed by document ID, IDs missing from the response)
+        """
+        labels = {f"D{index}": doc_id for index, doc_id in enumerate(batch, 1)}
+        grouped: Dict[str, List[List[Dict[str, str]]]] = {}
+        for document in result.documents:
+            doc_id = labels.get(document.document_id.strip().upper())
+            if doc_id is None:
+                continue
+            grouped.setdefault(doc_id, []).append(
+                [triplet.dict() for triplet in document.triplets]
+            )
+
+        routed = {doc_id: merge_triplets(lists) for doc_id, lists in grouped.items()}
+        missing = [doc_id for doc_id in batch if doc_id not in routed]
+        return routed, missing
+
+    def profile_to_text(self, profile_data: Dict[str, Any]) -> str:
         """
         Convert profile data to text format for processing
 
@@ -86,3 +480,29 @@ class TripletExtractor:
                 profile_text += f"{key}: {value}\n"
 
         return profile_text
+
+
+def merge_triplets(
+    triplet_lists: Iterable[List[Dict[str, str]]]
+) -> List[Dict[str, str]]:
+    """
+    Merge triplet lists, dropping duplicates that differ only in case or whitespace
+
+    Args:
+        triplet_lists: Triplet lists in input order
+
+    Returns:
+        Deduplicated triplets, keeping the first occurrence
+    """
+    seen = set()
+    merged = []
+    for triplets in triplet_lists:
+        for triplet in triplets:
+            key = tuple(
+                " ".join(str(triplet[field]).split()).casefold()
+                for field in ("subject", "predicate", "object")
+            )
+            if key not in seen:
+                seen.add(key)
+                merged.append(triplet)
+    return merged
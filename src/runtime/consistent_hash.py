@@ -0,0 +1,74 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+
+class ConsistentHashRing:
+    """
+    Anello di hashing consistente: assegna ogni chiave (es. ID utente) a un nodo.
+
+    Ogni nodo occupa più punti virtuali sull'anello, così che le chiavi si
+    distribuiscano in modo uniforme; aggiungendo o rimuovendo un nodo si spostano
+    solo le chiavi dei suoi punti, circa 1/N del totale. L'hash (SHA-1) non dipende
+    dal processo, per cui l'assegnazione è stabile tra esecuzioni diverse.
+    """
+
+    def __init__(self, nodes: Optional[Iterable[str]] = None, replicas: int = 100):
+        """
+        Args:
+            nodes: Nodi iniziali
+            replicas: Punti virtuali per nodo
+        """
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes or []:
+            self.add_node(node)
+
+    def add_node(self, node: str):
+        """
+        Aggiunge un nodo all'anello
+
+        Args:
+            node: Nome del nodo
+        """
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point in self._owners:
+                continue
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove_node(self, node: str):
+        """
+        Rimuove un nodo: le sue chiavi passano ai nodi successivi sull'anello
+
+        Args:
+            node: Nome del nodo
+        """
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> str:
+        """
+        Restituisce il nodo proprietario di una chiave
+
+        Args:
+            key: Chiave da assegnare
+
+        Returns:
+            Nome del nodo
+        """
+        if not self._points:
+            raise ValueError("Nessun nodo nell'anello")
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    @property
+    def nodes(self) -> List[str]:
+        """Nodi presenti nell'anello, in ordine di nome."""
+        return sorted(set(self._owners.values()))
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
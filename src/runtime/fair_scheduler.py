@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Set
+
+
+class FairScheduler:
+    """
+    Esecuzione a turno (round robin) delle richieste di più tenant su un numero
+    fisso di thread.
+
+    Ogni tenant ha una propria coda FIFO e al più una richiesta in esecuzione, per
+    cui le richieste di uno stesso tenant sono serializzate (il brain non deve
+    gestire ingestioni concorrenti). I thread servono i tenant con richieste in
+    attesa a turno, una richiesta per volta: un tenant con molte richieste non
+    ritarda gli altri, e il numero di thread limita le chiamate LLM concorrenti
+    del processo. Una coda di tenant piena rifiuta nuove richieste (backpressure).
+    """
+
+    def __init__(self, workers: int = 4, max_pending_per_tenant: int = 100):
+        """
+        Args:
+            workers: Numero di thread di esecuzione
+            max_pending_per_tenant: Richieste massime in attesa per tenant
+        """
+        self.max_pending_per_tenant = max_pending_per_tenant
+        self._queues: Dict[str, Deque] = {}
+        # Tenant con richieste in attesa e nessuna in esecuzione, nell'ordine di turno
+        self._ready: Deque[str] = deque()
+        self._running: Set[str] = set()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"fair-{index}", daemon=True)
+            for index in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, tenant_id: str, function: Callable[..., Any], *args: Any) -> Future:
+        """
+        Accoda una richiesta di un tenant
+
+        Args:
+            tenant_id: ID del tenant
+            function: Funzione da eseguire
+            *args: Argomenti della funzione
+
+        Returns:
+            Future con il risultato della funzione
+        """
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise ValueError("Scheduler chiuso")
+            queue = self._queues.setdefault(tenant_id, deque())
+            if len(queue) >= self.max_pending_per_tenant:
+                raise ValueError(
+                    f"Troppe richieste in attesa per il tenant {tenant_id} "
+                    f"({self.max_pending_per_tenant})"
+                )
+            queue.append((future, function, args))
+            if len(queue) == 1 and tenant_id not in self._running:
+                self._ready.append(tenant_id)
+                self._condition.notify()
+        return future
+
+    def pending(self) -> Dict[str, int]:
+        """Richieste in attesa per tenant."""
+        with self._condition:
+            return {tenant_id: len(queue) for tenant_id, queue in self._queues.items() if queue}
+
+    def is_busy(self, tenant_id: str) -> bool:
+        """True se il tenant ha richieste in esecuzione o in attesa."""
+        with self._condition:
+            return tenant_id in self._running or bool(self._queues.get(tenant_id))
+
+    def close(self):
+        """Completa le richieste accodate e arresta i thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._ready and not (self._closed and not self._running):
+                    self._condition.wait()
+                if not self._ready:
+                    # Chiuso e senza richieste: gli altri thread vengono risvegliati
+                    self._condition.notify_all()
+                    return
+                tenant_id = self._ready.popleft()
+                future, function, args = self._queues[tenant_id].popleft()
+                self._running.add(tenant_id)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._condition:
+                self._running.discard(tenant_id)
+                if self._queues[tenant_id]:
+                    # Il tenant torna in fondo al turno
+                    self._ready.append(tenant_id)
+                else:
+                    del self._queues[tenant_id]
+                self._condition.notify_all()
@@ -0,0 +1,325 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+from data_layer.checkpoint import IngestionCheckpoint
+from data_layer.data_manager import DataManager
+from pdb.brain import PersonalDigitalBrain
+from runtime.fair_scheduler import FairScheduler
+
+# Richieste servite dal worker per un tenant
+ACTIONS = ("ingest", "ingest_files", "analyze", "query", "save", "evict")
+
+
+class _Tenant:
+    """Brain residente di un tenant, con la memoria stimata e l'ultimo accesso."""
+
+    def __init__(self, brain: PersonalDigitalBrain):
+        self.brain = brain
+        self.bytes = brain.memory_bytes()
+        self.last_used = time.monotonic()
+        self.requests = 0
+
+
+class ShardWorker:
+    """
+    Ospita i brain dei tenant assegnati a uno shard.
+
+    I brain vengono creati al primo accesso (o ripristinati dalla directory di stato
+    del tenant) e restano residenti finché la memoria stimata dello shard supera
+    max_resident_bytes: allora i tenant inattivi da più tempo vengono salvati su disco
+    e scaricati. Un tenant la cui memoria supera max_tenant_bytes non accetta altre
+    ingestioni, ma resta interrogabile. Le richieste sono eseguite dal FairScheduler:
+    serializzate per tenant e a turno tra tenant.
+    """
+
+    def __init__(
+        self,
+        shard_id: str,
+        state_dir: Optional[str] = None,
+        max_tenant_bytes: int = 256 * 1024 * 1024,
+        max_resident_bytes: int = 1024 * 1024 * 1024,
+        workers: int = 4,
+        max_pending_per_tenant: int = 100,
+    ):
+        """
+        Args:
+            shard_id: Nome dello shard
+            state_dir: Directory degli stati dei tenant; senza, i tenant non vengono mai
+                       scaricati (non potrebbero essere ripristinati)
+            max_tenant_bytes: Memoria stimata massima di un tenant
+            max_resident_bytes: Memoria stimata massima dei tenant residenti nello shard
+            workers: Richieste eseguite in parallelo, e quindi chiamate LLM concorrenti
+            max_pending_per_tenant: Richieste massime in attesa per tenant
+        """
+        self.shard_id = shard_id
+        self.state_dir = state_dir
+        self.max_tenant_bytes = max_tenant_bytes
+        self.max_resident_bytes = max_resident_bytes
+        self.scheduler = FairScheduler(workers, max_pending_per_tenant)
+        self.data_manager = DataManager()
+
+        self._tenants: "OrderedDict[str, _Tenant]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.rejected = 0
+
+    def submit(self, tenant_id: str, action: str, payload: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        Accoda una richiesta per un tenant
+
+        Args:
+            tenant_id: ID del tenant
+            action: Una di ACTIONS
+            payload: Argomenti della richiesta
+
+        Returns:
+            Future con il risultato
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Richiesta non supportata: {action}")
+        return self.scheduler.submit(tenant_id, self.handle, tenant_id, action, payload or {})
+
+    def handle(self, tenant_id: str, action: str, payload: Dict[str, Any]) -> Any:
+        """
+        Esegue una richiesta (nel thread dello scheduler)
+
+        Args:
+            tenant_id: ID del tenant
+            action: Una di ACTIONS
+            payload: Argomenti della richiesta
+
+        Returns:
+            Risultato della richiesta
+        """
+        if action == "evict":
+            return self._evict(tenant_id)
+
+        tenant = self._tenant(tenant_id)
+        try:
+            return getattr(self, f"_{action}")(tenant_id, tenant.brain, payload)
+        finally:
+            tenant.bytes = tenant.brain.memory_bytes()
+            tenant.last_used = time.monotonic()
+            tenant.requests += 1
+            self._enforce_budget()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tenant residenti, memoria stimata e richieste in attesa dello shard."""
+        with self._lock:
+            tenants = {
+                tenant_id: {"bytes": tenant.bytes, "requests": tenant.requests}
+                for tenant_id, tenant in self._tenants.items()
+            }
+        return {
+            "shard": self.shard_id,
+            "resident_tenants": len(tenants),
+            "resident_bytes": sum(tenant["bytes"] for tenant in tenants.values()),
+            "tenants": tenants,
+            "pending": self.scheduler.pending(),
+            "evictions": self.evictions,
+            "rejected_ingestions": self.rejected,
+        }
+
+    def close(self):
+        """Completa le richieste accodate e salva lo stato dei tenant residenti."""
+        self.scheduler.close()
+        if self.state_dir:
+            with self._lock:
+                tenants = list(self._tenants.items())
+            for tenant_id, tenant in tenants:
+                tenant.brain.save_state(self._tenant_dir(tenant_id))
+
+    def _ingest(self, tenant_id: str, brain: PersonalDigitalBrain, payload: Dict[str, Any]) -> int:
+        """Ingestione di dati già caricati: restituisce la dimensione del grafo."""
+        self._check_memory(tenant_id)
+        brain.process_unstructured_data(payload.get("voice") or "", payload.get("profile"))
+        if payload.get("sensor_data") or payload.get("app_data"):
+            brain.process_structured_data(
+                payload.get("sensor_data") or {}, payload.get("app_data") or {}
+            )
+        return len(brain.knowledge_graph)
+
+    def _ingest_files(self, tenant_id: str, brain: PersonalDigitalBrain, payload: Dict[str, Any]) -> int:
+        """Ingestione incrementale dai file del tenant, con i watermark del suo checkpoint."""
+        self._check_memory(tenant_id)
+        if brain.checkpoint is None:
+            brain.checkpoint = IngestionCheckpoint()
+        checkpoint = brain.checkpoint
+
+        voice = ""
+        profile = None
+        sensor_data: Dict[str, Any] = {}
+        app_data: Dict[str, Any] = {}
+        if payload.get("voice_path"):
+            voice = self.data_manager.load_voice_data(payload["voice_path"], checkpoint)
+        if payload.get("profile_path"):
+            profile = self.data_manager.load_profile_data(payload["profile_path"], checkpoint)
+        if payload.get("sensors_path"):
+            sensor_data = self.data_manager.load_sensor_data(payload["sensors_path"], checkpoint)
+        if payload.get("apps_path"):
+            app_data = self.data_manager.load_app_data(payload["apps_path"], checkpoint)
+
+        brain.process_unstructured_data(voice, profile)
+        brain.process_structured_data(sensor_data, app_data)
+
+        # I watermark diventano effettivi solo con i dati salvati (o in memoria, senza stato)
+        if self.state_dir:
+            brain.save_state(self._tenant_dir(tenant_id))
+        else:
+            checkpoint.commit()
+        return len(brain.knowledge_graph)
+
+    def _analyze(self, tenant_id: str, brain: PersonalDigitalBrain, payload: Dict[str, Any]) -> Any:
+        sources = payload.get("sources")
+        use_cache = payload.get("use_cache", True)
+        if payload.get("mode", "single") == "interactive":
+            # interactive_analysis esegue già la sessione (o la evita con il pre-screening)
+            return brain.interactive_analysis(sources, use_cache=use_cache).result
+        return brain.identify_intervention_triggers(use_cache=use_cache, sources=sources)
+
+    def _query(self, tenant_id: str, brain: PersonalDigitalBrain, payload: Dict[str, Any]) -> Any:
+        return brain.query_knowledge_graph(payload["query"], payload.get("sources"))
+
+    def _save(self, tenant_id: str, brain: PersonalDigitalBrain, payload: Dict[str, Any]) -> bool:
+        if not self.state_dir:
+            return False
+        brain.save_state(self._tenant_dir(tenant_id))
+        return True
+
+    def _tenant(self, tenant_id: str) -> _Tenant:
+        """Restituisce il tenant residente, creandolo o ripristinandolo se necessario."""
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                return tenant
+
+        # Le richieste di un tenant sono serializzate: nessun altro thread lo carica
+        brain = PersonalDigitalBrain()
+        if self.state_dir:
+            brain.load_state(self._tenant_dir(tenant_id))
+        tenant = _Tenant(brain)
+        with self._lock:
+            self._tenants[tenant_id] = tenant
+        return tenant
+
+    def _check_memory(self, tenant_id: str):
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+        if tenant is not None and tenant.bytes >= self.max_tenant_bytes:
+            self.rejected += 1
+            raise ValueError(
+                f"Il tenant {tenant_id} ha raggiunto il limite di memoria "
+                f"({tenant.bytes} >= {self.max_tenant_bytes} byte)"
+            )
+
+    def _evict(self, tenant_id: str) -> bool:
+        """Salva e scarica un tenant (da eseguire nel suo turno o quando è inattivo)."""
+        if not self.state_dir:
+            return False
+        with self._lock:
+            tenant = self._tenants.pop(tenant_id, None)
+        if tenant is None:
+            return False
+        tenant.brain.save_state(self._tenant_dir(tenant_id))
+        self.evictions += 1
+        return True
+
+    def _enforce_budget(self):
+        """Scarica i tenant inattivi meno recenti finché la memoria rientra nel limite."""
+        if not self.state_dir:
+            return
+        with self._lock:
+            resident = sum(tenant.bytes for tenant in self._tenants.values())
+            if resident <= self.max_resident_bytes:
+                return
+            candidates = list(self._tenants)
+        for tenant_id in candidates:
+            if resident <= self.max_resident_bytes:
+                break
+            # Un tenant con richieste in corso o in attesa resta residente
+            if self.scheduler.is_busy(tenant_id):
+                continue
+            try:
+                # Lo scaricamento passa dal turno del tenant: una richiesta arrivata nel
+                # frattempo viene servita dopo, ripristinando il brain dal disco
+                self.scheduler.submit(tenant_id, self._evict, tenant_id)
+            except ValueError:
+                # Scheduler in chiusura: i tenant vengono salvati da close()
+                break
+            with self._lock:
+                tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                resident -= tenant.bytes
+
+    def _tenant_dir(self, tenant_id: str) -> str:
+        return tenant_dir(self.state_dir, tenant_id)
+
+
+def tenant_dir(state_dir: str, tenant_id: str) -> str:
+    """
+    Directory dello stato di un tenant
+
+    Args:
+        state_dir: Directory degli stati dei tenant
+        tenant_id: ID del tenant
+
+    Returns:
+        Percorso: nome leggibile più un hash, così che ID con caratteri speciali non collidano
+    """
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", tenant_id)[:64]
+    digest = hashlib.sha1(tenant_id.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(state_dir, f"{safe}-{digest}")
+
+
+def shard_main(shard_id: str, requests: Any, responses: Any, settings: Dict[str, Any]):
+    """
+    Processo di uno shard: riceve le richieste (request_id, tenant_id, azione, payload)
+    e restituisce (request_id, ok, risultato o eccezione). None arresta lo shard.
+
+    Args:
+        shard_id: Nome dello shard
+        requests: Coda delle richieste
+        responses: Coda delle risposte, condivisa tra gli shard
+        settings: Argomenti di ShardWorker
+    """
+    worker = ShardWorker(shard_id, **settings)
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, tenant_id, action, payload = message
+        if action == "stats":
+            responses.put((request_id, True, worker.stats()))
+            continue
+        try:
+            future = worker.submit(tenant_id, action, payload)
+        except ValueError as e:
+            responses.put((request_id, False, e))
+            continue
+        future.add_done_callback(
+            lambda done, request_id=request_id: _reply(responses, request_id, done)
+        )
+
+    worker.close()
+    responses.put((None, True, shard_id))
+
+
+def _reply(responses: Any, request_id: int, future: Future):
+    """Invia il risultato di una richiesta; le eccezioni non serializzabili diventano testo."""
+    error = future.exception()
+    if error is None:
+        responses.put((request_id, True, future.result()))
+        return
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(f"{type(error).__name__}: {error}")
+    responses.put((request_id, False, error))
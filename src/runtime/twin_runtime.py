@@ -0,0 +1,288 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional
+
+from config.config_loader import ConfigLoader
+from runtime.consistent_hash import ConsistentHashRing
+from runtime.shard_worker import shard_main
+
+
+class TwinRuntime:
+    """
+    Runtime multi-tenant: ospita i brain di molti utenti, ripartiti tra processi shard.
+
+    Ogni tenant è assegnato a uno shard con hashing consistente sul suo ID, per cui
+    tutte le sue richieste (ingestione, analisi, query) arrivano allo stesso processo
+    e il suo brain non è mai condiviso tra processi. Ogni shard limita la memoria
+    dei propri tenant (ShardWorker) e ne serve le richieste a turno; il limite di
+    chiamate LLM concorrenti (runtime.llm_concurrency) è ripartito esattamente tra
+    gli shard, per cui non possono esserci più shard che chiamate concorrenti.
+    Le code delle richieste sono limitate: se uno shard è saturo, submit attende.
+    """
+
+    def __init__(
+        self,
+        shards: Optional[int] = None,
+        state_dir: Optional[str] = None,
+        start_method: Optional[str] = None,
+    ):
+        """
+        Args:
+            shards: Numero di processi shard (default: runtime.shards, o il numero di CPU
+                    fino a runtime.llm_concurrency)
+            state_dir: Directory degli stati dei tenant (default: runtime.state_dir)
+            start_method: Metodo di avvio dei processi ("fork", "spawn", "forkserver";
+                          default: runtime.start_method o quello della piattaforma)
+        """
+        config = ConfigLoader()
+        self.llm_concurrency = max(1, int(config.get_value("runtime.llm_concurrency", 8)))
+        default_shards = min(os.cpu_count() or 1, self.llm_concurrency)
+        self.shard_count = max(1, int(shards or config.get_value("runtime.shards", default_shards)))
+        if self.shard_count > self.llm_concurrency:
+            # Ogni shard esegue almeno una richiesta alla volta: il limite verrebbe superato
+            raise ValueError(
+                f"Troppi shard ({self.shard_count}) per runtime.llm_concurrency "
+                f"({self.llm_concurrency}): ogni shard richiede almeno una chiamata LLM"
+            )
+        self.state_dir = state_dir or config.get_value("runtime.state_dir")
+        self.queue_size = config.get_value("runtime.queue_size", 1000)
+
+        self.settings = {
+            "state_dir": self.state_dir,
+            "max_tenant_bytes": config.get_value("runtime.max_tenant_bytes", 256 * 1024 * 1024),
+            "max_resident_bytes": config.get_value("runtime.max_resident_bytes", 1024 * 1024 * 1024),
+            "max_pending_per_tenant": config.get_value("runtime.max_pending_per_tenant", 100),
+        }
+
+        self.shard_ids = [f"shard-{index}" for index in range(self.shard_count)]
+        # Ripartizione esatta del limite: il resto va ai primi shard
+        base, extra = divmod(self.llm_concurrency, self.shard_count)
+        self.shard_workers = {
+            shard_id: base + (1 if index < extra else 0)
+            for index, shard_id in enumerate(self.shard_ids)
+        }
+        self.ring = ConsistentHashRing(self.shard_ids, config.get_value("runtime.replicas", 100))
+        self._context = multiprocessing.get_context(
+            start_method or config.get_value("runtime.start_method")
+        )
+
+        self._requests: Dict[str, Any] = {}
+        self._processes: List[Any] = []
+        self._responses: Any = None
+        self._futures: Dict[int, Future] = {}
+        self._futures_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def start(self):
+        """Avvia i processi shard e il thread che raccoglie le risposte."""
+        if self._processes:
+            return
+        self._responses = self._context.Queue()
+        for shard_id in self.shard_ids:
+            requests = self._context.Queue(maxsize=self.queue_size)
+            process = self._context.Process(
+                target=shard_main,
+                args=(
+                    shard_id,
+                    requests,
+                    self._responses,
+                    {**self.settings, "workers": self.shard_workers[shard_id]},
+                ),
+                name=shard_id,
+                daemon=True,
+            )
+            process.start()
+            self._requests[shard_id] = requests
+            self._processes.append(process)
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="runtime-responses", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self):
+        """Completa le richieste accodate, salva i tenant residenti e arresta gli shard."""
+        if not self._processes:
+            return
+        for requests in self._requests.values():
+            requests.put(None)
+        self._dispatcher.join()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        self._requests = {}
+
+    def shard_for(self, tenant_id: str) -> str:
+        """
+        Restituisce lo shard proprietario di un tenant
+
+        Args:
+            tenant_id: ID del tenant
+
+        Returns:
+            Nome dello shard
+        """
+        return self.ring.node_for(tenant_id)
+
+    def submit(self, tenant_id: str, action: str, payload: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        Invia una richiesta allo shard del tenant
+
+        Args:
+            tenant_id: ID del tenant
+            action: ingest, ingest_files, analyze, query, save o evict
+            payload: Argomenti della richiesta
+
+        Returns:
+            Future con il risultato
+        """
+        if not self._processes:
+            raise ValueError("Runtime non avviato")
+        return self._send(self.shard_for(tenant_id), tenant_id, action, payload or {})
+
+    def ingest(
+        self,
+        tenant_id: str,
+        voice: str = "",
+        profile: Optional[Dict[str, Any]] = None,
+        sensor_data: Optional[Dict[str, Any]] = None,
+        app_data: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """
+        Ingestione di dati già caricati nel brain del tenant
+
+        Args:
+            tenant_id: ID del tenant
+            voice: Testo dalla trascrizione vocale
+            profile: Profilo utente, o None se invariato
+            sensor_data: Dati sensori ({dispositivo: {tipo_lettura: TimeSeries}})
+            app_data: Dati delle app
+            timeout: Secondi massimi di attesa
+
+        Returns:
+            Numero di triplet nel grafo del tenant
+        """
+        payload = {"voice": voice, "profile": profile, "sensor_data": sensor_data, "app_data": app_data}
+        return self.submit(tenant_id, "ingest", payload).result(timeout)
+
+    def ingest_files(
+        self,
+        tenant_id: str,
+        voice_path: Optional[str] = None,
+        profile_path: Optional[str] = None,
+        sensors_path: Optional[str] = None,
+        apps_path: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """
+        Ingestione incrementale dai file del tenant (solo i dati nuovi dall'ultima volta)
+
+        Args:
+            tenant_id: ID del tenant
+            voice_path: Percorso ai dati vocali
+            profile_path: Percorso ai dati profilo
+            sensors_path: Percorso ai dati sensori
+            apps_path: Percorso ai dati applicazioni
+            timeout: Secondi massimi di attesa
+
+        Returns:
+            Numero di triplet nel grafo del tenant
+        """
+        payload = {
+            "voice_path": voice_path,
+            "profile_path": profile_path,
+            "sensors_path": sensors_path,
+            "apps_path": apps_path,
+        }
+        return self.submit(tenant_id, "ingest_files", payload).result(timeout)
+
+    def analyze(
+        self,
+        tenant_id: str,
+        sources: Optional[Iterable[str]] = None,
+        use_cache: bool = True,
+        mode: str = "single",
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Analisi dei trigger di intervento del tenant
+
+        Args:
+            tenant_id: ID del tenant
+            sources: Fonti da considerare; None per tutte
+            use_cache: Se False la risposta non viene letta né salvata nella cache LLM
+            mode: "single" o "interactive"
+            timeout: Secondi massimi di attesa
+
+        Returns:
+            AnalysisResult
+        """
+        payload = {
+            "sources": None if sources is None else list(sources),
+            "use_cache": use_cache,
+            "mode": mode,
+        }
+        return self.submit(tenant_id, "analyze", payload).result(timeout)
+
+    def query(
+        self,
+        tenant_id: str,
+        query_str: str,
+        sources: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Query sul knowledge graph del tenant
+
+        Args:
+            tenant_id: ID del tenant
+            query_str: Query in formato SPARQL
+            sources: Fonti visibili alla query; None per tutte
+            timeout: Secondi massimi di attesa
+
+        Returns:
+            Risultati della query
+        """
+        payload = {"query": query_str, "sources": None if sources is None else list(sources)}
+        return self.submit(tenant_id, "query", payload).result(timeout)
+
+    def stats(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Statistiche di ogni shard: tenant residenti, memoria, richieste in attesa."""
+        futures = {shard_id: self._send(shard_id, None, "stats", {}) for shard_id in self.shard_ids}
+        return {shard_id: future.result(timeout) for shard_id, future in futures.items()}
+
+    def __enter__(self) -> "TwinRuntime":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _send(self, shard_id: str, tenant_id: Optional[str], action: str, payload: Dict[str, Any]) -> Future:
+        request_id = next(self._request_ids)
+        future: Future = Future()
+        with self._futures_lock:
+            self._futures[request_id] = future
+        # Coda limitata: con lo shard saturo l'invio attende (backpressure)
+        self._requests[shard_id].put((request_id, tenant_id, action, payload))
+        return future
+
+    def _dispatch(self):
+        """Risolve le future con le risposte degli shard, fino all'arresto di tutti."""
+        running = len(self._processes)
+        while running:
+            request_id, ok, value = self._responses.get()
+            if request_id is None:
+                running -= 1
+                continue
+            with self._futures_lock:
+                future = self._futures.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
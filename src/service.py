@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.config_loader import ConfigLoader
+from data_layer.streaming import sensor_records_to_series
+from llm.provider import set_model
+from llm.standin import StandInChatModel
+from pdb.brain import PersonalDigitalBrain
+from runtime.shard_worker import tenant_dir
+
+# Percorsi per utente: /users/<id>/<azione>
+_USER_ROUTE = re.compile(r"^/users/([^/]+)/([a-z]+)$")
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class _HttpError(ValueError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> Any:
+        """Corpo JSON della richiesta (None se vuoto)."""
+        if not self.body.strip():
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise _HttpError(400, f"JSON non valido: {e}")
+
+    def records(self) -> List[Any]:
+        """Record del corpo: NDJSON (uno per riga), lista JSON o oggetto {"records": [...]}."""
+        if "ndjson" in self.headers.get("content-type", ""):
+            records = []
+            for number, line in enumerate(self.body.splitlines(), 1):
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as e:
+                        raise _HttpError(400, f"Riga {number} non valida: {e}")
+            return records
+        data = self.json()
+        if isinstance(data, dict):
+            data = data.get("records", [])
+        if not isinstance(data, list):
+            raise _HttpError(400, "Attesa una lista di record")
+        return data
+
+
+class _Response:
+    """Risposta HTTP/1.1, completa (send_json) o a blocchi NDJSON (start_stream/write)."""
+
+    def __init__(self, writer: asyncio.StreamWriter, keep_alive: bool):
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.started = False
+
+    async def send_json(self, status: int, payload: Any):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self._write_head(status, {"Content-Type": "application/json", "Content-Length": str(len(body))})
+        self.writer.write(body)
+        await self.writer.drain()
+
+    async def start_stream(self, status: int = 200):
+        self._write_head(
+            status, {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked"}
+        )
+        await self.writer.drain()
+
+    async def write(self, payload: Any):
+        """Invia una riga NDJSON; drain applica la backpressure del client lento."""
+        line = json.dumps(payload, default=str).encode("utf-8") + b"\n"
+        self.writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+        await self.writer.drain()
+
+    async def end_stream(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+    def _write_head(self, status: int, headers: Dict[str, str]):
+        self.started = True
+        headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+
+class TwinService:
+    """
+    Servizio HTTP asincrono (solo libreria standard) per ingestione, query e analisi.
+
+    Il processo resta attivo tra le richieste: brain, modello LLM e cache restano
+    in memoria, senza pagare a ogni chiamata l'avvio dell'interprete e l'import di
+    LangChain. I brain sono creati al primo accesso per ID utente (ripristinati da
+    state_dir se indicata) e i meno usati vengono salvati e scaricati oltre
+    max_tenants. Le richieste di ingestione di uno stesso utente sono serializzate;
+    query e analisi restituiscono i risultati in streaming come NDJSON a blocchi.
+
+    Endpoint:
+        GET  /health
+        GET  /users/<id>/stats
+        POST /users/<id>/readings    letture sensore (NDJSON o lista JSON)
+        POST /users/<id>/utterances  espressioni vocali ({"text": ...} o stringhe)
+        POST /users/<id>/profile     profilo utente (oggetto JSON)
+        POST /users/<id>/apps        dati delle app (oggetto JSON)
+        POST /users/<id>/query       {"query": "SELECT ...", "sources": [...]}
+        POST /users/<id>/analyze     {"sources": [...], "use_cache": true}
+        POST /users/<id>/save        salva lo stato in state_dir
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        state_dir: Optional[str] = None,
+        max_tenants: Optional[int] = None,
+    ):
+        """
+        Args:
+            host: Indirizzo di ascolto (default: service.host)
+            port: Porta di ascolto, 0 per una porta libera (default: service.port)
+            state_dir: Directory degli stati degli utenti (default: service.state_dir)
+            max_tenants: Brain residenti al massimo (default: service.max_tenants)
+        """
+        config = ConfigLoader()
+        self.host = host or config.get_value("service.host", "127.0.0.1")
+        self.port = port if port is not None else config.get_value("service.port", 8080)
+        self.state_dir = state_dir or config.get_value("service.state_dir")
+        self.max_tenants = max_tenants or config.get_value("service.max_tenants", 100)
+        self.max_body_bytes = config.get_value("service.max_body_bytes", 64 * 1024 * 1024)
+
+        self.brains: "OrderedDict[str, PersonalDigitalBrain]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+        self.requests = 0
+
+    async def start(self) -> Tuple[str, int]:
+        """
+        Avvia il server
+
+        Returns:
+            Indirizzo e porta effettivi
+        """
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        """Avvia il server e lo mantiene attivo fino alla cancellazione."""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        """Arresta il server e salva lo stato dei brain residenti."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.state_dir:
+            for user_id in list(self.brains):
+                async with self._lock(user_id):
+                    await asyncio.to_thread(self.brains[user_id].save_state, self._user_dir(user_id))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, writer)
+                except _HttpError as e:
+                    await _Response(writer, False).send_json(e.status, {"error": str(e)})
+                    break
+                if request is None:
+                    break
+
+                self.requests += 1
+                response = _Response(writer, request.keep_alive)
+                await self._dispatch(request, response)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> Optional[_Request]:
+        """Legge una richiesta; None se il client ha chiuso la connessione."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise _HttpError(400, "Riga di richiesta non valida")
+
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise _HttpError(411, "Corpo a blocchi non supportato: indicare Content-Length")
+        length = int(headers.get("content-length", 0) or 0)
+        if length > self.max_body_bytes:
+            raise _HttpError(413, f"Corpo oltre il limite di {self.max_body_bytes} byte")
+        if length and headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        body = await reader.readexactly(length) if length else b""
+        return _Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+    async def _dispatch(self, request: _Request, response: _Response):
+        try:
+            if request.path == "/health":
+                await response.send_json(
+                    200, {"status": "ok", "tenants": len(self.brains), "requests": self.requests}
+                )
+                return
+
+            match = _USER_ROUTE.match(request.path)
+            handler = getattr(self, f"_handle_{match.group(2)}", None) if match else None
+            if handler is None:
+                raise _HttpError(404, f"Percorso non trovato: {request.path}")
+            expected = "GET" if match.group(2) == "stats" else "POST"
+            if request.method != expected:
+                raise _HttpError(405, f"Metodo non consentito: {request.method}")
+            await handler(match.group(1), request, response)
+        except Exception as e:
+            status = e.status if isinstance(e, _HttpError) else 400 if isinstance(e, ValueError) else 500
+            if not response.started:
+                await response.send_json(status, {"error": str(e)})
+            else:
+                # Risposta in streaming già iniziata: l'errore è l'ultimo evento
+                await response.write({"event": "error", "error": str(e)})
+                await response.end_stream()
+
+    async def _handle_stats(self, user_id: str, request: _Request, response: _Response):
+        brain = await self._brain(user_id)
+        # memory_bytes acquisisce il lock del grafo, che una query può tenere a lungo
+        memory_bytes = await asyncio.to_thread(brain.memory_bytes)
+        await response.send_json(
+            200,
+            {
+                "user": user_id,
+                "triples": len(brain.knowledge_graph),
+                "version": brain.knowledge_graph.version,
+                "memory_bytes": memory_bytes,
+            },
+        )
+
+    async def _handle_readings(self, user_id: str, request: _Request, response: _Response):
+        sensor_data = sensor_records_to_series(
+            record for record in request.records() if isinstance(record, dict)
+        )
+        readings = sum(len(series) for device in sensor_data.values() for series in device.values())
+        async with self._lock(user_id):
+            brain = await self._brain(user_id)
+            if sensor_data:
+                await brain.aprocess_structured_data(sensor_data, {})
+        await response.send_json(200, {"readings": readings, "triples": len(brain.knowledge_graph)})
+
+    async def _handle_utterances(self, user_id: str, request: _Request, response: _Response):
+        texts = []
+        for record in request.records():
+            text = record.get("text") if isinstance(record, dict) else record
+            if isinstance(text, str) and text.strip():
+                texts.append(text)
+        async with self._lock(user_id):
+            brain = await self._brain(user_id)
+            if texts:
+                await brain.aprocess_unstructured_data(texts, None)
+        await response.send_json(200, {"utterances": len(texts), "triples": len(brain.knowledge_graph)})
+
+    async def _handle_profile(self, user_id: str, request: _Request, response: _Response):
+        profile = request.json()
+        if not isinstance(profile, dict):
+            raise _HttpError(400, "Il profilo deve essere un oggetto JSON")
+        async with self._lock(user_id):
+            brain = await self._brain(user_id)
+            await brain.aprocess_unstructured_data("", profile)
+        await response.send_json(200, {"triples": len(brain.knowledge_graph)})
+
+    async def _handle_apps(self, user_id: str, request: _Request, response: _Response):
+        app_data = request.json()
+        if not isinstance(app_data, dict):
+            raise _HttpError(400, "I dati delle app devono essere un oggetto JSON")
+        async with self._lock(user_id):
+            brain = await self._brain(user_id)
+            await brain.aprocess_structured_data({}, app_data)
+        await response.send_json(200, {"triples": len(brain.knowledge_graph)})
+
+    async def _handle_query(self, user_id: str, request: _Request, response: _Response):
+        payload = request.json() or {}
+        query = payload.get("query")
+        if not isinstance(query, str):
+            raise _HttpError(400, "Campo query mancante")
+        brain = await self._brain(user_id)
+        # La query può materializzare serie: viene eseguita fuori dall'event loop
+        results = await asyncio.to_thread(brain.query_knowledge_graph, query, payload.get("sources"))
+
+        await response.start_stream()
+        for binding in results:
+            await response.write(binding)
+        await response.write({"event": "end", "count": len(results)})
+        await response.end_stream()
+
+    async def _handle_analyze(self, user_id: str, request: _Request, response: _Response):
+        payload = request.json() or {}
+        brain = await self._brain(user_id)
+        await response.start_stream()
+        await response.write({"event": "started", "version": brain.knowledge_graph.version})
+
+        started = time.perf_counter()
+        result = await brain.aidentify_intervention_triggers(
+            use_cache=payload.get("use_cache", True), sources=payload.get("sources")
+        )
+        for trigger in result.identified_triggers:
+            await response.write({"event": "trigger", **trigger.dict()})
+        await response.write(
+            {
+                "event": "result",
+                "triggers": len(result.identified_triggers),
+                "reasoning": result.reasoning,
+                "seconds": round(time.perf_counter() - started, 4),
+            }
+        )
+        await response.end_stream()
+
+    async def _handle_save(self, user_id: str, request: _Request, response: _Response):
+        if not self.state_dir:
+            raise _HttpError(400, "Servizio avviato senza directory di stato")
+        async with self._lock(user_id):
+            brain = await self._brain(user_id)
+            await asyncio.to_thread(brain.save_state, self._user_dir(user_id))
+        await response.send_json(200, {"saved": True})
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def _brain(self, user_id: str) -> PersonalDigitalBrain:
+        """Brain residente dell'utente, creato o ripristinato al primo accesso."""
+        brain = self.brains.get(user_id)
+        if brain is not None:
+            self.brains.move_to_end(user_id)
+            return brain
+
+        brain = PersonalDigitalBrain()
+        if self.state_dir:
+            await asyncio.to_thread(brain.load_state, self._user_dir(user_id))
+        # Un'altra richiesta può averlo creato durante il caricamento
+        if user_id in self.brains:
+            return self.brains[user_id]
+        self.brains[user_id] = brain
+        await self._evict()
+        return brain
+
+    async def _evict(self):
+        """Salva e scarica i brain meno usati oltre max_tenants (solo con state_dir)."""
+        if not self.state_dir:
+            return
+        for user_id in list(self.brains)[: max(0, len(self.brains) - self.max_tenants)]:
+            lock = self._lock(user_id)
+            if lock.locked():
+                continue
+            async with lock:
+                brain = self.brains.pop(user_id, None)
+                if brain is not None:
+                    await asyncio.to_thread(brain.save_state, self._user_dir(user_id))
+            self._locks.pop(user_id, None)
+
+    def _user_dir(self, user_id: str) -> str:
+        return tenant_dir(self.state_dir, user_id)
+
+
+def main():
+    """
+    Avvia il servizio HTTP del sistema Human Digital Twin
+    """
+    parser = argparse.ArgumentParser(description="Servizio HTTP Human Digital Twin")
+    parser.add_argument("--host", help="Indirizzo di ascolto (default: service.host)")
+    parser.add_argument("--port", type=int, help="Porta di ascolto (default: service.port)")
+    parser.add_argument("--state", help="Directory degli stati degli utenti (default: service.state_dir)")
+    parser.add_argument(
+        "--standin-llm",
+        action="store_true",
+        help="Usa un modello sostitutivo senza rete (risposte vuote), per prove in locale",
+    )
+    args = parser.parse_args()
+
+    if args.standin_llm:
+        set_model(StandInChatModel())
+
+    service = TwinService(args.host, args.port, args.state)
+
+    async def run():
+        host, port = await service.start()
+        print(f"Servizio in ascolto su http://{host}:{port}")
+        try:
+            await service.serve_forever()
+        finally:
+            await service.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
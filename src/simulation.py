@@ -2,16 +2,71 @@ import argparse
 import json
 import os
 import time
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 
 from config.config_loader import ConfigLoader
 from data_layer.data_manager import DataManager
 from pdb.brain import PersonalDigitalBrain
-from llm.provider import get_llm_with_structured_output, reset_model_cache
+from pdb.ontology.ontology_system import OntologySystem
+from pdb.triplet_extraction.extractor import TripletExtractor
+from llm.response_cache import get_response_cache
 from models.output_schemas import AnalysisResult
 
 
+class StageCache:
+    """
+    Memo thread-safe degli stadi di ingestione di una campagna di simulazioni.
+
+    Ogni stadio è identificato da una chiave che include l'identità dei suoi input;
+    viene calcolato una sola volta anche quando più celle lo richiedono in parallelo
+    (le richieste concorrenti attendono il primo calcolo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[Tuple, Future] = {}
+        self.computed = 0
+        self.reused = 0
+
+    def get(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        """
+        Restituisce l'output dello stadio, calcolandolo se necessario
+
+        Args:
+            key: Chiave dello stadio (nome e identità degli input)
+            compute: Funzione che calcola l'output dello stadio
+
+        Returns:
+            Output dello stadio
+        """
+        with self._lock:
+            future = self._stages.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._stages[key] = future
+                self.computed += 1
+            else:
+                self.reused += 1
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                # Uno stadio fallito non resta in cache: una cella successiva lo ritenta
+                with self._lock:
+                    self._stages.pop(key, None)
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"computed": self.computed, "reused": self.reused}
+
+
 class Simulation:
     """
     Gestisce le simulazioni per valutare l'impatto di informazioni contestuali diverse
@@ -31,10 +86,33 @@ class Simulation:
         self.data_dir = data_dir
         self.output_dir = output_dir
 
+        # Esecuzione parallela delle celle scenario x contesto: "thread" o "process".
+        # Il limite di richieste concorrenti per provider è llm.<provider>.max_concurrency
+        # (per processo, con l'esecutore "process")
+        self.max_workers = self.config.get_value("simulation.max_workers", 4)
+        self.executor_type = self.config.get_value("simulation.executor", "thread")
+        # "views": un solo grafo per scenario, le combinazioni sono viste filtrate per fonte;
+        # "rebuild": un grafo distinto per ogni combinazione
+        self.ablation_mode = self.config.get_value("simulation.ablation", "views")
+        # "single": una chiamata LLM sui metadati del grafo; "interactive": il LLM
+        # interroga il grafo per più iterazioni (PersonalDigitalBrain.interactive_analysis)
+        self.analysis_mode = self.config.get_value("simulation.analysis_mode", "single")
+
+        # Stadi di ingestione condivisi tra le combinazioni di contesto
+        self.triplet_extractor = TripletExtractor()
+        self.ontology_system = OntologySystem()
+        self.stages = StageCache()
+
         # Crea directory output se non esiste
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def run_simulation(self, scenario_name: str, context_types: List[str]):
+    def run_simulation(
+        self,
+        scenario_name: str,
+        context_types: List[str],
+        graph_contexts: Optional[List[str]] = None,
+        analysis_mode: Optional[str] = None,
+    ):
         """
         Esegue una simulazione con un determinato scenario e tipi di contesto
 
@@ -42,88 +120,298 @@ class Simulation:
             scenario_name: Nome dello scenario da simulare
             context_types: Lista di tipi di contesto da includere
                           ('voice', 'profile', 'sensors', 'apps')
+            graph_contexts: Se indicato, il grafo dello scenario viene ingerito una sola
+                            volta con questi contesti e condiviso tra le chiamate;
+                            l'analisi usa una vista limitata alle fonti di context_types
+            analysis_mode: "single" o "interactive" (default: simulation.analysis_mode)
         """
+        analysis_mode = analysis_mode or self.analysis_mode
+        if analysis_mode not in ("single", "interactive"):
+            raise ValueError(f"Modalità di analisi non supportata: {analysis_mode}")
+
         print(
             f"Esecuzione simulazione '{scenario_name}' con contesti: {', '.join(context_types)}"
         )
 
-        # Crea un'istanza pulita di PersonalDigitalBrain per questa simulazione
+        if graph_contexts is None:
+            brain = self._build_brain(scenario_name, context_types)
+            sources = None
+        else:
+            key = (
+                "scenario_graph",
+                scenario_name,
+                tuple(sorted(graph_contexts)),
+                self.ontology_system.sensor_mode,
+                _input_identity(self.data_dir),
+            )
+            brain = self.stages.get(
+                key, lambda: self._build_brain(scenario_name, graph_contexts)
+            )
+            sources = context_sources(context_types)
+
+        # Identifica trigger di intervento
+        print(f"Analisi del knowledge graph per scenario '{scenario_name}'...")
+        iterations = None
+        if analysis_mode == "interactive":
+            session = brain.interactive_analysis(sources=sources)
+            result = session.result
+            iterations = session.timings()
+            print(
+                f"Analisi interattiva: {len(iterations)} iterazioni "
+                f"in {session.total_seconds:.2f}s"
+            )
+        else:
+            result = brain.identify_intervention_triggers(sources=sources)
+
+        # Salva risultati
+        self._save_results(scenario_name, context_types, result, iterations)
+
+        return result
+
+    def _build_brain(
+        self, scenario_name: str, context_types: List[str]
+    ) -> PersonalDigitalBrain:
+        """
+        Crea un'istanza pulita di PersonalDigitalBrain assemblata dagli output
+        degli stadi di ingestione condivisi
+
+        Args:
+            scenario_name: Nome dello scenario
+            context_types: Tipi di contesto da ingerire
+
+        Returns:
+            Brain con i dati dei contesti richiesti
+        """
         brain = PersonalDigitalBrain()
 
         # Carica dati in base ai tipi di contesto richiesti
         if "voice" in context_types:
-            voice_data = self.data_manager.load_voice_data(
-                os.path.join(self.data_dir, "voice", f"{scenario_name}.json")
+            voice_path = os.path.join(self.data_dir, "voice", f"{scenario_name}.json")
+            profile_path = (
+                os.path.join(self.data_dir, "profiles")
+                if "profile" in context_types
+                else None
             )
-            profile_data = {}
-            if "profile" in context_types:
-                profile_data = self.data_manager.load_profile_data(
-                    os.path.join(self.data_dir, "profiles")
-                )
-            brain.process_unstructured_data(voice_data, profile_data)
+            brain.add_triplets(self._voice_triplets(voice_path), "voice")
+            brain.record_context(profile_data=self._profile_data(profile_path))
+            brain.add_triplets(self._profile_triplets(profile_path), "profile")
 
-        sensor_data = {}
-        app_data = {}
         if "sensors" in context_types:
-            sensor_data = self.data_manager.load_sensor_data(
-                os.path.join(self.data_dir, "sensors")
-            )
+            sensors_path = os.path.join(self.data_dir, "sensors")
+            brain.record_context(sensor_data=self._sensor_data(sensors_path))
+            if self.ontology_system.sensor_mode == "series":
+                brain.add_sensor_series(self._sensor_graph(sensors_path))
+            else:
+                brain.add_triplets(self._sensor_graph(sensors_path), "sensor")
+
         if "apps" in context_types:
-            app_data = self.data_manager.load_app_data(
-                os.path.join(self.data_dir, "apps")
-            )
+            apps_path = os.path.join(self.data_dir, "apps")
+            brain.record_context(app_data=self._app_data(apps_path))
+            brain.add_triplets(self._app_triplets(apps_path), "app")
+
+        return brain
+
+    def _voice_triplets(self, path: str) -> List[Dict[str, str]]:
+        """Stadio: triplet estratti dalla trascrizione vocale."""
+        key = ("voice_triplets", _input_identity(path))
+        return self.stages.get(
+            key,
+            lambda: self.triplet_extractor.extract_from_text(
+                self.stages.get(
+                    ("voice_data", _input_identity(path)),
+                    lambda: self.data_manager.load_voice_data(path),
+                )
+            ),
+        )
 
-        if sensor_data or app_data:
-            brain.process_structured_data(sensor_data, app_data)
+    def _profile_data(self, path: Optional[str]) -> Dict[str, Any]:
+        """Stadio: profilo utente (vuoto se il contesto profilo non è incluso)."""
+        if path is None:
+            return {}
+        return self.stages.get(
+            ("profile_data", _input_identity(path)),
+            lambda: self.data_manager.load_profile_data(path),
+        )
 
-        # Identifica trigger di intervento
-        print(f"Analisi del knowledge graph per scenario '{scenario_name}'...")
-        result = brain.identify_intervention_triggers()
+    def _profile_triplets(self, path: Optional[str]) -> List[Dict[str, str]]:
+        """Stadio: triplet estratti dal profilo utente."""
+        key = ("profile_triplets", _input_identity(path) if path else None)
+        return self.stages.get(
+            key,
+            lambda: self.triplet_extractor.extract_from_profile(self._profile_data(path)),
+        )
 
-        # Salva risultati
-        self._save_results(scenario_name, context_types, result)
+    def _sensor_data(self, path: str) -> Dict[str, Any]:
+        """Stadio: serie temporali dei sensori."""
+        return self.stages.get(
+            ("sensor_data", _input_identity(path)),
+            lambda: self.data_manager.load_sensor_data(path),
+        )
 
-        return result
+    def _sensor_graph(self, path: str) -> List[Any]:
+        """Stadio: conversione ontologica dei sensori (triplet o nodi serie)."""
+        mode = self.ontology_system.sensor_mode
+        key = (
+            "sensor_graph",
+            mode,
+            self.ontology_system.series_chunk_seconds,
+            _input_identity(path),
+        )
+
+        def convert():
+            sensor_data = self._sensor_data(path)
+            if mode == "series":
+                return list(self.ontology_system.iter_sensor_series(sensor_data))
+            return list(self.ontology_system.iter_sensor_triplets(sensor_data))
+
+        return self.stages.get(key, convert)
+
+    def _app_data(self, path: str) -> Dict[str, Any]:
+        """Stadio: dati delle applicazioni (eventi del calendario inclusi)."""
+        return self.stages.get(
+            ("app_data", _input_identity(path)),
+            lambda: self.data_manager.load_app_data(path),
+        )
+
+    def _app_triplets(self, path: str) -> List[Dict[str, str]]:
+        """Stadio: triplet dei dati delle applicazioni."""
+        key = ("app_triplets", _input_identity(path))
+        return self.stages.get(
+            key,
+            lambda: list(self.ontology_system.iter_app_triplets(self._app_data(path))),
+        )
 
     def run_batch_simulations(
-        self, scenarios: List[str], context_combinations: List[List[str]]
+        self,
+        scenarios: List[str],
+        context_combinations: List[List[str]],
+        max_workers: Optional[int] = None,
+        executor_type: Optional[str] = None,
+        ablation_mode: Optional[str] = None,
+        analysis_mode: Optional[str] = None,
     ):
         """
-        Esegue più simulazioni con diverse combinazioni di contesto
+        Esegue più simulazioni con diverse combinazioni di contesto, in parallelo.
+        I risultati aggregati seguono l'ordine di scenari e combinazioni,
+        indipendentemente dall'ordine di completamento. Gli stadi di ingestione
+        comuni a più combinazioni sono calcolati una volta sola (con l'esecutore
+        "process", una volta per processo worker).
 
         Args:
             scenarios: Lista di nomi scenari da simulare
             context_combinations: Lista di combinazioni di tipi di contesto
+            max_workers: Numero di simulazioni concorrenti (default: simulation.max_workers)
+            executor_type: "thread" o "process" (default: simulation.executor)
+            ablation_mode: "views" per servire tutte le combinazioni di uno scenario
+                           da un unico grafo filtrato per fonte, "rebuild" per
+                           costruire un grafo per combinazione (default: simulation.ablation)
+            analysis_mode: "single" o "interactive" (default: simulation.analysis_mode)
         """
-        results = {}
-
-        for scenario in scenarios:
-            scenario_results = {}
+        max_workers = max(1, int(max_workers or self.max_workers))
+        executor_type = executor_type or self.executor_type
+        if executor_type not in ("thread", "process"):
+            raise ValueError(f"Tipo di esecutore non supportato: {executor_type}")
+        ablation_mode = ablation_mode or self.ablation_mode
+        if ablation_mode not in ("views", "rebuild"):
+            raise ValueError(f"Modalità di ablazione non supportata: {ablation_mode}")
+        analysis_mode = analysis_mode or self.analysis_mode
+
+        # Con le viste, il grafo di ogni scenario contiene l'unione dei contesti richiesti
+        graph_contexts = None
+        if ablation_mode == "views":
+            graph_contexts = []
             for contexts in context_combinations:
-                # Reimposta la cache del modello tra le simulazioni
-                reset_model_cache()
+                for context in contexts:
+                    if context not in graph_contexts:
+                        graph_contexts.append(context)
+
+        cells = [
+            (scenario, list(contexts))
+            for scenario in scenarios
+            for contexts in context_combinations
+        ]
 
+        if executor_type == "process":
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        with executor:
+            if executor_type == "process":
+                futures = [
+                    executor.submit(
+                        _run_simulation_cell,
+                        self.data_dir,
+                        self.output_dir,
+                        scenario,
+                        contexts,
+                        graph_contexts,
+                        analysis_mode,
+                    )
+                    for scenario, contexts in cells
+                ]
+            else:
+                futures = [
+                    executor.submit(
+                        self._run_cell, scenario, contexts, graph_contexts, analysis_mode
+                    )
+                    for scenario, contexts in cells
+                ]
+
+            # Raccolta nell'ordine di sottomissione: l'output aggregato è deterministico
+            results = {}
+            for (scenario, contexts), future in zip(cells, futures):
                 # Nome della combinazione di contesto
                 context_key = "+".join(contexts) if contexts else "baseline"
+                try:
+                    cell_result = future.result()
+                except Exception as e:
+                    # Una cella fallita non interrompe il resto della campagna
+                    print(f"Simulazione '{scenario}' ({context_key}) fallita: {e}")
+                    cell_result = {"error": str(e)}
+                results.setdefault(scenario, {})[context_key] = cell_result
 
-                # Esegui simulazione
-                result = self.run_simulation(scenario, contexts)
+        # Salva risultati aggregati
+        self._save_aggregated_results(results)
 
-                # Salva risultato
-                scenario_results[context_key] = {
-                    "identified_triggers": [
-                        t.dict() for t in result.identified_triggers
-                    ],
-                    "trigger_count": len(result.identified_triggers),
-                }
+        print(f"Stadi di ingestione: {self.stages.stats()}")
+        cache = get_response_cache()
+        if cache is not None:
+            print(f"Cache risposte LLM: {cache.stats()}")
+
+    def _run_cell(
+        self,
+        scenario_name: str,
+        context_types: List[str],
+        graph_contexts: Optional[List[str]] = None,
+        analysis_mode: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Esegue una cella della campagna e ne restituisce il riepilogo
 
-            results[scenario] = scenario_results
+        Args:
+            scenario_name: Nome dello scenario
+            context_types: Tipi di contesto inclusi
+            graph_contexts: Contesti del grafo condiviso dello scenario (modalità "views")
+            analysis_mode: "single" o "interactive"
 
-        # Salva risultati aggregati
-        self._save_aggregated_results(results)
+        Returns:
+            Trigger identificati e loro numero
+        """
+        result = self.run_simulation(
+            scenario_name, context_types, graph_contexts, analysis_mode
+        )
+        return {
+            "identified_triggers": [t.dict() for t in result.identified_triggers],
+            "trigger_count": len(result.identified_triggers),
+        }
 
     def _save_results(
-        self, scenario_name: str, context_types: List[str], result: AnalysisResult
+        self,
+        scenario_name: str,
+        context_types: List[str],
+        result: AnalysisResult,
+        iterations: Optional[List[Dict[str, Any]]] = None,
     ):
         """
         Salva i risultati di una simulazione
@@ -132,6 +420,7 @@ class Simulation:
             scenario_name: Nome dello scenario
             context_types: Tipi di contesto inclusi
             result: Risultato dell'analisi
+            iterations: Tempi per iterazione dell'analisi interattiva, se usata
         """
         # Crea nome file risultati
         context_str = "_".join(context_types) if context_types else "baseline"
@@ -147,6 +436,7 @@ class Simulation:
                     "context_types": context_types,
                     "timestamp": datetime.now().isoformat(),
                     "result": result.dict(),
+                    **({"iterations": iterations} if iterations is not None else {}),
                 },
                 f,
                 indent=2,
@@ -174,64 +464,98 @@ class Simulation:
 
         print(f"Risultati aggregati salvati in {result_file}")
 
-    def _interactive_analysis(self, brain, scenario_name):
-        """
-        Esegue un'analisi interattiva permettendo al LLM di interrogare il knowledge graph
 
-        Args:
-            brain: Istanza di PersonalDigitalBrain
-            scenario_name: Nome dello scenario
+# Fonte del knowledge graph corrispondente a ogni tipo di contesto della simulazione
+CONTEXT_SOURCES = {"voice": "voice", "profile": "profile", "sensors": "sensor", "apps": "app"}
 
-        Returns:
-            Risultato dell'analisi
-        """
-        # Crea prompt iniziale
-        prompt = brain._create_analysis_prompt()
-
-        # Ottieni LLM
-        llm = get_llm_with_structured_output(AnalysisResult)
-
-        # Inizializza la conversazione
-        conversation = [{"role": "system", "content": prompt}]
-
-        # Simula alcune iterazioni di dialogo
-        max_iterations = 5
-        for i in range(max_iterations):
-            # Ottieni risposta dal LLM
-            response = llm.invoke(conversation)
-
-            # Analizza la risposta per estrarre query
-            query_match = re.search(r"QUERY:\s*(SELECT.+)", response.reasoning)
-
-            if query_match:
-                query = query_match.group(1)
-                # Esegui la query
-                results = brain.query_knowledge_graph(query)
-
-                # Aggiungi risultati alla conversazione
-                result_text = "\n".join(
-                    [
-                        f"- Soggetto: {t['subject']}, Predicato: {t['predicate']}, Oggetto: {t['object']}"
-                        for t in results
-                    ]
-                )
 
-                conversation.append(
-                    {"role": "assistant", "content": response.reasoning}
-                )
-                conversation.append(
-                    {
-                        "role": "user",
-                        "content": f"Risultati della query:\n{result_text}\n\nPuoi continuare l'analisi con altre query o fornire le tue conclusioni.",
-                    }
-                )
-            else:
-                # LLM ha completato l'analisi
-                break
+def context_sources(context_types: List[str]) -> List[str]:
+    """
+    Converte i tipi di contesto di una simulazione nelle fonti del knowledge graph.
+    Come in run_simulation, il profilo è incluso solo insieme alla voce.
+
+    Args:
+        context_types: Tipi di contesto ('voice', 'profile', 'sensors', 'apps')
+
+    Returns:
+        Fonti corrispondenti
+    """
+    return [
+        CONTEXT_SOURCES[context]
+        for context in context_types
+        if context in CONTEXT_SOURCES
+        and (context != "profile" or "voice" in context_types)
+    ]
+
+
+def _input_identity(path: str) -> Tuple:
+    """
+    Identità degli input di uno stadio: percorso, dimensione e data di modifica
+    di ogni file, così che dati modificati producano una nuova chiave
+
+    Args:
+        path: File o directory di input
+
+    Returns:
+        Tupla confrontabile che identifica il contenuto corrente del percorso
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    else:
+        files = [path]
+
+    identity = []
+    for file_path in files:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            identity.append((file_path, None, None))
+        else:
+            identity.append((file_path, stat.st_size, stat.st_mtime_ns))
+    return (os.path.abspath(path), tuple(identity))
+
+
+# Simulazione di ogni processo worker, così che gli stadi siano condivisi tra le sue celle
+_worker_simulation: Optional[Simulation] = None
+
+
+def _run_simulation_cell(
+    data_dir: str,
+    output_dir: str,
+    scenario_name: str,
+    context_types: List[str],
+    graph_contexts: Optional[List[str]] = None,
+    analysis_mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Esegue una cella della campagna in un processo worker
+
+    Args:
+        data_dir: Directory contenente i dati di simulazione
+        output_dir: Directory dove salvare i risultati
+        scenario_name: Nome dello scenario
+        context_types: Tipi di contesto inclusi
+        graph_contexts: Contesti del grafo condiviso dello scenario (modalità "views")
+        analysis_mode: "single" o "interactive"
+
+    Returns:
+        Trigger identificati e loro numero
+    """
+    global _worker_simulation
 
-        # Ottieni il risultato finale
-        final_result = llm.invoke(conversation)
-        return final_result
+    if (
+        _worker_simulation is None
+        or _worker_simulation.data_dir != data_dir
+        or _worker_simulation.output_dir != output_dir
+    ):
+        _worker_simulation = Simulation(data_dir, output_dir)
+    return _worker_simulation._run_cell(
+        scenario_name, context_types, graph_contexts, analysis_mode
+    )
 
 
 def main():
@@ -259,7 +583,28 @@ def main():
         action="store_true",
         help="Esegui simulazioni batch con diverse combinazioni",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Simulazioni batch eseguite in parallelo (default: simulation.max_workers)",
+    )
+    parser.add_argument(
+        "--ablation",
+        choices=["views", "rebuild"],
+        help="Come servire le combinazioni di contesto (default: simulation.ablation)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        help="Pool usato per le simulazioni batch (default: simulation.executor)",
+    )
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Analisi interattiva: il LLM interroga il knowledge graph per più iterazioni",
+    )
     args = parser.parse_args()
+    analysis_mode = "interactive" if args.interactive else None
 
     simulation = Simulation(args.data_dir, args.output_dir)
 
@@ -277,11 +622,18 @@ def main():
             ["voice", "profile", "sensors", "apps"],  # Tutti i contesti
         ]
 
-        simulation.run_batch_simulations(scenarios, context_combinations)
+        simulation.run_batch_simulations(
+            scenarios,
+            context_combinations,
+            args.workers,
+            args.executor,
+            args.ablation,
+            analysis_mode,
+        )
     else:
         # Esegui singola simulazione
         scenario = args.scenario or "episode1_conversation"
-        simulation.run_simulation(scenario, args.contexts)
+        simulation.run_simulation(scenario, args.contexts, analysis_mode=analysis_mode)
 
 
 if __name__ == "__main__":
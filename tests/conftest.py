@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# I moduli del progetto si importano da src/, come quando main.py viene eseguito da lì
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    # Il package pdb del progetto ha lo stesso nome del debugger della libreria standard,
+    # che pytest importa durante la configurazione: una volta configurato il plugin di
+    # debug, il modulo standard viene rimosso perché i test importino il package
+    sys.path.insert(0, SRC_DIR)
+    sys.modules.pop("pdb", None)
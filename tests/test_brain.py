@@ -0,0 +1,140 @@
+import tempfile
+import unittest
+
+from data_layer.streaming import sensor_records_to_series
+from llm.provider import reset_model_cache, set_model
+from llm.response_cache import LLMResponseCache, set_response_cache
+from llm.standin import StandInChatModel
+from pdb.brain import PersonalDigitalBrain
+
+
+class AnalysisPromptTest(unittest.TestCase):
+    def setUp(self):
+        self.brain = PersonalDigitalBrain()
+        self.brain.ontology_system.sensor_mode = "series"
+        readings = [
+            {"device": "watch", "reading_type": "heart_rate",
+             "timestamp": f"2024-01-01T08:{minute:02d}:00Z", "value": 70 + minute}
+            for minute in range(30)
+        ]
+        self.brain.process_structured_data(sensor_records_to_series(readings), {})
+
+    def test_entity_types_do_not_materialize_pending_series(self):
+        graph = self.brain.knowledge_graph
+        rows = len(graph)
+        self.assertEqual(graph.pending_series_count(), 1)
+
+        prompt = self.brain._create_analysis_prompt()
+
+        self.assertEqual(len(graph), rows)
+        self.assertEqual(graph.pending_series_count(), 1)
+        self.assertIn("sosa:Observation", prompt)
+        self.assertIn("sosa:ObservationCollection", prompt)
+
+    def test_source_view_hides_pending_series_of_other_sources(self):
+        prompt = self.brain._create_analysis_prompt(sources=["voice"])
+        self.assertNotIn("sosa:Observation", prompt)
+
+
+class SaveStateTest(unittest.TestCase):
+    QUERY = """
+        SELECT ?obs ?value WHERE {
+            ?obs sosa:observedProperty property:heart_rate .
+            ?obs sosa:hasSimpleResult ?value .
+        }
+    """
+
+    def test_pending_series_survive_a_round_trip_unmaterialized(self):
+        brain = PersonalDigitalBrain()
+        brain.ontology_system.sensor_mode = "series"
+        readings = [
+            {"device": "watch", "reading_type": "heart_rate",
+             "timestamp": f"2024-01-01T{hour:02d}:00:00Z", "value": 60 + hour}
+            for hour in range(24)
+        ]
+        brain.process_structured_data(sensor_records_to_series(readings), {})
+        rows = len(brain.knowledge_graph)
+        pending = brain.knowledge_graph.pending_series_count()
+
+        with tempfile.TemporaryDirectory() as directory:
+            brain.save_state(directory)
+            self.assertEqual(len(brain.knowledge_graph), rows)
+
+            restored = PersonalDigitalBrain()
+            self.assertTrue(restored.load_state(directory))
+
+        self.assertEqual(len(restored.knowledge_graph), rows)
+        self.assertEqual(restored.knowledge_graph.pending_series_count(), pending)
+        expected = brain.query_knowledge_graph(self.QUERY)
+        self.assertEqual(len(expected), 24)
+        self.assertCountEqual(restored.query_knowledge_graph(self.QUERY), expected)
+
+
+class ChangedDataTest(unittest.TestCase):
+    def setUp(self):
+        self.brain = PersonalDigitalBrain()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        set_response_cache(LLMResponseCache(cache_dir=self.cache_dir.name))
+
+    def tearDown(self):
+        reset_model_cache()
+        set_response_cache(None)
+        self.cache_dir.cleanup()
+
+    def test_edited_app_entry_replaces_the_previous_value(self):
+        self.brain.process_structured_data(
+            {}, {"calendar": {"e1": {"title": "Visita", "start_time": "09:00"}}}
+        )
+        # Con l'ingestione incrementale arrivano solo i campi modificati
+        self.brain.process_structured_data({}, {"calendar": {"e1": {"start_time": "11:00"}}})
+
+        graph = self.brain.knowledge_graph
+        self.assertEqual(
+            [obj for _, _, obj in graph.match("entry:calendar_e1", "schema:start_time")],
+            ["11:00"],
+        )
+        self.assertEqual(graph.count("entry:calendar_e1", "schema:title"), 1)
+
+    def test_changed_profile_replaces_its_triplets(self):
+        def responder(schema, prompt):
+            age = "31" if "age: 31" in str(prompt) else "30"
+            return schema(triplets=[{"subject": "user", "predicate": "hasAge", "object": age}])
+
+        set_model(StandInChatModel(responder))
+        graph = self.brain.knowledge_graph
+        graph.add("user", "hasAge", "30", "voice")
+
+        self.brain.process_unstructured_data("", {"age": 30})
+        self.brain.process_unstructured_data("", {"age": 31})
+
+        self.assertEqual(graph.get_sources("user", "hasAge", "31"), ["profile"])
+        self.assertEqual(graph.get_sources("user", "hasAge", "30"), ["voice"])
+
+
+class UnstructuredDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.brain = PersonalDigitalBrain()
+        self.brain.triplet_extractor.chunk_tokens = 8
+        self.brain.triplet_extractor.chunk_overlap = 1
+
+    def test_consecutive_utterances_share_overlapping_documents(self):
+        utterances = ["oggi sono stanco", "ho dormito poco", "domani corro", ""]
+
+        documents = self.brain._unstructured_documents(utterances, None)
+
+        self.assertEqual(documents, {
+            "voice:0": "oggi sono stanco\nho dormito poco",
+            "voice:1": "ho dormito poco\ndomani corro",
+        })
+
+    def test_short_transcript_is_a_single_document(self):
+        self.brain.triplet_extractor.chunk_tokens = 1500
+
+        documents = self.brain._unstructured_documents(["ciao", "come va"], {"name": "Ada"})
+
+        self.assertEqual(list(documents), ["voice:0", "profile"])
+        self.assertEqual(documents["voice:0"], "ciao\ncome va")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from pdb.knowledge_graph.query_engine import QueryEngine
+from pdb.knowledge_graph.triple_store import TripleStore
+
+
+class NumericFilterTest(unittest.TestCase):
+    QUERY = "SELECT ?o WHERE { ?o sosa:hasSimpleResult ?v . FILTER(?v = 72) }"
+
+    def test_numeric_equality_does_not_depend_on_unrelated_literals(self):
+        store = TripleStore()
+        store.add_triplets(
+            [{"subject": "obs:1", "predicate": "sosa:hasSimpleResult", "object": "72.0"}], "sensor"
+        )
+        engine = QueryEngine(store)
+        self.assertEqual(engine.execute(self.QUERY), [{"o": "obs:1"}])
+
+        store.add_triplets(
+            [{"subject": "summary:1", "predicate": "hdt:sampleCount", "object": "72"}], "app"
+        )
+        self.assertEqual(engine.execute(self.QUERY), [{"o": "obs:1"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import http.client
+import json
+import os
+import tempfile
+import unittest
+
+from llm.provider import reset_model_cache, set_model
+from llm.response_cache import LLMResponseCache, set_response_cache
+from llm.standin import StandInChatModel
+from models.output_schemas import AnalysisResult, InterventionTrigger
+from service import TwinService
+
+
+def _responder(output_class, prompt):
+    """Un trigger per ogni analisi; le altre richieste ricevono la risposta vuota."""
+    if output_class is AnalysisResult:
+        return AnalysisResult(
+            extracted_triples=[],
+            identified_triggers=[
+                InterventionTrigger(
+                    trigger_type="tachicardia",
+                    confidence=0.9,
+                    description="Frequenza cardiaca elevata a riposo",
+                    supporting_evidence={"heart_rate": 140},
+                )
+            ],
+            reasoning="Picco di frequenza cardiaca alle 08:20",
+        )
+    return None
+
+
+def _request(port, path, body=None, content_type="application/json"):
+    """Richiesta HTTP al servizio; restituisce stato e corpo (già ricomposto se a blocchi)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        headers = {"Content-Type": content_type, "Connection": "close"}
+        connection.request("POST" if body is not None else "GET", path, body, headers)
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read().decode("utf-8")
+    finally:
+        connection.close()
+
+
+def _events(body):
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+class TwinServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        set_response_cache(LLMResponseCache(cache_dir=self.cache_dir.name))
+        self.model = StandInChatModel(responder=_responder)
+        set_model(self.model)
+
+        self.service = TwinService(host="127.0.0.1", port=0)
+        _, self.port = await self.service.start()
+
+    async def asyncTearDown(self):
+        await self.service.stop()
+        reset_model_cache()
+        set_response_cache(None)
+        self.cache_dir.cleanup()
+
+    async def call(self, path, body=None, content_type="application/json"):
+        return await asyncio.to_thread(_request, self.port, path, body, content_type)
+
+    async def test_readings_query_and_streamed_analysis(self):
+        readings = "\n".join(
+            json.dumps(
+                {
+                    "device": "watch",
+                    "reading_type": "heart_rate",
+                    "timestamp": f"2024-01-01T08:{minute:02d}:00Z",
+                    "value": 140 if minute == 20 else 70,
+                }
+            )
+            for minute in range(30)
+        )
+        status, _, body = await self.call("/users/alice/readings", readings, "application/x-ndjson")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["readings"], 30)
+
+        status, content_type, body = await self.call(
+            "/users/alice/query", {"query": "SELECT ?s WHERE { ?s rdf:type sosa:Sensor }"}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(content_type, "application/x-ndjson")
+        events = _events(body)
+        self.assertEqual(events[:-1], [{"s": "device:watch"}])
+        self.assertEqual(events[-1], {"event": "end", "count": 1})
+
+        status, content_type, body = await self.call("/users/alice/analyze", {})
+        self.assertEqual(status, 200)
+        self.assertEqual(content_type, "application/x-ndjson")
+        events = _events(body)
+        self.assertEqual([event["event"] for event in events], ["started", "trigger", "result"])
+        self.assertEqual(events[1]["trigger_type"], "tachicardia")
+        self.assertEqual(events[2]["triggers"], 1)
+        self.assertEqual(self.model.calls, 1)
+
+        # La risposta dell'analisi è salvata nella cache temporanea, non nel repository
+        cached = [name for _, _, names in os.walk(self.cache_dir.name) for name in names]
+        self.assertEqual(len(cached), 1)
+
+        # Una seconda analisi identica è servita dalla cache
+        status, _, body = await self.call("/users/alice/analyze", {})
+        self.assertEqual(_events(body)[2]["triggers"], 1)
+        self.assertEqual(self.model.calls, 1)
+
+    async def test_unknown_route_returns_404(self):
+        status, _, body = await self.call("/users/alice/unknown", {})
+        self.assertEqual(status, 404)
+        self.assertIn("error", json.loads(body))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from data_layer.streaming import sensor_records_to_series
+from llm.provider import reset_model_cache, set_model
+from llm.standin import StandInChatModel
+from pdb.brain import PersonalDigitalBrain
+from runtime.shard_worker import ShardWorker
+
+
+class ShardWorkerAnalyzeTest(unittest.TestCase):
+    def setUp(self):
+        self.model = StandInChatModel()
+        set_model(self.model)
+        self.worker = ShardWorker("shard-test", workers=1)
+
+    def tearDown(self):
+        self.worker.close()
+        reset_model_cache()
+
+    def _analyze(self, mode: str):
+        payload = {"mode": mode, "use_cache": False, "sources": None}
+        return self.worker.submit("tenant", "analyze", payload).result(timeout=30)
+
+    def test_interactive_analysis_runs_the_session_once(self):
+        PersonalDigitalBrain().interactive_analysis(use_cache=False)
+        direct_calls = self.model.calls
+        self.assertGreater(direct_calls, 0)
+
+        self.model.calls = 0
+        result = self._analyze("interactive")
+
+        self.assertIsNotNone(result)
+        self.assertEqual(self.model.calls, direct_calls)
+
+    def test_interactive_analysis_skips_llm_when_prescreen_is_negative(self):
+        readings = [
+            {"device": "watch", "reading_type": "heart_rate",
+             "timestamp": f"2024-01-01T08:{minute:02d}:00Z", "value": 70}
+            for minute in range(30)
+        ]
+        payload = {"sensor_data": sensor_records_to_series(readings)}
+        self.worker.submit("tenant", "ingest", payload).result(timeout=30)
+
+        result = self._analyze("interactive")
+
+        self.assertEqual(result.identified_triggers, [])
+        self.assertEqual(self.model.calls, 0)
+
+    def test_single_analysis_calls_the_llm_once(self):
+        self._analyze("single")
+        self.assertEqual(self.model.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+import unittest
+
+import numpy as np
+
+from data_layer.structured.time_series import format_timestamps
+
+
+class FormatTimestampsTest(unittest.TestCase):
+    def test_format_does_not_depend_on_other_timestamps(self):
+        alone = format_timestamps(np.array([60_000], dtype=np.int64))
+        mixed = format_timestamps(np.array([60_000, 60_250], dtype=np.int64))
+
+        self.assertEqual(alone, ["1970-01-01T00:01:00Z"])
+        self.assertEqual(mixed, ["1970-01-01T00:01:00Z", "1970-01-01T00:01:00.250Z"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from pdb.knowledge_graph.triple_store import TripleStore
+
+
+class RemoveTest(unittest.TestCase):
+    def setUp(self):
+        self.store = TripleStore()
+        self.store.add("entry:a", "schema:start_time", "09:00", "app")
+        self.store.add("entry:a", "schema:name", "Riunione", "app")
+        self.store.add("entry:a", "schema:name", "Riunione", "voice")
+        self.store.add("entry:b", "schema:start_time", "10:00", "app")
+
+    def assert_indexes_consistent(self):
+        store = self.store
+        for row in range(len(store)):
+            s, p, o = store.row_ids(row)
+            self.assertIn(row, store.match_ids(s, None, None))
+            self.assertIn(row, store.match_ids(None, p, o))
+            self.assertIn(row, store.match_ids(None, None, o))
+            self.assertEqual(store._find_row(s, p, o), row)
+        self.assertEqual(sum(store._subject_counts.values()), len(store))
+        self.assertEqual(sum(store._predicate_counts.values()), len(store))
+        self.assertEqual(sum(store._object_counts.values()), len(store))
+
+    def test_remove_deletes_the_row_and_moves_the_last_one(self):
+        version = self.store.version
+
+        self.assertTrue(self.store.remove("entry:a", "schema:start_time", "09:00", "app"))
+
+        self.assertGreater(self.store.version, version)
+        self.assertEqual(len(self.store), 2)
+        self.assertNotIn(("entry:a", "schema:start_time", "09:00"), self.store)
+        self.assertEqual(
+            list(self.store.match(predicate="schema:start_time")),
+            [("entry:b", "schema:start_time", "10:00")],
+        )
+        self.assertEqual(self.store.count(obj="09:00"), 0)
+        self.assert_indexes_consistent()
+
+    def test_remove_keeps_triplets_with_other_sources(self):
+        self.assertTrue(self.store.remove("entry:a", "schema:name", "Riunione", "app"))
+
+        self.assertEqual(self.store.get_sources("entry:a", "schema:name", "Riunione"), ["voice"])
+        self.assertFalse(self.store.remove("entry:a", "schema:name", "Riunione", "app"))
+        self.assert_indexes_consistent()
+
+    def test_remove_source_keeps_the_given_triplets(self):
+        keep = [{"subject": "entry:b", "predicate": "schema:start_time", "object": "10:00"}]
+
+        self.assertEqual(self.store.remove_source("app", keep=keep), 2)
+
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.count(predicate="schema:start_time"), 1)
+        self.assertEqual(self.store.get_sources("entry:a", "schema:name", "Riunione"), ["voice"])
+        self.assertEqual(self.store.predicates(), ["schema:start_time", "schema:name"])
+        self.assert_indexes_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
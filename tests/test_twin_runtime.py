@@ -0,0 +1,22 @@
+import unittest
+
+from runtime.twin_runtime import TwinRuntime
+
+
+class TwinRuntimeConcurrencyTest(unittest.TestCase):
+    def test_llm_concurrency_is_split_exactly_across_shards(self):
+        runtime = TwinRuntime(shards=3)
+
+        self.assertEqual(sum(runtime.shard_workers.values()), runtime.llm_concurrency)
+        self.assertLessEqual(
+            max(runtime.shard_workers.values()) - min(runtime.shard_workers.values()), 1
+        )
+
+    def test_more_shards_than_llm_concurrency_is_rejected(self):
+        runtime = TwinRuntime(shards=1)
+        with self.assertRaises(ValueError):
+            TwinRuntime(shards=runtime.llm_concurrency + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()